@@ -0,0 +1,102 @@
+from typing import Callable, Dict, List
+import argparse
+import asyncio
+import copy
+import random
+import time
+import tracemalloc
+from ..controllers.game_controller import GameController
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_log import GameEvent, GameEventType
+from ..models.game_state import GameState
+from ..simulation.headless import DEFAULT_PLAYER_NAMES
+from .prompt_tokens import SPEECHES
+
+async def game_with_history(events: int, seed: int = 0) -> GameController:
+    """第一晚结束后的对局，日志里再补上 events 条发言，模拟进行了很久的长局"""
+    rng = random.Random(seed)
+    game = GameController(api_controller=RuleBasedAgent("heuristic", rng), discussion_delay=0, headless=True, rng=rng)
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    await game.next_phase()
+    players = game.game_state.players
+    for i in range(events):
+        player = players[i % len(players)]
+        game.game_log.add_event(GameEvent(GameEventType.PLAYER_SPEAK, {
+            "player_id": player.id, "player_name": player.name, "message": SPEECHES[i % len(SPEECHES)]}))
+    return game
+
+def fork_and_write(state: GameState) -> GameState:
+    """分支后立即写入一条事件（每个分支推进时都会先写事件），计入第一次写入的开销"""
+    branch = state.fork()
+    player = branch.players[0]
+    branch.game_log.add_event(GameEvent(GameEventType.PLAYER_SPEAK, {
+        "player_id": player.id, "player_name": player.name, "message": SPEECHES[0]}))
+    return branch
+
+def deepcopy_branch(state: GameState) -> GameState:
+    """不共用任何结构的分支：连同日志整个深拷贝"""
+    return copy.deepcopy(state)
+
+def time_per_call(make: Callable[[], object], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        make()
+    return (time.perf_counter() - start) / repeat
+
+def bytes_per_branch(make: Callable[[], object], count: int) -> float:
+    """创建 count 个分支并全部保留，平均每个分支新分配的内存"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    branches = [make() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del branches
+    return (after - before) / count
+
+async def bytes_after_one_phase(game: GameController, count: int) -> float:
+    """分支各自推进一个阶段（开始写入自己的日志和状态）后，平均每个分支的内存"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    branches = [game.fork(rng=random.Random(i)) for i in range(count)]
+    for branch in branches:
+        await branch.next_phase()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del branches
+    return (after - before) / count
+
+async def measure(history_sizes: List[int], repeat: int = 200, branches: int = 100) -> List[Dict]:
+    rows = []
+    for events in history_sizes:
+        game = await game_with_history(events)
+        state = game.game_state
+        deep_repeat = max(1, repeat // 20)
+        rows.append({
+            "events": len(game.game_log),
+            "fork_us": time_per_call(state.fork, repeat) * 1e6,
+            "write_us": time_per_call(lambda: fork_and_write(state), repeat) * 1e6,
+            "deepcopy_us": time_per_call(lambda: deepcopy_branch(state), deep_repeat) * 1e6,
+            "fork_bytes": bytes_per_branch(state.fork, branches),
+            "write_bytes": bytes_per_branch(lambda: fork_and_write(state), branches),
+            "deepcopy_bytes": bytes_per_branch(lambda: deepcopy_branch(state), max(1, branches // 20)),
+            "diverged_bytes": await bytes_after_one_phase(game, branches),
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="GameState 分支开销：写时复制 fork() vs 深拷贝")
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 1000, 10000], help="补充的历史事件数")
+    parser.add_argument("--repeat", type=int, default=200, help="每种方式计时的次数")
+    parser.add_argument("--branches", type=int, default=100, help="测量内存时保留的分支数")
+    args = parser.parse_args()
+
+    rows = asyncio.run(measure(args.history, args.repeat, args.branches))
+    print(f"{'事件数':>8} {'fork(µs)':>10} {'fork+写入(µs)':>14} {'深拷贝(µs)':>12} {'fork内存':>10} "
+          f"{'fork+写入内存':>14} {'深拷贝内存':>12} {'推进一阶段后':>14}")
+    for row in rows:
+        print(f"{row['events']:>8} {row['fork_us']:>10.1f} {row['write_us']:>14.1f} {row['deepcopy_us']:>12.0f} "
+              f"{row['fork_bytes'] / 1024:>8.1f}KB {row['write_bytes'] / 1024:>12.1f}KB "
+              f"{row['deepcopy_bytes'] / 1024:>10.1f}KB {row['diverged_bytes'] / 1024:>12.1f}KB")
+
+if __name__ == "__main__":
+    main()
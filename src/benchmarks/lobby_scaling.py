@@ -0,0 +1,87 @@
+from typing import Dict, List
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+from ..controllers.api_controller import APIController
+from ..controllers.context_builder import estimate_tokens
+from ..controllers.game_controller import GameController
+from ..models.game_state import GamePhase, GameState
+from ..models.player import Player
+from ..models.role import RoleType, default_role_counts
+from ..tests.mock_api_controller import MockAPIController
+
+DEFAULT_SIZES = (6, 9, 12, 20, 30, 50, 100)
+PHASES = ("night", "day", "vote")
+
+def prompt_tokens(api: APIController, player: Player, game_state: GameState, prompt: str) -> int:
+    """一次请求的完整提示词（系统提示词 + 上下文 + 指令）的估算 token 数，不发出请求"""
+    context = api._build_game_context(game_state, player, prompt)
+    messages = api.templates[player.role.role_type].render(context.history, context.state, prompt)
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+def max_prompt_tokens(game_state: GameState) -> Dict[str, int]:
+    """所有存活玩家的夜晚行动和投票提示词中最大的 token 数"""
+    api = APIController(show_progress=False)
+    builders = {
+        RoleType.WEREWOLF: api._build_werewolf_prompt,
+        RoleType.SEER: api._build_seer_prompt,
+        RoleType.WITCH: api._build_witch_prompt,
+        RoleType.GUARD: api._build_guard_prompt,
+    }
+    night, vote = 0, 0
+    with contextlib.redirect_stdout(io.StringIO()):  # 女巫提示词会打印调试信息
+        for player in game_state.get_alive_players():
+            build = builders.get(player.role.role_type)
+            if build:
+                night = max(night, prompt_tokens(api, player, game_state, build(game_state, player)))
+            vote = max(vote, prompt_tokens(api, player, game_state, api._build_vote_prompt(game_state)))
+    return {"night": night, "vote": vote}
+
+async def measure(size: int, games: int, phases: int, seed: int = 0) -> Dict:
+    """用 Mock 后端跑 games 局、每局最多 phases 个阶段，返回每种阶段的平均耗时和提示词大小"""
+    timings: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    prompts: Dict[str, int] = {}
+    for i in range(games):
+        game = GameController(api_controller=MockAPIController(), discussion_delay=0, headless=True,
+                              rng=random.Random(seed + i))
+        with contextlib.redirect_stdout(io.StringIO()):  # Mock 后端会打印调试信息
+            await game.initialize_game([f"玩家{n}" for n in range(1, size + 1)])
+        if i == 0:
+            prompts = max_prompt_tokens(game.game_state)
+        for _ in range(phases):
+            if game.game_state.current_phase == GamePhase.GAME_OVER:
+                break
+            phase = game.game_state.current_phase.value
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                await game.next_phase()
+                timings[phase].append(time.perf_counter() - start)
+    return {
+        "players": size,
+        "roles": {role_type.value: count for role_type, count in default_role_counts(size).items()},
+        "phase_ms": {phase: sum(samples) / len(samples) * 1000 if samples else 0.0
+                     for phase, samples in timings.items()},
+        "prompt_tokens": prompts
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="阶段耗时和提示词大小随房间人数的变化（Mock 后端，不访问网络）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="房间人数")
+    parser.add_argument("--games", type=int, default=20, help="每种人数的对局数")
+    parser.add_argument("--phases", type=int, default=30, help="每局最多推进的阶段数")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子")
+    args = parser.parse_args()
+
+    print(f"{'人数':>6} {'夜晚ms':>9} {'白天ms':>9} {'投票ms':>9} {'每人us':>9} {'夜晚提示词':>10} {'投票提示词':>10}")
+    for size in args.sizes:
+        result = asyncio.run(measure(size, args.games, args.phases, args.seed))
+        phase_ms = result["phase_ms"]
+        per_player = sum(phase_ms.values()) / len(PHASES) / size * 1000
+        print(f"{size:>6} {phase_ms['night']:>9.3f} {phase_ms['day']:>9.3f} {phase_ms['vote']:>9.3f} "
+              f"{per_player:>9.1f} {result['prompt_tokens']['night']:>10} {result['prompt_tokens']['vote']:>10}")
+
+if __name__ == "__main__":
+    main()
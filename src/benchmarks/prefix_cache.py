@@ -0,0 +1,54 @@
+from typing import Dict, List
+import argparse
+import asyncio
+from ..controllers.context_builder import ContextBuilder
+from ..controllers.prompt_templates import ROLE_TEMPLATES, PrefixCacheTracker
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_state import GameState
+from ..models.player import Player
+from .prompt_tokens import play_probed_game
+
+INSTRUCTION = "请用以下格式返回：{\"type\": \"decision\"}"  # 决策指令在后缀里，内容不影响前缀命中
+
+def single_message_layout(template, context) -> List[Dict[str, str]]:
+    """旧的布局：当前状态、历史和指令放在同一条 user 消息里"""
+    return [{"role": "system", "content": template.system},
+            {"role": "user", "content": f"{context.text}\n{INSTRUCTION}"}]
+
+def prefix_layout(template, context) -> List[Dict[str, str]]:
+    """稳定前缀在前、易变后缀在后的布局"""
+    return template.render(context.history, context.state, INSTRUCTION)
+
+async def measure(games: int, seed: int = 0, policy: str = "random") -> Dict[str, List[float]]:
+    """返回每种布局在每局的前缀命中率"""
+    layouts = {"single_message": single_message_layout, "prefix_first": prefix_layout}
+    ratios: Dict[str, List[float]] = {name: [] for name in layouts}
+    builder = ContextBuilder()
+    for i in range(games):
+        trackers = {name: PrefixCacheTracker() for name in layouts}
+
+        def observe(player: Player, game_state: GameState):
+            context = builder.build(game_state, player)
+            template = ROLE_TEMPLATES[player.role.role_type]
+            for name, layout in layouts.items():
+                trackers[name].observe(player.id, layout(template, context))
+
+        await play_probed_game(seed + i, policy, observe)
+        for name, tracker in trackers.items():
+            ratios[name].append(tracker.hit_ratio)
+    return ratios
+
+def main():
+    parser = argparse.ArgumentParser(description="每局提示词稳定前缀的命中率")
+    parser.add_argument("--games", type=int, default=200, help="对局数量")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子")
+    parser.add_argument("--policy", choices=RuleBasedAgent.POLICIES, default="random", help="决策策略")
+    args = parser.parse_args()
+
+    ratios = asyncio.run(measure(args.games, args.seed, args.policy))
+    print(f"{'布局':<16} {'平均':>7} {'最低':>7} {'最高':>7}")
+    for name, values in ratios.items():
+        print(f"{name:<16} {sum(values) / len(values):>7.1%} {min(values):>7.1%} {max(values):>7.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from typing import Callable, Dict, List
+import argparse
+import asyncio
+import random
+from ..controllers.agent_backend import AgentBackend
+from ..controllers.context_builder import ContextBuilder
+from ..controllers.game_controller import GameController
+from ..controllers.round_summary import RoundSummarizer
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_state import GamePhase, GameState
+from ..models.player import Player
+from ..simulation.headless import DEFAULT_PLAYER_NAMES, MAX_ROUNDS
+
+# 规则策略的发言只有“过。”，基准测试换成接近真实长度的发言
+SPEECHES = [
+    "我是平民，昨晚没有任何信息。我觉得刚才发言的几位都比较正常，暂时没有明确的怀疑对象，先听后面的发言再决定投谁。",
+    "我注意到有人一直在附和别人，没有给出自己的判断，这种划水的发言很像狼人，我倾向于把票投给他。",
+    "如果真预言家在场，希望今天能站出来报查验结果，不然我们好人只能乱投，正中狼人下怀。",
+    "昨晚死的是好人，狼人的刀法很准，我怀疑狼人里有人很会读发言，大家今天说话要小心。",
+    "我站边刚才跳预言家的玩家，他的查验逻辑清楚，反倒是跳出来反对他的人动机可疑。",
+]
+
+class ContextProbe(AgentBackend):
+    """包装规则策略：每次决策前调用 observe(player, game_state)，不影响决策本身"""
+
+    def __init__(self, inner: AgentBackend, observe: Callable[[Player, GameState], None], rng: random.Random):
+        self.inner = inner
+        self.observe = observe
+        self.rng = rng
+
+    async def generate_night_action(self, player, game_state):
+        self.observe(player, game_state)
+        return await self.inner.generate_night_action(player, game_state)
+
+    async def generate_discussion(self, player, game_state):
+        self.observe(player, game_state)
+        message = await self.inner.generate_discussion(player, game_state)
+        return self.rng.choice(SPEECHES) if message == "过。" else message
+
+    async def generate_vote(self, player, game_state):
+        self.observe(player, game_state)
+        return await self.inner.generate_vote(player, game_state)
+
+async def play_probed_game(seed: int, policy: str, observe: Callable[[Player, GameState], None]) -> GameController:
+    """用固定种子跑完一局带回合摘要的对局，每次决策前调用 observe"""
+    rng = random.Random(seed)
+    probe = ContextProbe(RuleBasedAgent(policy, rng), observe, rng)
+    game = GameController(api_controller=probe, discussion_delay=0, headless=True, rng=rng,
+                          round_summarizer=RoundSummarizer())
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    while game.game_state.current_phase != GamePhase.GAME_OVER and game.game_state.round_number < MAX_ROUNDS:
+        await game.next_phase()
+    return game
+
+async def measure(games: int, seed: int = 0, policy: str = "random") -> Dict[str, Dict[int, List[int]]]:
+    """跑 games 局，返回每种方式在每个回合的上下文 token 数样本"""
+    builders = {
+        "raw": ContextBuilder(max_tokens=10 ** 9, use_summaries=False),
+        "summary": ContextBuilder(max_tokens=10 ** 9, use_summaries=True),
+    }
+    totals: Dict[str, Dict[int, List[int]]] = {name: {} for name in builders}  # 方式 -> 回合 -> token 数
+
+    def observe(player: Player, game_state: GameState):
+        for name, builder in builders.items():
+            tokens = builder.build(game_state, player).tokens
+            totals[name].setdefault(game_state.round_number, []).append(tokens)
+
+    for i in range(games):
+        await play_probed_game(seed + i, policy, observe)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="每回合提示词上下文 token 数：原文 vs 回合摘要")
+    parser.add_argument("--games", type=int, default=200, help="对局数量")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子")
+    parser.add_argument("--policy", choices=RuleBasedAgent.POLICIES, default="random", help="决策策略")
+    args = parser.parse_args()
+
+    totals = asyncio.run(measure(args.games, args.seed, args.policy))
+    print(f"{'回合':>4} {'决策数':>6} {'原文':>8} {'摘要':>8} {'减少':>7}")
+    for round_number in sorted(totals["raw"]):
+        raw, summary = totals["raw"][round_number], totals["summary"][round_number]
+        raw_avg, summary_avg = sum(raw) / len(raw), sum(summary) / len(summary)
+        print(f"{round_number + 1:>4} {len(raw):>6} {raw_avg:>8.0f} {summary_avg:>8.0f} {1 - summary_avg / raw_avg:>7.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+from ..controllers.agent_backend import AgentBackend
+from ..controllers.api_controller import APIController
+from ..controllers.game_controller import WEREWOLF_MODES, GameController
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_state import GamePhase
+from ..models.player import Player
+from ..models.role import RoleType
+from ..simulation.headless import DEFAULT_PLAYER_NAMES, MAX_ROUNDS
+
+# 神职角色：狼人刀中它们说明刀法有针对性
+POWER_ROLES = {RoleType.SEER, RoleType.WITCH, RoleType.HUNTER, RoleType.GUARD}
+
+class CallCounter(AgentBackend):
+    """包装决策后端，统计狼人夜晚的决策调用次数，不影响决策本身"""
+
+    def __init__(self, inner: AgentBackend):
+        self.inner = inner
+        self.wolf_calls = 0
+        self.team_calls = 0
+        self.team_fallbacks = 0  # 联合决策没有给出有效目标、退回每匹狼各自决策的次数
+
+    async def generate_night_action(self, player, game_state):
+        if player.role.role_type == RoleType.WEREWOLF:
+            self.wolf_calls += 1
+        return await self.inner.generate_night_action(player, game_state)
+
+    async def generate_werewolf_team_action(self, werewolves, game_state):
+        self.team_calls += 1
+        action = await self.inner.generate_werewolf_team_action(werewolves, game_state)
+        if not action:
+            self.team_fallbacks += 1
+        return action
+
+    async def generate_discussion(self, player, game_state):
+        return await self.inner.generate_discussion(player, game_state)
+
+    async def generate_vote(self, player, game_state):
+        return await self.inner.generate_vote(player, game_state)
+
+def make_backend(agent: str, rng: random.Random, model: Optional[str]) -> AgentBackend:
+    if agent == "llm":
+        return APIController(model_name=model or "deepseek-chat", show_progress=False)
+    return RuleBasedAgent(agent, rng)
+
+async def measure(mode: str, agent: str, games: int, seed: int = 0, model: Optional[str] = None) -> Dict:
+    """用同一组种子跑 games 局，返回狼人夜晚的调用次数、耗时和刀法、胜率"""
+    nights, kills, power_kills, wolf_wins = 0, 0, 0, 0
+    night_seconds: List[float] = []
+    calls = {"wolf_calls": 0, "team_calls": 0, "team_fallbacks": 0}
+    for i in range(games):
+        rng = random.Random(seed + i)
+        counter = CallCounter(make_backend(agent, rng, model))
+        game = GameController(api_controller=counter, discussion_delay=0, headless=True, rng=rng,
+                              werewolf_mode=mode)
+        with contextlib.redirect_stdout(io.StringIO()):  # LLM 后端会打印每次请求
+            await game.initialize_game(DEFAULT_PLAYER_NAMES)
+            while game.game_state.current_phase != GamePhase.GAME_OVER \
+                    and game.game_state.round_number < MAX_ROUNDS:
+                is_night = game.game_state.current_phase == GamePhase.NIGHT
+                start = time.perf_counter()
+                await game.next_phase()
+                if is_night:
+                    night_seconds.append(time.perf_counter() - start)
+                    nights += 1
+                    target: Optional[Player] = game.game_state.get_player_by_id(game.game_state._last_night_killed)
+                    if target:
+                        kills += 1
+                        power_kills += target.role.role_type in POWER_ROLES
+        wolf_wins += game.game_state.get_game_result()["winning_team"] == "werewolves"
+        for name in calls:
+            calls[name] += getattr(counter, name)
+    return {
+        "mode": mode,
+        "calls_per_night": (calls["wolf_calls"] + calls["team_calls"]) / max(nights, 1),
+        "fallbacks": calls["team_fallbacks"],
+        "night_ms": sum(night_seconds) / max(len(night_seconds), 1) * 1000,
+        "power_kill_rate": power_kills / max(kills, 1),
+        "werewolf_win_rate": wolf_wins / games
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="狼人夜晚决策方式对比：每匹狼各自决策 vs 全队一次联合决策")
+    parser.add_argument("--games", type=int, default=200, help="每种方式的对局数量（两种方式使用相同的种子）")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子")
+    parser.add_argument("--agent", choices=("llm",) + RuleBasedAgent.POLICIES, default="heuristic",
+                        help="决策后端；llm 需要 DEEPSEEK_API_KEY，会真实请求模型")
+    parser.add_argument("--model", default=None, help="llm 后端使用的模型（默认 deepseek-chat）")
+    args = parser.parse_args()
+
+    print(f"{'方式':>10} {'每晚调用':>8} {'退回':>5} {'夜晚ms':>9} {'刀中神职':>8} {'狼人胜率':>8}")
+    for mode in WEREWOLF_MODES:
+        result = asyncio.run(measure(mode, args.agent, args.games, args.seed, args.model))
+        print(f"{mode:>10} {result['calls_per_night']:>8.2f} {result['fallbacks']:>5} {result['night_ms']:>9.2f} "
+              f"{result['power_kill_rate']:>8.1%} {result['werewolf_win_rate']:>8.1%}")
+
+if __name__ == "__main__":
+    main()
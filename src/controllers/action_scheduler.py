@@ -0,0 +1,60 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+import asyncio
+
+class ActionScheduler:
+    """按依赖关系调度角色行动
+
+    每个行动声明自己依赖的其他行动，依赖全部完成后立即启动；
+    互不依赖的行动同时进行，例如预言家查验不必等待狼人击杀。
+    """
+
+    def __init__(self):
+        self._actions: Dict[str, Tuple[Callable[[], Awaitable[Any]], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, action: Callable[[], Awaitable[Any]], depends_on: Iterable[str] = ()):
+        """注册一个行动
+
+        Args:
+            name: 行动名称，在同一个调度器内唯一
+            action: 无参数的异步函数
+            depends_on: 必须先完成的行动名称
+        """
+        if name in self._actions:
+            raise ValueError(f"重复的行动: {name}")
+        self._actions[name] = (action, tuple(depends_on))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._actions
+
+    async def run(self) -> Dict[str, Any]:
+        """运行所有行动，返回 行动名称 -> 结果
+
+        任一行动抛出异常时，取消其余正在运行的行动并重新抛出该异常。
+        """
+        for name, (_, depends_on) in self._actions.items():
+            missing = [dep for dep in depends_on if dep not in self._actions]
+            if missing:
+                raise ValueError(f"行动 {name} 依赖未注册的行动: {', '.join(missing)}")
+
+        results: Dict[str, Any] = {}
+        pending = dict(self._actions)
+        running: Dict[asyncio.Task, str] = {}
+        try:
+            while pending or running:
+                ready = [name for name, (_, depends_on) in pending.items()
+                         if all(dep in results for dep in depends_on)]
+                for name in ready:
+                    action, _ = pending.pop(name)
+                    running[asyncio.ensure_future(action())] = name
+                if not running:
+                    raise ValueError(f"行动之间存在循环依赖: {', '.join(pending)}")
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[running.pop(task)] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return results
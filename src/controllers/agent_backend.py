@@ -0,0 +1,54 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Union
+import random
+from .metrics import MetricsRegistry
+from ..models.player import Player
+from ..models.game_state import GameState
+
+class AgentBackend(ABC):
+    """玩家决策后端接口
+
+    GameController 只通过这几个方法获取玩家决策，LLM（APIController）、
+    规则策略（RuleBasedAgent）和测试用的 Mock 都实现同一接口。
+    每局游戏使用自己的后端实例，后端可以在实例上保存本局的记忆。
+    """
+
+    async def warm_up(self, connections: int = 1):
+        """游戏开始前的准备工作（例如预热连接），默认什么都不做"""
+
+    def get_state(self) -> Dict:
+        """后端在本局中积累的记忆（可 JSON 序列化），随对局快照持久化；无状态的后端返回 {}"""
+        return {}
+
+    def set_state(self, state: Dict):
+        """从对局快照恢复 get_state() 保存的记忆"""
+
+    def fork(self, rng: Optional[random.Random] = None) -> "AgentBackend":
+        """分支对局（GameController.fork）使用的后端：复制本局积累的记忆，之后两边互不影响
+
+        rng 是分支使用的随机数。没有本局记忆的后端可以直接返回自己。
+        """
+        return self
+
+    def bind_metrics(self, registry: MetricsRegistry):
+        """GameController 创建本局的指标注册表后调用，后端可以把本局的决策指标也记进去；默认什么都不做"""
+
+    @abstractmethod
+    async def generate_night_action(self, player: Player, game_state: GameState) -> Dict:
+        """夜晚行动，返回如 {"werewolf_kill": {"target_id": 1}} 的行动字典，无行动时返回 {}"""
+
+    async def generate_werewolf_team_action(self, werewolves: List[Player], game_state: GameState) -> Dict:
+        """狼人队伍的联合决策，一次给出每匹狼的发言和全队的击杀目标
+
+        返回 {"discussion": [{"wolf_id": 1, "argument": "..."}], "werewolf_kill": {"target_id": 2}}；
+        默认返回 {}，表示不支持联合决策，由每匹狼各自调用 generate_night_action。
+        """
+        return {}
+
+    @abstractmethod
+    async def generate_discussion(self, player: Player, game_state: GameState) -> str:
+        """白天发言内容"""
+
+    @abstractmethod
+    async def generate_vote(self, player: Player, game_state: GameState) -> Union[int, Dict]:
+        """投票目标ID，-1 表示弃票；也可以返回 {"type": "vote", "target_id": ID}"""
@@ -1,224 +1,86 @@
-from typing import List, Dict, Optional
+from collections import deque
+from typing import Deque, List, Dict, Optional, Tuple
 from ..models.player import Player
 from ..models.role import RoleType
 from ..models.game_state import GameState, GamePhase
-from openai import OpenAI
+from .agent_backend import AgentBackend
+from .client_pool import ClientPool, PlayerSession, shared_pool
+from .context_builder import ContextBuilder, GameContext, estimate_tokens
+from .metrics import LLMCallMetrics, MetricsRegistry, shared_metrics
+from .tracing import current_span, span, traced
+from .prompt_templates import ROLE_TEMPLATES, PrefixCacheTracker
+from .response_cache import ResponseCache
+from .rate_limit import CircuitOpenError, RateLimiterRegistry, is_retryable, retry_after_seconds, shared_rate_limiter
+from .transport import LiveTransport, Transport, TranscriptMismatchError
 import json
+import openai
 import os
 import asyncio
 import sys
 import time
 
-class APIController:
-    def __init__(self, model_name="deepseek-r1"):
-        self.system_prompts = self._init_role_prompts()
+DEFAULT_BASE_URL = 'https://tbnx.plus7.plus/v1'
+
+def extract_json(text: str) -> Optional[str]:
+    """取出响应中最后一个完整的顶层 JSON 对象（可以嵌套），没有时返回 None"""
+    decoder = json.JSONDecoder()
+    found = None
+    pos = text.find("{")
+    while pos >= 0:
+        try:
+            value, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            pos = text.find("{", pos + 1)
+            continue
+        if isinstance(value, dict):
+            found = text[pos:end]
+        pos = text.find("{", end)
+    return found
+
+class APIController(AgentBackend):
+    def __init__(self, model_name="deepseek-r1", base_url: str = DEFAULT_BASE_URL, api_key: Optional[str] = None,
+                 client_pool: Optional[ClientPool] = None, rate_limiter: Optional[RateLimiterRegistry] = None,
+                 response_cache: Optional[ResponseCache] = None, transport: Optional[Transport] = None,
+                 context_builder: Optional[ContextBuilder] = None, metrics: Optional[MetricsRegistry] = None,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None, show_progress: bool = True):
+        self.templates = ROLE_TEMPLATES  # 每个角色编译好的提示词模板
+        self.show_progress = show_progress  # 是否在终端显示“思考中”动画；服务模式下同时进行上百局时关闭
         self._loading_task = None
-        self._player_sessions = {}  # 存储每个玩家的独立 session
+        self._loading_count = 0  # 正在进行中的调用数量，多个并发调用共用一个加载动画
+        self._player_sessions: Dict[int, PlayerSession] = {}  # 每个玩家的逻辑 session，共享同一个连接池
+        self.client_pool = client_pool or shared_pool
+        self.rate_limiter = rate_limiter or shared_rate_limiter
+        self.response_cache = response_cache  # 可选的响应缓存，None 表示不使用
+        self.transport = transport or LiveTransport(self.rate_limiter)  # 实时请求、录制或重放
+        self.context_builder = context_builder or ContextBuilder()  # 按 token 预算构建游戏上下文
+        self.prompt_stats: Deque[Dict] = deque(maxlen=1000)  # 最近的请求的提示词 token 用量（估算）
+        self.prompt_totals = {"calls": 0, "context_tokens": 0, "prompt_tokens": 0, "prefix_hit_tokens": 0}  # 累计用量
+        self.prefix_cache = PrefixCacheTracker()  # 估算服务端前缀缓存命中率
+        self.metrics = metrics or shared_metrics  # 调用耗时、排队、重试和 token 用量，可导出为 Prometheus 格式
+        self.call_metrics = LLMCallMetrics(self.metrics, prices)
         self.model_name = model_name  # 新增：模型选择
+        self.base_url = base_url
+        self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         
-    def _init_role_prompts(self) -> Dict[RoleType, str]:
-        """初始化每个角色的系统提示词"""
-        return {
-            RoleType.WEREWOLF: """你正在参与一个狼人杀游戏。这是一个推理策略游戏，玩家分为两个阵营：狼人阵营和好人阵营。
-
-                                 游戏规则：
-                                 1. 游戏分为白天和黑夜两个阶段交替进行
-                                 2. 每个夜晚：
-                                    - 狼人可以选择一名玩家击杀
-                                    - 预言家可以查验一名玩家的真实身份
-                                    - 女巫可以使用解药救人或使用毒药杀人（每种药只能用一次）
-                                 3. 每个白天：
-                                    - 公布夜晚死亡情况
-                                    - 所有玩家依次发言，讨论信息
-                                    - 所有玩家投票，得票最多的玩家被放逐
-                                 4. 胜利条件：
-                                    - 狼人阵营：杀死所有好人
-                                    - 好人阵营：杀死所有狼人
-                                 
-                                 你的角色是狼人，属于狼人阵营。
-                                 目标：与其他狼人合作，淘汰所有好人阵营。
-                                 
-                                 狼人战术指南：
-                                 1. 刀法精准：优先击杀女巫、预言家，后期刀猎人/关键平民
-                                 2. 发言统一：与狼队提前约定验人逻辑，避免内部矛盾
-                                 3. 悍跳战术：
-                                    - 可以直接对跳预言家，扰乱好人视野
-                                    - 编造首夜验人结果，攻击真预言家"验人无收益"
-                                    - 其他狼人要统一站边悍跳狼
-                                 4. 倒钩战术：
-                                    - 假意支持真预言家，暗中篡改验人信息
-                                    - 在关键轮次反水归票真预言家
-                                 5. 深水战术：
-                                    - 发言保持中立，装作跟票平民
-                                    - 决赛轮可跳神职抢夺归票权
-                                 6. 煽动战术：
-                                    - 假扮激进好人，攻击可疑玩家
-                                    - 利用位置学带偏好人思路
-                                 
-                                 记住：悍跳要真，倒钩要深，刀法要狠，发言要稳！""",
-            
-            RoleType.VILLAGER: """你正在参与一个狼人杀游戏。这是一个推理策略游戏，玩家分为两个阵营：狼人阵营和好人阵营。
-
-                                 游戏规则：
-                                 1. 游戏分为白天和黑夜两个阶段交替进行
-                                 2. 每个夜晚：
-                                    - 狼人可以选择一名玩家击杀
-                                    - 预言家可以查验一名玩家的真实身份
-                                    - 女巫可以使用解药救人或使用毒药杀人（每种药只能用一次）
-                                 3. 每个白天：
-                                    - 公布夜晚死亡情况
-                                    - 所有玩家依次发言，讨论信息
-                                    - 所有玩家投票，得票最多的玩家被放逐
-                                 4. 胜利条件：
-                                    - 狼人阵营：杀死所有好人
-                                    - 好人阵营：杀死所有狼人
-                                 
-                                 你的角色是普通村民，属于好人阵营。
-                                 目标：与其他好人合作，找出并淘汰所有狼人。
-                                 
-                                 平民战术指南：
-                                 1. 发言策略：
-                                    - 可以尝试穿神职衣服（如假跳预言家）
-                                    - 大胆发表意见，敢于质疑可疑玩家
-                                    - 记录并分析玩家投票一致性
-                                 2. 逻辑分析：
-                                    - 关注多次弃票或跟风的玩家
-                                    - 注意发言矛盾或态度反复的人
-                                 3. 团队配合：
-                                    - 支持可信的神职玩家
-                                    - 通过互保形成信任链
-                                    - 在神职死亡后主动带队归票
-                                 4. 防守意识：
-                                    - 避免过于激进被狼人针对
-                                    - 保持中立直到获得确切信息
-                                 
-                                 记住：敢穿敢保，敢踩敢票，活着是盾，死了是矛！""",
-            
-            RoleType.SEER: """你正在参与一个狼人杀游戏。这是一个推理策略游戏，玩家分为两个阵营：狼人阵营和好人阵营。
-
-                             游戏规则：
-                             1. 游戏分为白天和黑夜两个阶段交替进行
-                             2. 每个夜晚：
-                                - 狼人可以选择一名玩家击杀
-                                - 预言家可以查验一名玩家的真实身份
-                                - 女巫可以使用解药救人或使用毒药杀人（每种药只能用一次）
-                             3. 每个白天：
-                                - 公布夜晚死亡情况
-                                - 所有玩家依次发言，讨论信息
-                                - 所有玩家投票，得票最多的玩家被放逐
-                             4. 胜利条件：
-                                - 狼人阵营：杀死所有好人
-                                - 好人阵营：杀死所有狼人
-                             
-                             你的角色是预言家，属于好人阵营。
-                             目标：帮助村民找出并淘汰狼人，但要注意保护自己。
-                             
-                             预言家战术指南：
-                             1. 验人策略：
-                                - 首夜优先验发言可疑的玩家
-                                - 次夜验证关键发言者或神职玩家
-                                - 避免重复验证同一条线的玩家
-                             2. 身份保护：
-                                - 考虑隐藏身份到第二夜
-                                - 避免首夜被刀导致信息断层
-                             3. 信息传递：
-                                - 明确公开验人结果和顺序
-                                - 避免被狼人混淆验人信息
-                                - 用清晰的逻辑串联验人结果
-                             4. 带队技巧：
-                                - 及时归票确认的狼人
-                                - 保护验出的好人玩家
-                                - 引导队伍关注可疑目标
-                             
-                             记住：首验抓狼，次验保民，发言要硬，信息要清！""",
-            
-            RoleType.WITCH: """你正在参与一个狼人杀游戏。这是一个推理策略游戏，玩家分为两个阵营：狼人阵营和好人阵营。
-
-                             游戏规则：
-                             1. 游戏分为白天和黑夜两个阶段交替进行
-                             2. 每个夜晚：
-                                - 狼人可以选择一名玩家击杀
-                                - 预言家可以查验一名玩家的真实身份
-                                - 女巫可以使用解药救人或使用毒药杀人（每种药只能用一次）
-                             3. 每个白天：
-                                - 公布夜晚死亡情况
-                                - 所有玩家依次发言，讨论信息
-                                - 所有玩家投票，得票最多的玩家被放逐
-                             4. 胜利条件：
-                                - 狼人阵营：杀死所有好人
-                                - 好人阵营：杀死所有狼人
-                             
-                             你的角色是女巫，属于好人阵营。
-                             目标：帮助村民找出并淘汰狼人，合理使用药水。
-                             
-                             女巫战术指南：
-                             1. 解药使用：
-                                - 首夜考虑自救（防首刀）
-                                - 优先救预言家（保证至少两夜验人）
-                                - 若未自救则隐藏身份观察刀法
-                             2. 毒药策略：
-                                - 不要轻易使用，等待关键时机
-                                - 针对发言矛盾或跟风站队的玩家
-                                - 可以毒掉确认的狼人
-                             3. 身份保护：
-                                - 尽量隐藏身份直到使用药水
-                                - 观察狼人刀法判断用药时机
-                             4. 发言技巧：
-                                - 装作普通平民发言
-                                - 暗中保护可信好人
-                                - 用毒药威慑可疑玩家
-                             
-                             记住：首夜自救，毒药慢用，装民到底，毒狼无形！""",
-            
-            RoleType.HUNTER: """你正在参与一个狼人杀游戏。这是一个推理策略游戏，玩家分为两个阵营：狼人阵营和好人阵营。
+    async def _get_player_session(self, player_id: int) -> PlayerSession:
+        """获取或创建玩家的 session
 
-                               游戏规则：
-                               1. 游戏分为白天和黑夜两个阶段交替进行
-                               2. 每个夜晚：
-                                  - 狼人可以选择一名玩家击杀
-                                  - 预言家可以查验一名玩家的真实身份
-                                  - 女巫可以使用解药救人或使用毒药杀人（每种药只能用一次）
-                               3. 每个白天：
-                                  - 公布夜晚死亡情况
-                                  - 所有玩家依次发言，讨论信息
-                                  - 所有玩家投票，得票最多的玩家被放逐
-                               4. 胜利条件：
-                                  - 狼人阵营：杀死所有好人
-                                  - 好人阵营：杀死所有狼人
-                               
-                               你的角色是猎人，属于好人阵营。
-                               目标：帮助村民找出并淘汰狼人，注意开枪时机。
-                               
-                               猎人战术指南：
-                               1. 身份策略：
-                                  - 残局阶段再跳身份归票
-                                  - 避免过早暴露被狼人针对
-                                  - 可以暗跳钓鱼，伪装平民
-                               2. 开枪时机：
-                                  - 被投票出局时翻牌反杀
-                                  - 被狼人击杀时带走嫌疑人
-                                  - 优先射杀划水不站队的玩家
-                               3. 威慑作用：
-                                  - 利用开枪威胁压制狼人
-                                  - 保护关键好人免受伤害
-                               4. 发言技巧：
-                                  - 暗中观察可疑玩家
-                                  - 记录反复倒票的玩家
-                                  - 为开枪目标收集证据
-                               
-                               记住：明跳控场，暗藏追刀，枪口指狼，一换一高！"""
-        }
-    
-    def _get_player_session(self, player_id: int) -> OpenAI:
-        """获取或创建玩家的独立 session"""
+        session 只是轻量的逻辑上下文，实际请求走端点共享的连接池。
+        """
         if player_id not in self._player_sessions:
-            self._player_sessions[player_id] = OpenAI(
-                base_url='https://tbnx.plus7.plus/v1',
-                api_key=os.getenv("DEEPSEEK_API_KEY"),
-                timeout=120.0
-            )
+            endpoint = await self.client_pool.get_endpoint(self.base_url, self.api_key)
+            self._player_sessions[player_id] = PlayerSession(player_id, endpoint)
         return self._player_sessions[player_id]
     
+    async def warm_up(self, connections: int = 1):
+        """预热共享连接池"""
+        if not self.transport.remote:
+            return
+        try:
+            await self.client_pool.warm_up(self.base_url, self.api_key, connections)
+        except Exception as e:
+            print(f"[API] 连接预热失败: {str(e)}")
+    
     def set_model(self, model_name: str):
         """设置使用的模型"""
         if model_name not in ["deepseek-r1", "deepseek-chat"]:
@@ -227,47 +89,59 @@ class APIController:
     
     async def generate_night_action(self, player: Player, game_state: GameState) -> Dict:
         """生成夜晚行动决策"""
-        context = self._build_game_context(game_state, player)
-        
         if player.role.role_type == RoleType.WEREWOLF:
-            prompt = self._build_werewolf_prompt(game_state)
+            prompt = self._build_werewolf_prompt(game_state, player)
         elif player.role.role_type == RoleType.SEER:
-            prompt = self._build_seer_prompt(game_state)
+            prompt = self._build_seer_prompt(game_state, player)
         elif player.role.role_type == RoleType.WITCH:
-            prompt = self._build_witch_prompt(game_state)
+            prompt = self._build_witch_prompt(game_state, player)
+        elif player.role.role_type == RoleType.GUARD:
+            prompt = self._build_guard_prompt(game_state, player)
         else:
             return {}  # 其他角色夜晚无行动
+        context = self._build_game_context(game_state, player, prompt)
             
-        response = await self._call_api(prompt, context, player)
+        response = await self._call_api(prompt, context, player, game_state)
         return self._parse_night_action(response, player.role.role_type)
     
+    async def generate_werewolf_team_action(self, werewolves: List[Player], game_state: GameState) -> Dict:
+        """狼人队伍一次请求完成讨论和击杀决策（代替每匹狼各一次请求）"""
+        leader = werewolves[0]  # 请求记在第一匹狼的 session 上，队友的信息对全队公开
+        prompt = self._build_werewolf_team_prompt(game_state, werewolves)
+        context = self._build_game_context(game_state, leader, prompt)
+        response = await self._call_api(prompt, context, leader, game_state)
+        return self._parse_werewolf_team_action(response, werewolves, game_state)
+    
     async def generate_discussion(self, player: Player, game_state: GameState) -> str:
         """生成白天讨论发言"""
-        context = self._build_game_context(game_state, player)
         prompt = self._build_discussion_prompt(game_state, player)
+        context = self._build_game_context(game_state, player, prompt)
         
-        response = await self._call_api(prompt, context, player)
+        response = await self._call_api(prompt, context, player, game_state)
         return self._parse_discussion(response)
     
     async def generate_vote(self, player: Player, game_state: GameState) -> int:
         """生成投票决策"""
-        context = self._build_game_context(game_state, player)
         prompt = self._build_vote_prompt(game_state)
+        context = self._build_game_context(game_state, player, prompt)
         
-        response = await self._call_api(prompt, context, player)
+        response = await self._call_api(prompt, context, player, game_state)
         return self._parse_vote(response, game_state)
     
-    def _build_game_context(self, game_state: GameState, player: Player) -> str:
-        """构建游戏上下文信息"""
-        alive_players = game_state.get_alive_players()
-        context = f"""
-        当前游戏状态:
-        - 回合数: {game_state.round_number}
-        - 存活玩家: {[p.name for p in alive_players]}
-        - 你的角色: {player.role.role_type.value}
-        - 历史对话: {self._format_chat_history(game_state)}
-        """
-        return context
+    def bind_metrics(self, registry: MetricsRegistry):
+        """本局的调用指标改记到本局的注册表；它再转记到 self.metrics 时才切换，进程级的汇总不变"""
+        if registry.parent is self.metrics:
+            self.call_metrics = LLMCallMetrics(registry, self.call_metrics.prices)
+    
+    def _build_game_context(self, game_state: GameState, player: Player, instruction: str = "") -> GameContext:
+        """构建游戏上下文信息（按 token 预算从游戏日志中选取历史，预算先扣掉系统提示词和本次的决策指令）"""
+        special_info = self._get_player_special_info(game_state, player)
+        reserved = self.templates[player.role.role_type].fixed_tokens(instruction)
+        return self.context_builder.build(game_state, player, special_info, reserved)
+    
+    def prefix_cache_stats(self) -> Dict:
+        """本局请求的稳定前缀命中统计"""
+        return self.prefix_cache.stats()
     
     async def _show_loading_animation(self):
         """显示加载动画"""
@@ -281,11 +155,18 @@ class APIController:
     
     async def _start_loading(self):
         """开始显示加载动画"""
-        self._loading_task = asyncio.create_task(self._show_loading_animation())
+        if not self.show_progress:
+            return
+        self._loading_count += 1
+        if self._loading_count == 1:
+            self._loading_task = asyncio.create_task(self._show_loading_animation())
     
     async def _stop_loading(self):
-        """停止加载动画"""
-        if self._loading_task:
+        """停止加载动画（最后一个进行中的调用结束时才真正停止）"""
+        if self._loading_count == 0:
+            return
+        self._loading_count -= 1
+        if self._loading_count == 0 and self._loading_task:
             self._loading_task.cancel()
             try:
                 await self._loading_task
@@ -294,34 +175,98 @@ class APIController:
             print("\r" + " " * 20 + "\r", end="")  # 清除加载动画
             sys.stdout.flush()
     
-    async def _call_api(self, prompt: str, context: str, player: Player) -> str:
+    @traced("llm_request")
+    async def _create_completion(self, session: PlayerSession, request: Dict, phase: int = 0,
+                                 attempt: int = 1) -> Dict:
+        """发送一次补全请求，返回 {"content": 回复文本, "usage": token 用量}
+
+        开启响应缓存时先查缓存；未命中时交给传输层（实时请求、录制或重放）。
+        缓存命中和重放的响应带 "cached": True，它们的 usage 是当初那次请求的用量，这次没有付费。
+        """
+        request_span = current_span()  # @traced 创建的 llm_request span，未开启追踪时为 None
+        if request_span:
+            request_span.set_attribute("model", request["model"])
+            request_span.set_attribute("attempt", attempt)
+        if self.response_cache:
+            cached = self.response_cache.get(request)
+            if cached is not None:
+                if request_span:
+                    request_span.set_attribute("cached", True)
+                return dict(cached, cached=True)
+        
+        result = await self.transport.complete(session, request, phase)
+        if self.response_cache:
+            # 排队时间只属于这一次请求，不写进缓存
+            self.response_cache.put(request, {"content": result["content"], "usage": result.get("usage", {})})
+        if request_span:
+            request_span.set_attribute("queue_seconds", result.get("queue_seconds", 0.0))
+            for key, value in result.get("usage", {}).items():
+                if isinstance(value, int):
+                    request_span.set_attribute(f"usage.{key}", value)
+        return result
+    
+    @traced("llm_call")
+    async def _call_api(self, prompt: str, context: GameContext, player: Player,
+                        game_state: Optional[GameState] = None) -> str:
         """调用DeepSeek API"""
+        phase = game_state.phase_index if game_state else 0
+        phase_name = game_state.current_phase.value if game_state else "unknown"
+        start = time.perf_counter()
+        queue_seconds = 0.0
+        requests_sent = 0
+        parse_failures = 0
+        outcome = "error"
+        call_span = current_span()  # @traced 创建的 llm_call span，未开启追踪时为 None
+        if call_span:
+            call_span.set_attribute("model", self.model_name)
+            call_span.set_attribute("player", player.name)
+            call_span.set_attribute("phase", phase_name)
         try:
             print(f"\n[API] {player.name} ({player.role.role_type.value}) 正在思考...")
             
             await self._start_loading()
-            client = self._get_player_session(player.id)
-            system_prompt = self.system_prompts[player.role.role_type]
+            session = await self._get_player_session(player.id)
+            guard = self.rate_limiter.get(self.model_name)
+            messages = self.templates[player.role.role_type].render(context.history, context.state, prompt)
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            prefix_hit_tokens = self.prefix_cache.observe(player.id, messages)
+            self.prompt_stats.append({
+                "player_id": player.id,
+                "phase": phase,
+                "context_tokens": context.tokens,
+                "prompt_tokens": prompt_tokens,
+                "prefix_hit_tokens": prefix_hit_tokens
+            })
+            self.prompt_totals["calls"] += 1
+            self.prompt_totals["context_tokens"] += context.tokens
+            self.prompt_totals["prompt_tokens"] += prompt_tokens
+            self.prompt_totals["prefix_hit_tokens"] += prefix_hit_tokens
+            print(f"[API] 提示词约 {prompt_tokens} tokens（上下文 {context.tokens}+固定部分 {context.reserved}/{context.budget}，"
+                  f"可命中前缀 {prefix_hit_tokens}）")
             
             max_retries = 3
+            retry_delay = 0.0  # 下一次重试前需要等待的秒数，只有服务端错误才需要退避
             for attempt in range(max_retries):
                 try:
-                    if attempt > 0:
-                        wait_time = attempt * 5
-                        print(f"[API] 等待 {wait_time} 秒后重试...")
-                        await asyncio.sleep(wait_time)
+                    if retry_delay > 0:
+                        print(f"[API] 等待 {retry_delay:.1f} 秒后重试...")
+                        with span("retry_backoff", seconds=retry_delay):
+                            await asyncio.sleep(retry_delay)
+                        retry_delay = 0.0
                     
-                    completion = client.chat.completions.create(
-                        model=self.model_name,  # 使用选定的模型
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": f"{context}\n{prompt}"}
-                        ],
-                        temperature=0.7,
-                        max_tokens=2000
-                    )
+                    request = {
+                        "model": self.model_name,  # 使用选定的模型
+                        "messages": messages,
+                        "temperature": 0.7,
+                        "max_tokens": 2000
+                    }
+                    requests_sent += 1
+                    completion = await self._create_completion(session, request, phase, requests_sent)
+                    queue_seconds += completion.get("queue_seconds", 0.0)
+                    self.call_metrics.record_usage(self.model_name, completion.get("usage"),
+                                                   completion.get("cached", False))
                     
-                    response = completion.choices[0].message.content.strip()
+                    response = completion["content"].strip()
                     
                     # 根据不同模型处理响应
                     if self.model_name == "deepseek-r1":
@@ -336,18 +281,17 @@ class APIController:
                         # Chat模型直接返回结果，不需要特殊处理
                         print(f"[API] {player.name} 的响应: {response}")
                     
-                    # 尝试找到JSON对象
-                    json_start = response.rfind("{")
-                    json_end = response.rfind("}") + 1
-                    if json_start >= 0 and json_end > json_start:
-                        json_str = response[json_start:json_end]
-                        try:
-                            json.loads(json_str)  # 验证JSON是否有效
-                            await self._stop_loading()
-                            print(f"[API] {player.name} 做出了决定。")
-                            return json_str
-                        except json.JSONDecodeError:
-                            pass
+                    # 尝试找到JSON对象（狼人联合决策的响应是嵌套的对象）
+                    json_str = extract_json(response)
+                    if json_str is not None:
+                        print(f"[API] {player.name} 做出了决定。")
+                        outcome = "ok"
+                        return json_str
+                    
+                    parse_failures += 1
+                    # 格式不正确的响应不能留在缓存里，否则重试只会再次命中它
+                    if self.response_cache:
+                        self.response_cache.invalidate(request)
                     
                     if attempt < max_retries - 1:
                         print(f"[API] {player.name} 的响应格式不正确,重试中...")
@@ -355,43 +299,60 @@ class APIController:
                     
                     # 最后一次尝试使用更直接的提示
                     print(f"[API] 最后一次尝试使用简化提示...")
-                    completion = client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
+                    requests_sent += 1
+                    completion = await self._create_completion(session, {
+                        "model": self.model_name,
+                        "messages": [
                             {"role": "system", "content": "请直接返回JSON格式的决策"},
                             {"role": "user", "content": prompt.split('请用以下格式返回：')[1]}
                         ],
-                        temperature=0.7,
-                        max_tokens=500
-                    )
+                        "temperature": 0.7,
+                        "max_tokens": 500
+                    }, phase, requests_sent)
+                    queue_seconds += completion.get("queue_seconds", 0.0)
+                    self.call_metrics.record_usage(self.model_name, completion.get("usage"),
+                                                   completion.get("cached", False))
                     
-                    response = completion.choices[0].message.content.strip()
+                    response = completion["content"].strip()
                     print(f"[API] {player.name} 最终做出决定。")
-                    
-                    await self._stop_loading()
+                    outcome = "fallback"
                     return response
                     
+                except CircuitOpenError:
+                    print(f"[API] 服务暂不可用，{player.name} 使用默认决策")
+                    outcome = "circuit_open"
+                    return "{}"
+                
+                except TranscriptMismatchError:
+                    raise
+                    
                 except Exception as e:
-                    error_msg = str(e)
-                    print(f"[API] {player.name} 的第{attempt + 1}次尝试失败: {error_msg}")
+                    print(f"[API] {player.name} 的第{attempt + 1}次尝试失败: {str(e)}")
                     
-                    if "timeout" in error_msg.lower():
-                        print("[API] 超时错误，将在重试前等待更长时间...")
-                    elif "rate limit" in error_msg.lower():
-                        print("[API] 速率限制，将在重试前等待更长时间...")
+                    if is_retryable(e):
+                        retry_delay = guard.backoff_delay(attempt, retry_after_seconds(e))
+                    elif isinstance(e, openai.APIStatusError):
+                        print("[API] 请求无效，不再重试，返回空响应")
+                        break
                     
-                    if attempt < max_retries - 1:
-                        continue
-                    else:
+                    if attempt == max_retries - 1:
                         print("[API] 已达到最大重试次数，返回空响应")
             
             return "{}"
             
+        except TranscriptMismatchError:
+            raise
         except Exception as e:
-            await self._stop_loading()
             print(f"[API] {player.name} 出错: {str(e)}")
             return "{}"
-    
+        finally:
+            if call_span:
+                call_span.set_attribute("outcome", outcome)
+                call_span.set_attribute("retries", max(requests_sent - 1, 0))
+            self.call_metrics.record_call(self.model_name, phase_name, time.perf_counter() - start, queue_seconds,
+                                          max(requests_sent - 1, 0), parse_failures, outcome)
+            await self._stop_loading()
+
     def _parse_night_action(self, response: str, role_type: RoleType) -> Dict:
         """解析夜晚行动响应"""
         try:
@@ -427,7 +388,8 @@ class APIController:
             elif role_type == RoleType.SEER:
                 if "type" in action and action["type"] == "check" and "target_id" in action:
                     target_name = action["target_id"]
-                    if isinstance(target_name, str):  # 确保 target_id 是字符串（玩家名字）
+                    # 玩家名字，或候选名单压缩成 ID 区间时的数字ID
+                    if isinstance(target_name, str) or (isinstance(target_name, int) and not isinstance(target_name, bool)):
                         return {"seer_check": {"target_id": target_name}}
             elif role_type == RoleType.WITCH:
                 print("[DEBUG] 女巫行动解析开始")
@@ -448,11 +410,39 @@ class APIController:
                     return result
                 else:
                     print("[DEBUG] 女巫行动格式不正确")
+            elif role_type == RoleType.GUARD:
+                if action.get("type") == "protect" and isinstance(action.get("target_id"), int):
+                    return {"guard_protect": {"target_id": action["target_id"]}}
             return {}
         except Exception as e:
             print(f"[API] 解析错误: {str(e)}")
             return {}
     
+    def _parse_werewolf_team_action(self, response: str, werewolves: List[Player], game_state: GameState) -> Dict:
+        """解析狼人联合决策，目标必须是存活的非狼人玩家；无效时返回 {}（由每匹狼各自决策）"""
+        json_str = extract_json(response.replace("<think>", "").replace("</think>", "")) if response else None
+        if json_str is None:
+            print("[API] 狼人联合决策未找到JSON响应")
+            return {}
+        action = json.loads(json_str)
+        target_id = action.get("target_id")
+        # bool 也是 int 的子类，"target_id": true 不能当作 1 号玩家
+        is_id = isinstance(target_id, int) and not isinstance(target_id, bool)
+        target = game_state.get_player_by_id(target_id) if is_id else None
+        if action.get("type") != "team_kill" or not target or not target.is_alive \
+                or target_id in game_state._werewolves:
+            print(f"[API] 狼人联合决策无效: {action}")
+            return {}
+        wolf_ids = {wolf.id for wolf in werewolves}
+        items = action.get("discussion") or []
+        if not isinstance(items, list):  # 发言格式不对时只采用击杀目标
+            items = []
+        discussion = [{"wolf_id": item["wolf_id"], "argument": item["argument"].strip()}
+                      for item in items
+                      if isinstance(item, dict) and item.get("wolf_id") in wolf_ids
+                      and isinstance(item.get("argument"), str) and item["argument"].strip()]
+        return {"discussion": discussion, "werewolf_kill": {"target_id": target_id}}
+    
     def _parse_discussion(self, response: str) -> str:
         """解析讨论发言"""
         try:
@@ -465,6 +455,8 @@ class APIController:
                     action = json.loads(json_str)
                     if action.get("type") == "discussion":
                         return action.get("message", "")
+                    if not action:  # 调用失败时的默认决策
+                        return "过。"
                 except json.JSONDecodeError:
                     pass
             
@@ -531,37 +523,26 @@ class APIController:
             print(f"[API] 投票解析错误: {str(e)}")
             return -1
     
-    def _format_chat_history(self, game_state: GameState) -> str:
-        """格式化聊天历史"""
-        history = []
-        for player in game_state.players:
-            if player.chat_history:
-                history.extend([f"{player.name}: {msg}" for msg in player.chat_history[-5:]])
-        return "\n".join(history) 
-
-    def _build_werewolf_prompt(self, game_state: GameState) -> str:
+    def _build_werewolf_prompt(self, game_state: GameState, current_wolf: Player) -> str:
         """构建狼人夜晚行动提示词"""
-        # 获取当前狼人
-        current_wolf = next((p for p in game_state.get_alive_players() 
-                           if p.role.role_type == RoleType.WEREWOLF), None)
-        if not current_wolf:
-            return ""
-            
         # 获取其他狼人（只有当前狼人才能看到）
         other_werewolves = game_state.get_werewolf_teammates(current_wolf.id)
+        teammates = self.context_builder.fit_player_list(other_werewolves, lambda w: w.name, "、")
         
         # 获取存活的非狼人玩家
         alive_non_wolves = [p for p in game_state.get_alive_players() 
                            if p.id not in game_state._werewolves]
+        targets = self.context_builder.fit_target_list(alive_non_wolves, lambda p: f"{p.id}. {p.name}",
+                                                       compact=lambda p: str(p.id))
         
         # 第一晚使用简化的提示词
         if game_state.round_number == 0:
             return f"""第一天晚上。
                       你需要选择一名玩家击杀。
-                      {'其他狼人玩家：' + '、'.join([w.name for w in other_werewolves]) if other_werewolves else '你是唯一的狼人。'}
+                      {'其他狼人玩家：' + teammates if other_werewolves else '你是唯一的狼人。'}
                       
                       可选择的目标：
-                      {chr(10).join([f"{p.id}. {p.name}" for p in alive_non_wolves])}
+                      {targets}
                       
                       请用以下格式返回JSON（一定要返回数字ID）：
                       {{"type": "kill", "target_id": 玩家ID}}
@@ -571,51 +552,65 @@ class APIController:
         # 其他晚上使用正常提示词
         return f"""现在是第{game_state.round_number + 1}天晚上。
                   刚才的狼人讨论已经结束，现在需要选择一名玩家击杀。
-                  {'其他狼人玩家：' + '、'.join([w.name for w in other_werewolves]) if other_werewolves else '你是唯一的狼人。'}
+                  {'其他狼人玩家：' + teammates if other_werewolves else '你是唯一的狼人。'}
                   
                   可选择的目标：
-                  {chr(10).join([f"{p.id}. {p.name}" for p in alive_non_wolves])}
+                  {targets}
                   
                   请用以下格式返回JSON（一定要返回数字ID）：
                   {{"type": "kill", "target_id": 玩家ID}}
                   
                   示例：{{"type": "kill", "target_id": 1}}"""
 
-    def _build_seer_prompt(self, game_state: GameState) -> str:
+    def _build_werewolf_team_prompt(self, game_state: GameState, werewolves: List[Player]) -> str:
+        """构建狼人联合决策提示词：一次写出每匹狼的发言和全队最终的击杀目标"""
+        wolves = self.context_builder.fit_target_list(werewolves, lambda w: f"{w.id}. {w.name}",
+                                                      compact=lambda w: str(w.id))
+        alive_non_wolves = [p for p in game_state.get_alive_players()
+                            if p.id not in game_state._werewolves]
+        targets = self.context_builder.fit_target_list(alive_non_wolves, lambda p: f"{p.id}. {p.name}",
+                                                       compact=lambda p: str(p.id))
+        
+        return f"""现在是第{game_state.round_number + 1}天晚上，狼人队伍一起商量今晚的击杀目标。
+                  存活的狼人（按发言顺序）：
+                  {wolves}
+                  
+                  可选择的目标：
+                  {targets}
+                  
+                  请替每匹存活的狼人依次写一段简短发言（分析局势、提出想刀的人和理由，可以回应前面队友的发言），
+                  最后给出全队统一的击杀目标。
+                  
+                  请用以下格式返回：{{"type": "team_kill", "discussion": [{{"wolf_id": 狼人ID, "argument": "发言内容"}}], "target_id": 玩家ID}}
+                  discussion 中每匹狼一项，target_id 一定要返回数字ID。
+                  
+                  示例：{{"type": "team_kill", "discussion": [{{"wolf_id": 2, "argument": "5号发言像预言家，今晚刀他"}}, {{"wolf_id": 7, "argument": "同意，刀5号"}}], "target_id": 5}}"""
+
+    def _build_seer_prompt(self, game_state: GameState, seer: Player) -> str:
         """构建预言家夜晚查验提示词"""
-        # 获取预言家
-        seer = next((p for p in game_state.get_alive_players() 
-                    if p.role.role_type == RoleType.SEER), None)
-        if not seer:
-            return ""
-            
         # 获取已经查验过的玩家列表
         checked_players = game_state.get_checked_players(seer.id)
+        checked = self.context_builder.fit_player_list(
+            [game_state.get_player_by_name(name) for name in checked_players], lambda p: p.name, "、")
         
         # 获取所有可查验的玩家
         alive_players = [p for p in game_state.get_alive_players() if p.id != seer.id]
+        targets = self.context_builder.fit_target_list(alive_players, lambda p: f"- {p.name}", compact=lambda p: p.name)
         
         return f"""现在是第{game_state.round_number}天晚上。
                   你需要选择一名玩家查验身份。
-                  {'已查验过的玩家：' + '、'.join(checked_players) if checked_players else '还没有查验过任何玩家。'}
+                  {'已查验过的玩家：' + checked if checked_players else '还没有查验过任何玩家。'}
                   
                   可选择的目标：
-                  {chr(10).join([f"- {p.name}" for p in alive_players])}
+                  {targets}
                   
-                  请用以下格式返回（返回玩家名字）：
+                  请用以下格式返回（返回玩家名字，名单只列出ID时返回数字ID）：
                   {{"type": "check", "target_id": "玩家名字"}}
                   
                   示例：{{"type": "check", "target_id": "张三"}}"""
 
-    def _build_witch_prompt(self, game_state: GameState) -> str:
+    def _build_witch_prompt(self, game_state: GameState, witch: Player) -> str:
         """构建女巫夜晚行动提示词"""
-        # 获取当前女巫
-        witch = next((p for p in game_state.get_alive_players() 
-                     if p.role.role_type == RoleType.WITCH), None)
-        if not witch:
-            print("[DEBUG] 未找到存活的女巫")
-            return ""
-            
         # 获取今晚狼人击杀的目标（只有女巫能看到）
         killed_player = game_state.get_killed_player(witch.id)
         # 获取女巫药水使用情况（只有女巫能看到）
@@ -632,7 +627,7 @@ class APIController:
                 # 添加自救规则说明
                 is_self = killed_player.id == witch.id
                 if is_self:
-                    if self.game_state.round_number == 0:
+                    if game_state.round_number == 0:
                         prompt += f"今晚你被狼人杀害了。这是第一夜，你可以使用解药自救。\n"
                     else:
                         prompt += f"今晚你被狼人杀害了，但你不能在第一夜之后自救。\n"
@@ -648,7 +643,8 @@ class APIController:
             # 添加存活玩家列表供选择
             alive_players = [p for p in game_state.get_alive_players() if p.id != witch.id]
             prompt += "可选择的毒药目标：\n"
-            prompt += "\n".join([f"- {p.name} (ID: {p.id})" for p in alive_players]) + "\n"
+            prompt += self.context_builder.fit_target_list(alive_players, lambda p: f"- {p.name} (ID: {p.id})",
+                                                           compact=lambda p: f"{p.name}({p.id})") + "\n"
         else:
             prompt += "你已经用掉了毒药。\n"
             
@@ -661,6 +657,25 @@ class APIController:
         print(f"[DEBUG] 生成的女巫提示词:\n{prompt}")
         return prompt
 
+    def _build_guard_prompt(self, game_state: GameState, guard: Player) -> str:
+        """构建守卫夜晚守护提示词"""
+        last_target = game_state.get_player_by_id(game_state.get_guard_target(guard.id))
+        alive_players = [p for p in game_state.get_alive_players() if not last_target or p.id != last_target.id]
+        targets = self.context_builder.fit_target_list(alive_players, lambda p: f"- {p.name} (ID: {p.id})",
+                                                       compact=lambda p: f"{p.name}({p.id})")
+        
+        return f"""现在是第{game_state.round_number + 1}天晚上。
+                  你需要选择一名玩家守护，被守护的玩家今晚不会被狼人杀害。
+                  {f'昨晚你守护了{last_target.name}，今晚不能连续守护同一人。' if last_target else ''}
+                  
+                  可选择的目标（可以守护自己）：
+                  {targets}
+                  
+                  请用以下格式返回JSON（一定要返回数字ID）：
+                  {{"type": "protect", "target_id": 玩家ID}}
+                  
+                  示例：{{"type": "protect", "target_id": 1}}"""
+
     def _build_discussion_prompt(self, game_state: GameState, player: Player) -> str:
         """构建白天讨论提示词"""
         
@@ -693,7 +708,8 @@ class APIController:
         """构建投票阶段提示词"""
         # 获取存活玩家列表及其ID
         alive_players = game_state.get_alive_players()
-        player_info = "\n".join([f"- {p.name} (ID: {p.id})" for p in alive_players])
+        player_info = self.context_builder.fit_target_list(alive_players, lambda p: f"- {p.name} (ID: {p.id})",
+                                                           compact=lambda p: f"{p.name}({p.id})")
         
         return f"""现在是第{game_state.round_number}天的投票阶段。
                   存活玩家列表：
@@ -720,20 +736,25 @@ class APIController:
             # 获取其他狼人信息（只有当前狼人能看到）
             other_werewolves = game_state.get_werewolf_teammates(player.id)
             if other_werewolves:
-                return f"你的狼人同伴：{', '.join([w.name for w in other_werewolves])}"
+                return f"你的狼人同伴：{self.context_builder.fit_player_list(other_werewolves, lambda w: w.name, ', ')}"
         elif player.role.role_type == RoleType.WITCH:
             # 获取药水使用情况（只有女巫能看到）
             potions = game_state.get_witch_potions(player.id)
             return f"解药{'已用' if not potions['save'] else '未用'}，毒药{'已用' if not potions['poison'] else '未用'}"
+        elif player.role.role_type == RoleType.GUARD:
+            # 获取上一晚的守护对象（只有守卫能看到）
+            last_target = game_state.get_player_by_id(game_state.get_guard_target(player.id))
+            if last_target:
+                return f"上一晚守护了 {last_target.name}"
         return "" 
 
     async def _handle_werewolf_discussion(self, werewolves: List[Player], game_state: GameState) -> List[str]:
         """处理狼人夜间讨论"""
         discussions = []
         for wolf in werewolves:
-            context = self._build_game_context(game_state, wolf)
             prompt = self._build_werewolf_discussion_prompt(game_state, discussions)
-            response = await self._call_api(prompt, context, wolf)
+            context = self._build_game_context(game_state, wolf, prompt)
+            response = await self._call_api(prompt, context, wolf, game_state)
             
             try:
                 # 解析讨论内容
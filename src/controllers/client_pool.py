@@ -0,0 +1,94 @@
+from typing import Dict, Optional, Tuple
+from openai import AsyncOpenAI
+import asyncio
+
+def evict_closed_loops(per_loop: Dict[asyncio.AbstractEventLoop, Dict]):
+    """删除已关闭的事件循环的条目（它们持有的客户端、信号量已无法再使用）"""
+    for loop in [loop for loop in per_loop if loop.is_closed()]:
+        del per_loop[loop]
+
+
+class Endpoint:
+    """一个 API 端点的共享客户端
+
+    同一端点的所有玩家、所有对局共用一个 AsyncOpenAI 客户端（即同一个连接池），
+    并用信号量限制同时在途的请求数，从而限制连接数。
+    """
+
+    def __init__(self, client: AsyncOpenAI, max_connections: int):
+        self.client = client
+        self.max_connections = max_connections
+        self.slots = asyncio.Semaphore(max_connections)
+
+
+class PlayerSession:
+    """玩家的逻辑会话，只记录玩家与共享端点的对应关系，不持有独立连接"""
+
+    def __init__(self, player_id: int, endpoint: Endpoint):
+        self.player_id = player_id
+        self.endpoint = endpoint
+        self.request_count = 0
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        return self.endpoint.client
+
+
+class ClientPool:
+    """按端点共享、有上限的客户端连接池"""
+
+    def __init__(self, max_connections: int = 16, timeout: float = 120.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        # 事件循环 -> (base_url, api_key) -> 创建端点的任务；连接与事件循环绑定，不能跨循环复用，
+        # 循环关闭后（如每次 asyncio.run 结束）其条目在下一个新循环首次使用时被清除
+        self._endpoints: Dict[asyncio.AbstractEventLoop, Dict[Tuple[str, Optional[str]], asyncio.Task]] = {}
+
+    async def get_endpoint(self, base_url: str, api_key: Optional[str]) -> Endpoint:
+        """获取端点，首次使用时创建共享客户端"""
+        loop = asyncio.get_running_loop()
+        endpoints = self._endpoints.get(loop)
+        if endpoints is None:
+            evict_closed_loops(self._endpoints)
+            endpoints = self._endpoints[loop] = {}
+        key = (base_url, api_key)
+        task = endpoints.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception())):
+            # 客户端构造（加载证书等）是同步的，放到线程中完成，避免阻塞事件循环
+            task = loop.create_task(self._create_endpoint(base_url, api_key))
+            endpoints[key] = task
+        return await asyncio.shield(task)
+
+    async def _create_endpoint(self, base_url: str, api_key: Optional[str]) -> Endpoint:
+        client = await asyncio.to_thread(
+            AsyncOpenAI,
+            base_url=base_url,
+            api_key=api_key,
+            timeout=self.timeout,
+            max_retries=0  # 重试由 APIController 统一退避，避免客户端内部再各自重试
+        )
+        return Endpoint(client, self.max_connections)
+
+    async def warm_up(self, base_url: str, api_key: Optional[str], connections: int = 1):
+        """预热连接：提前完成 TCP/TLS 握手，让第一晚的决策不必等待建连"""
+        endpoint = await self.get_endpoint(base_url, api_key)
+        connections = max(1, min(connections, endpoint.max_connections))
+
+        async def ping():
+            async with endpoint.slots:
+                await endpoint.client.models.list()
+
+        results = await asyncio.gather(*(ping() for _ in range(connections)), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            print(f"[API] 连接预热失败 {len(errors)}/{connections}: {errors[0]}")
+
+    async def close(self):
+        """关闭当前事件循环上的所有客户端"""
+        for task in self._endpoints.pop(asyncio.get_running_loop(), {}).values():
+            if task.done() and not task.cancelled() and not task.exception():
+                await task.result().client.close()
+
+
+# 进程内所有 APIController 默认共享的连接池
+shared_pool = ClientPool()
@@ -0,0 +1,182 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import re
+from ..models.game_log import GameEvent, GameEventType
+from ..models.game_state import GameState
+from ..models.player import Player
+
+_CJK = re.compile(r"[\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef\u3000-\u303f]")
+
+def estimate_tokens(text: str) -> int:
+    """在本地估算文本的 token 数
+
+    不依赖具体模型的分词器：中文字符和全角标点按每字 1 个 token 计，
+    其余字符按每 4 个 1 个 token 计，估算值略偏保守。
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def format_id_ranges(ids) -> str:
+    """把玩家 ID 压缩成区间，例如 [1, 2, 3, 5, 7, 8] -> "1-3, 5, 7-8"，不丢弃任何 ID"""
+    ranges: List[str] = []
+    ordered = sorted(ids)
+    start = 0
+    for i in range(1, len(ordered) + 1):
+        if i == len(ordered) or ordered[i] != ordered[i - 1] + 1:
+            first, last = ordered[start], ordered[i - 1]
+            ranges.append(str(first) if first == last else f"{first}-{last}")
+            start = i
+    return ", ".join(ranges)
+
+# 不放进上下文的事件：游戏开始和阶段切换本身没有信息量
+_SKIPPED_EVENTS = {GameEventType.GAME_START, GameEventType.PHASE_CHANGE}
+_VOTE_EVENTS = {GameEventType.PLAYER_VOTE, GameEventType.VOTE_RESULT}
+
+class GameContext:
+    """一次构建出的上下文及其 token 用量
+
+    history 是按时间顺序的游戏进程（只在末尾追加，适合放在提示词的稳定前缀里），
+    state 是回合数、存活玩家、私密信息等每次都可能变化的当前状态。
+    """
+
+    def __init__(self, state: str, history: str, tokens: int, budget: int, included: int, dropped: int,
+                 reserved: int = 0):
+        self.state = state
+        self.history = history
+        self.text = state + ("\n- 历史记录:\n" + history if history else "")
+        self.tokens = tokens  # 上下文实际使用的 token 数（估算）
+        self.reserved = reserved  # 提示词中上下文以外的固定部分占用的 token 数，与 tokens 合计不超过 budget
+        self.budget = budget
+        self.included = included  # 放入上下文的历史事件数
+        self.dropped = dropped  # 因超出预算被舍弃的历史事件数
+
+    def __str__(self) -> str:
+        return self.text
+
+class ContextBuilder:
+    """按 token 预算从 GameLog 构建玩家的游戏上下文
+
+    max_tokens 是整条提示词的预算：构建时传入 reserved_tokens（系统提示词、标题和决策指令等固定部分），
+    剩下的才分给当前状态和历史事件。
+    优先级从高到低：角色私密信息、本回合发言、最近的投票（或已结束回合的摘要）、更早的历史。
+    同一优先级内越新的事件越优先；最终放入的事件按发生顺序排列。
+    use_summaries 时，已有摘要的回合用一行摘要代替该回合的全部公开事件，原文只保留当前回合。
+    说明性的玩家列表（狼人同伴、已查验玩家等）不超过 max_list_tokens；行动的候选目标放不下时压缩成 ID 区间，
+    每名候选玩家都保留在提示词里。
+    """
+
+    def __init__(self, max_tokens: int = 2500, count_tokens: Callable[[str], int] = estimate_tokens,
+                 use_summaries: bool = True, max_list_tokens: int = 300):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.use_summaries = use_summaries
+        self.max_list_tokens = max_list_tokens
+
+    def fit_player_list(self, players: List[Player], render: Callable[[Player], str], separator: str = "\n",
+                        compact: Optional[Callable[[Player], str]] = None) -> str:
+        """把玩家列表渲染为不超过 max_list_tokens 的文本
+
+        放得下时按 render 和 separator 原样输出；放不下时改用 compact 的紧凑格式排成一行，
+        仍然放不下就只保留前面的玩家并注明总人数。只用于说明性的列表，行动的候选目标用 fit_target_list。
+        """
+        text = separator.join(render(p) for p in players)
+        if self.count_tokens(text) <= self.max_list_tokens:
+            return text
+        items = [(compact or render)(p) for p in players]
+        text = "、".join(items)
+        if self.count_tokens(text) <= self.max_list_tokens:
+            return text
+        suffix = f"……（共{len(players)}人）"
+        budget = self.max_list_tokens - self.count_tokens(suffix)
+        kept: List[str] = []
+        for item in items:
+            cost = self.count_tokens(item) + 1  # 加上分隔符
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append(item)
+        return "、".join(kept) + suffix
+
+    def fit_target_list(self, players: List[Player], render: Callable[[Player], str], separator: str = "\n",
+                        compact: Optional[Callable[[Player], str]] = None) -> str:
+        """把行动的候选目标渲染为文本，从不截断
+
+        放得下 max_list_tokens 时按 render 或 compact 输出；放不下时压缩成 ID 区间（如 "玩家ID: 1-7, 9, 12-30"），
+        每名候选玩家都仍然可以被选中。
+        """
+        text = separator.join(render(p) for p in players)
+        if self.count_tokens(text) <= self.max_list_tokens:
+            return text
+        if compact:
+            text = "、".join(compact(p) for p in players)
+            if self.count_tokens(text) <= self.max_list_tokens:
+                return text
+        return f"玩家ID: {format_id_ranges(p.id for p in players)}"
+
+    @staticmethod
+    def format_event(event: GameEvent) -> str:
+        return f"[第{event.round + 1}天] {event.text}"
+
+    @staticmethod
+    def format_summary(round_number: int, summary: str) -> str:
+        return f"[第{round_number + 1}天摘要] {summary}"
+
+    def build(self, game_state: GameState, player: Player, private_info: str = "",
+              reserved_tokens: int = 0) -> GameContext:
+        alive_names = [p.name for p in game_state.get_alive_players()]
+        alive = str(alive_names)
+        if self.count_tokens(alive) > self.max_list_tokens:
+            alive = self.fit_target_list(game_state.get_alive_players(), lambda p: p.name, "、")
+        state = (
+            "当前游戏状态:\n"
+            f"- 回合数: {game_state.round_number}\n"
+            f"- 存活玩家: {alive}\n"
+            f"- 你的角色: {player.role.role_type.value}"
+        )
+        if private_info:
+            state += f"\n- 你的私密信息: {private_info}"
+        used = reserved_tokens + self.count_tokens(state)
+
+        game_log = game_state.game_log
+        events: List[GameEvent] = []
+        if game_log is not None:
+            events, _ = game_log.events_since(0, player.id)
+
+        # 每个候选项是 (排序用的事件序号, 文本)
+        private: List[Tuple[int, str]] = []
+        speeches: List[Tuple[int, str]] = []
+        votes: List[Tuple[int, str]] = []
+        older: List[Tuple[int, str]] = []
+        summarized: Dict[int, int] = {}  # 已用摘要代替的回合 -> 该回合最后一个事件的序号
+        for event in events:
+            if event.event_type in _SKIPPED_EVENTS:
+                continue
+            if not event.public:
+                private.append((event.seq, self.format_event(event)))
+            elif (self.use_summaries and event.round < game_state.round_number
+                  and game_log.get_round_summary(event.round) is not None):
+                summarized[event.round] = event.seq
+            elif event.event_type == GameEventType.PLAYER_SPEAK and event.round == game_state.round_number:
+                speeches.append((event.seq, self.format_event(event)))
+            elif event.event_type in _VOTE_EVENTS:
+                votes.append((event.seq, self.format_event(event)))
+            else:
+                older.append((event.seq, self.format_event(event)))
+        summaries = [(seq, self.format_summary(round_number, game_log.get_round_summary(round_number)))
+                     for round_number, seq in summarized.items()]
+
+        selected: List[Tuple[int, str]] = []
+        dropped = 0
+        for group in (private, speeches, votes + summaries, older):
+            group.sort()
+            for i, item in enumerate(reversed(group)):
+                cost = self.count_tokens(item[1]) + 1  # 加上换行
+                if used + cost > self.max_tokens:
+                    dropped += len(group) - i
+                    break
+                used += cost
+                selected.append(item)
+
+        selected.sort()
+        history = "\n".join(line for _, line in selected)
+        tokens = self.count_tokens(state) + self.count_tokens(history)
+        return GameContext(state, history, tokens, self.max_tokens, len(selected), dropped, reserved_tokens)
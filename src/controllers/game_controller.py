@@ -1,31 +1,114 @@
-from typing import List, Optional, Dict, Tuple
+from typing import Any, Awaitable, Callable, List, Optional, Dict, Tuple, Union
 from ..models.game_state import GameState, GamePhase, WinningTeam
 from ..models.player import Player
-from ..models.role import Role, RoleType
-from ..models.game_log import GameLog, GameEvent, GameEventType
+from ..models.role import DECK_ORDER, Role, RoleType, build_roles, default_role_counts, validate_role_counts
+from ..models.game_log import GameLog, GameEvent, GameEventType, PHASE_NAMES
+from .agent_backend import AgentBackend
 from .api_controller import APIController
+from .action_scheduler import ActionScheduler
+from .game_store import GameStore
+from .log_writer import BufferedLogWriter
+from .metrics import MetricsRegistry, shared_metrics
+from .tracing import Tracer, current_span, span, traced
+from .round_summary import RoundSummarizer
 import random
 import asyncio
+import json
+import os
+import time
+import uuid
 from datetime import datetime
 
+branch_metrics = MetricsRegistry()  # 分支对局的阶段耗时和结果单独记录，不混进真实对局的指标
+
+# 狼人夜晚的决策方式：individual 每匹狼各自决策后按票数决定击杀目标，
+# joint 由决策后端一次给出全队的讨论和最终目标（后端不支持时退回 individual）
+WEREWOLF_MODES = ("individual", "joint")
+
+def _write_json_files(files: List[Tuple[str, Any, Optional[int]]]):
+    """把 (路径, 数据, 缩进) 逐个写成 JSON 文件"""
+    for path, data, indent in files:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+
 class GameController:
-    def __init__(self, game_state: Optional[GameState] = None, api_controller: Optional[APIController] = None):
+    def __init__(self, game_state: Optional[GameState] = None, api_controller: Optional[AgentBackend] = None,
+                 decision_concurrency: int = 1, discussion_delay: float = 1.0, headless: bool = False,
+                 rng: Optional[random.Random] = None, structured_log: bool = False,
+                 round_summarizer: Optional[RoundSummarizer] = None, metrics: Optional[MetricsRegistry] = None,
+                 tracer: Optional[Tracer] = None, log_dir: Optional[str] = None, game_id: Optional[str] = None,
+                 store: Optional[GameStore] = None, role_counts: Optional[Dict[RoleType, int]] = None,
+                 werewolf_mode: str = "individual"):
+        if werewolf_mode not in WEREWOLF_MODES:
+            raise ValueError(f"未知的狼人决策方式: {werewolf_mode}，可选: {', '.join(WEREWOLF_MODES)}")
         self.game_state = game_state or GameState()
-        self.game_log = GameLog()
+        # 传入的状态已经关联了日志（例如 GameState.fork() 的分支）时沿用它
+        self.game_log = self.game_state.game_log if self.game_state.game_log is not None else GameLog()
+        self.game_state.game_log = self.game_log
         self.api_controller = api_controller or APIController()
         self.game_output_file = None
+        # 无界面模式：不创建日志文件，也不写任何主持人日志，用于大规模模拟
+        self.headless = headless
+        # 角色分配和平票抽签使用的随机数；传入固定种子的 Random 可以完整复现一局，默认沿用全局 random
+        self.rng = rng or random
+        # 是否在文本日志旁另写一份 JSONL 结构化事件日志
+        self.structured_log = structured_log
+        # 日志文件所在目录（默认当前目录）和对局编号；同一秒内开始的多局游戏靠对局编号区分日志文件
+        self.log_dir = log_dir
+        self.game_id = game_id
+        # 可选的持久化事件存储：事件实时追加，每个阶段结束保存快照，中断的对局可以用 resume() 接着跑
+        self.store = store
+        # 角色配置（角色 -> 数量），None 时按玩家人数使用 default_role_counts
+        self.role_counts = role_counts
+        self.werewolf_mode = werewolf_mode
+        if store is not None and game_id is None:
+            self.game_id = uuid.uuid4().hex[:12]
+        self.game_log.add_listener(self._record_event)
+        # 每回合结束时把本回合的公开事件压缩成摘要，之后的提示词用摘要代替原文；
+        # 无界面模式的规则策略不读提示词，除非显式传入，否则不生成摘要
+        if round_summarizer is None and not headless:
+            round_summarizer = RoundSummarizer()
+        self.round_summarizer = round_summarizer
+        # 各阶段耗时和对局结果；本局的注册表只含本局的数据，同时转记到 metrics（默认进程共享的注册表）。
+        # 开启结构化日志时，游戏结束会把本局的指标另存为 JSON
+        self.metrics = MetricsRegistry(parent=metrics or shared_metrics)
+        self.api_controller.bind_metrics(self.metrics)
+        self._phase_seconds = self.metrics.histogram(
+            "werewolf_game_phase_seconds", "每个游戏阶段的耗时", ("phase",))
+        self._games_finished = self.metrics.counter(
+            "werewolf_games_total", "结束的对局数", ("winning_team",))
+        # 可选的追踪：一局一个 game span，其下是各阶段、角色行动、每次决策和每次 LLM 请求
+        self.tracer = tracer
+        self._game_span = None
+        # 同时进行的独立决策数量上限（投票、狼人击杀），1 表示逐个顺序决策
+        self.decision_concurrency = decision_concurrency
+        # 讨论阶段每次发言后的停顿秒数，模拟真实对话节奏；重放和模拟时设为 0
+        self.discussion_delay = discussion_delay
         
     async def initialize_game(self, player_names: List[str]):
         """初始化游戏，分配角色"""
+        role_counts = self.role_counts or default_role_counts(len(player_names))
+        validate_role_counts(role_counts, len(player_names))
+        
         # 重置游戏状态
         self.game_state.reset()
+        if self.tracer:
+            if self._game_span:
+                self._game_span.end()
+            self._game_span = self.tracer.start_span("game", players=len(player_names))
         
         # 创建游戏日志文件
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.game_output_file = open(f"game_log_{timestamp}.txt", "w", encoding="utf-8")
+        self._close_log()
+        if not self.headless:
+            base = self._log_base_path()
+            jsonl_path = base + ".jsonl" if self.structured_log else None
+            self.game_output_file = BufferedLogWriter(base + ".txt", jsonl_path)
+        
+        if self.store:
+            self.store.create_game(self.game_id)
         
         # 生成角色
-        roles = self._generate_roles()
+        roles = self._generate_roles(role_counts)
         
         # 分配角色给玩家
         for i, name in enumerate(player_names):
@@ -33,6 +116,9 @@ class GameController:
             player = Player(i + 1, name, role)  # 使用1-based的玩家ID
             self.game_state.add_player(player)
         
+        # 预热连接，避免第一晚的决策等待建连
+        await self.api_controller.warm_up(len(player_names))
+        
         # 记录游戏开始事件
         self.game_log.add_event(GameEvent(
             GameEventType.GAME_START,
@@ -42,47 +128,214 @@ class GameController:
             }
         ))
         
-        # 按阵营分组显示玩家角色
-        werewolves = [p for p in self.game_state.players if p.role.role_type == RoleType.WEREWOLF]
-        villagers = [p for p in self.game_state.players if p.role.role_type == RoleType.VILLAGER]
-        seer = next((p for p in self.game_state.players if p.role.role_type == RoleType.SEER), None)
-        witch = next((p for p in self.game_state.players if p.role.role_type == RoleType.WITCH), None)
-        hunter = next((p for p in self.game_state.players if p.role.role_type == RoleType.HUNTER), None)
-        
-        self.write_to_log("=== 游戏开始 ===")
-        self.write_to_log("\n角色分配：")
-        self.write_to_log(f"狼人阵营: {', '.join(w.name for w in werewolves)}")
-        self.write_to_log(f"普通村民: {', '.join(v.name for v in villagers)}")
-        self.write_to_log(f"预言家: {seer.name}")
-        self.write_to_log(f"女巫: {witch.name}")
-        self.write_to_log(f"猎人: {hunter.name}")
-        
-        self.write_to_log("\n玩家ID对照表：")
-        for player in self.game_state.players:
-            self.write_to_log(f"{player.name}: ID={player.id}, 角色={player.role.role_type.value}")
+        if not self.headless:
+            # 按阵营分组显示玩家角色
+            labels = {RoleType.WEREWOLF: "狼人阵营", RoleType.VILLAGER: "普通村民"}
+            self.write_to_log("=== 游戏开始 ===")
+            self.write_to_log("\n角色分配：")
+            for role_type in DECK_ORDER:
+                players = self.game_state.get_players_by_role(role_type)
+                if players:
+                    self.write_to_log(f"{labels.get(role_type, role_type.value)}: {', '.join(p.name for p in players)}")
+            
+            self.write_to_log("\n玩家ID对照表：")
+            for player in self.game_state.players:
+                self.write_to_log(f"{player.name}: ID={player.id}, 角色={player.role.role_type.value}")
         
         self.write_to_log("=" * 30 + "\n")
+        self._save_snapshot()
+    
+    async def resume(self) -> bool:
+        """从事件存储恢复一局中断的游戏，之后照常调用 next_phase() 继续
+
+        读取最新的阶段快照恢复 GameState、随机数、决策后端的记忆和回合摘要，
+        快照之前的事件直接载入日志，不重新执行（读取和载入的耗时与对局长短成正比）；
+        快照之后没跑完的阶段的事件丢弃，由接下来的 next_phase() 重跑。
+        需要在新建的 GameController 上调用（game_id 与中断的对局相同）。没有可用的快照时返回 False。
+        """
+        if not self.store:
+            return False
+        # 查询要等事件存储的写线程处理完排队的写入，放到线程池中等待，不阻塞其他对局
+        snapshot = await asyncio.to_thread(self.store.latest_snapshot, self.game_id)
+        if snapshot is None:
+            return False
+        state = snapshot["state"]
+        self.store.truncate_events(self.game_id, snapshot["event_count"])
+        self.game_state.load_state(state["game"])
+        events = await asyncio.to_thread(self.store.load_events, self.game_id, snapshot["event_count"])
+        self.game_log.load_events(events)
+        for round_number, summary in state["round_summaries"].items():
+            self.game_log.set_round_summary(int(round_number), summary)
+        version, internal, gauss_next = state["rng"]
+        self.rng.setstate((version, tuple(internal), gauss_next))
+        self.api_controller.set_state(state["agent"])
+        
+        if self.tracer:
+            if self._game_span:
+                self._game_span.end()
+            self._game_span = self.tracer.start_span("game", players=len(self.game_state.players), resumed=True)
+        self._close_log()
+        if not self.headless:
+            base = self._log_base_path()
+            jsonl_path = base + ".jsonl" if self.structured_log else None
+            self.game_output_file = BufferedLogWriter(base + ".txt", jsonl_path)
+        phase = self.game_state.current_phase.value
+        self.write_to_log(f"=== 对局 {self.game_id} 从第{self.game_state.round_number + 1}回合"
+                          f"{PHASE_NAMES.get(phase, phase)}阶段恢复，已载入 {len(self.game_log)} 条事件 ===\n")
+        
+        await self.api_controller.warm_up(len(self.game_state.players))
+        return True
+    
+    def _save_snapshot(self):
+        """在阶段边界保存快照（连同之前攒着的事件一起提交）"""
+        if not self.store:
+            return
+        self.store.save_snapshot(self.game_id, self.game_state.phase_index, len(self.game_log), {
+            "game": self.game_state.dump_state(),
+            "rng": self.rng.getstate(),
+            "agent": self.api_controller.get_state(),
+            "round_summaries": self.game_log.get_round_summaries()
+        })
+    
+    def fork(self, api_controller: Optional[AgentBackend] = None,
+             rng: Optional[random.Random] = None) -> "GameController":
+        """在阶段边界分出一局无界面的分支对局，用于前瞻搜索和反事实推演
+
+        状态按写时复制分支（见 GameState.fork），分支之后的推进不影响本局。
+        默认复制当前的随机数状态和决策后端的记忆（AgentBackend.fork），不做任何干预时分支会和本局走出完全相同的结果；
+        传入不同的 rng 得到不同的后续。分支不写日志文件、事件存储和追踪。
+        """
+        if rng is None:
+            rng = random.Random()
+            rng.setstate(self.rng.getstate())
+        return GameController(
+            game_state=self.game_state.fork(),
+            api_controller=api_controller or self.api_controller.fork(rng),
+            discussion_delay=0,
+            headless=True,
+            rng=rng,
+            metrics=branch_metrics,
+            **self.branch_settings()
+        )
+
+    def branch_settings(self) -> Dict[str, Any]:
+        """分支沿用的对局设置（GameController 的构造参数），在其他进程中重建分支时也要一并带上"""
+        return {
+            "decision_concurrency": self.decision_concurrency,
+            "round_summarizer": self.round_summarizer,
+            "role_counts": self.role_counts,
+            "werewolf_mode": self.werewolf_mode
+        }
+    
+    def _log_base_path(self) -> str:
+        """日志文件路径（不含扩展名）：[log_dir/]game_log_<时间戳>[_<对局编号>]"""
+        name = f"game_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if self.game_id:
+            name += f"_{self.game_id}"
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+            return os.path.join(self.log_dir, name)
+        return name
     
     def write_to_log(self, message: str):
-        """写入日志文件"""
+        """写入日志文件（写入缓冲，由后台线程和阶段结束时的 flush 落盘）"""
         if self.game_output_file:
             self.game_output_file.write(message + "\n")
+    
+    def _record_event(self, event: GameEvent):
+        """把游戏事件写入事件存储和结构化日志"""
+        if self.store:
+            self.store.append_event(self.game_id, event)
+        if isinstance(self.game_output_file, BufferedLogWriter):
+            record = event.to_dict()
+            record["seq"] = event.seq
+            record["round"] = self.game_state.round_number
+            self.game_output_file.write_record(record)
+    
+    async def _flush_log(self):
+        """阶段结束时把缓冲的日志写入文件，不阻塞事件循环"""
+        if isinstance(self.game_output_file, BufferedLogWriter):
+            await self.game_output_file.flush_async()
+        elif self.game_output_file:
             self.game_output_file.flush()
+    
+    async def _dump_metrics(self):
+        """开启结构化日志时，把指标快照（和追踪）写到日志文件旁
+
+        game_log_*.metrics.json 是指标，game_log_*.trace.json 是 Chrome trace 格式的追踪。
+        快照在事件循环上生成（其他对局可能正在写入同一个追踪器），文件在线程池中写入。
+        """
+        if self.structured_log and isinstance(self.game_output_file, BufferedLogWriter):
+            base = self.game_output_file.name.rsplit(".", 1)[0]
+            files = [(base + ".metrics.json", self.metrics.to_dict(), 2)]
+            if self.tracer:
+                files.append((base + ".trace.json", self.tracer.to_chrome_trace(), None))
+            try:
+                await asyncio.to_thread(_write_json_files, files)
+            except OSError as e:
+                print(f"[LOG] 指标写入失败: {str(e)}")
+    
+    def close(self):
+        """提前结束本局（例如被取消）时释放资源：提交事件存储、关闭日志文件并结束 game span"""
+        if self.store:
+            self.store.flush()
+        if self._game_span:
+            self._game_span.end()
+            self._game_span = None
+        self._close_log()
+    
+    def _close_log(self):
+        """写完并关闭日志文件"""
+        if self.game_output_file:
+            self.game_output_file.close()
+            self.game_output_file = None
+
+    async def _close_log_async(self):
+        """在线程池中写完并关闭日志文件，不阻塞事件循环"""
+        output, self.game_output_file = self.game_output_file, None
+        if isinstance(output, BufferedLogWriter):
+            await output.close_async()
+        elif output:
+            output.close()
             
-    def _generate_roles(self) -> List[Role]:
-        """生成角色分配"""
-        roles = [
-            Role(RoleType.WEREWOLF) for _ in range(3)  # 3个狼人
-        ] + [
-            Role(RoleType.VILLAGER) for _ in range(3)  # 3个平民
-        ] + [
-            Role(RoleType.SEER),     # 预言家
-            Role(RoleType.WITCH),    # 女巫
-            Role(RoleType.HUNTER)    # 猎人
-        ]
-        random.shuffle(roles)
+    def _generate_roles(self, role_counts: Dict[RoleType, int]) -> List[Role]:
+        """按角色配置生成角色并洗牌"""
+        roles = build_roles(role_counts)
+        self.rng.shuffle(roles)
         return roles
         
+    async def _gather_decisions(self, players: List[Player],
+                                decide: Callable[[Player, GameState], Awaitable[Any]]) -> List[Any]:
+        """收集一组彼此独立的决策，结果按 players 的顺序返回
+
+        并发模式下所有玩家看到同一份冻结的游戏状态快照，
+        同时进行的决策数不超过 decision_concurrency。
+        """
+        if self.decision_concurrency <= 1:
+            return [await self._decide(decide, player, self.game_state) for player in players]
+        
+        view = self.game_state.snapshot()
+        semaphore = asyncio.Semaphore(self.decision_concurrency)
+        
+        async def run(player: Player):
+            async with semaphore:
+                return await self._decide(decide, view.get_player_by_id(player.id), view)
+        
+        return await asyncio.gather(*(run(player) for player in players))
+    
+    @staticmethod
+    async def _decide(decide: Callable[[Any, GameState], Awaitable[Any]], player: Union[Player, List[Player]],
+                      game_state: GameState):
+        """让一名玩家（或整个狼人队伍）做一次决策（开启追踪时记录为一个 span）"""
+        if current_span() is None:
+            return await decide(player, game_state)
+        if isinstance(player, Player):
+            attributes = {"player": player.name, "role": player.role.role_type.value}
+        else:
+            attributes = {"wolves": len(player)}
+        with span(decide.__name__, **attributes):
+            return await decide(player, game_state)
+    
     async def run_night_phase(self):
         """运行夜晚阶段"""
         self.write_to_log(f"\n=== 第{self.game_state.round_number + 1}天夜晚 ===")
@@ -91,156 +344,34 @@ class GameController:
             {"phase": "night", "round": self.game_state.round_number}
         ))
         
-        # 记录夜晚开始时的死亡玩家列表
-        initial_dead_players = set(p.id for p in self.game_state.players if not p.is_alive)
+        # 记录夜晚开始时的存活玩家列表
+        initial_alive_players = self.game_state.get_alive_players()
         
-        # 狼人行动
-        werewolves = [p for p in self.game_state.players if p.role.role_type == RoleType.WEREWOLF and p.is_alive]
+        # 按依赖关系安排夜晚行动：女巫需要知道狼人的击杀目标，预言家的查验和守卫的守护与其他行动无关。
+        # 每名预言家、守卫各自行动；多名女巫依次行动（后面的女巫知道前面的是否已经救人、下毒）
+        scheduler = ActionScheduler()
+        werewolves = self.game_state.get_players_by_role(RoleType.WEREWOLF, alive_only=True)
         if werewolves:
-            self.write_to_log("\n狼人行动阶段:")
-            self.write_to_log(f"存活狼人: {', '.join(w.name for w in werewolves)}")
-            
-            # 获取每个狼人的选择
-            self.write_to_log("-> 狼人开始决定击杀目标...")
-            votes = {}
-            for wolf in werewolves:
-                self.write_to_log(f"-> {wolf.name} 正在决策中...")
-                action = await self.api_controller.generate_night_action(wolf, self.game_state)
-                if "werewolf_kill" in action and action["werewolf_kill"]["target_id"] is not None:
-                    target_id = action["werewolf_kill"]["target_id"]
-                    target = self.game_state.get_player_by_id(target_id)
-                    if target:
-                        self.write_to_log(f"-> {wolf.name} 选择击杀 {target.name}")
-                        votes[target_id] = votes.get(target_id, 0) + 1
-            
-            # 确定最终击杀目标
-            if votes:
-                max_votes = max(votes.values())
-                targets = [tid for tid, v in votes.items() if v == max_votes]
-                target_id = random.choice(targets)
-                target = self.game_state.get_player_by_id(target_id)
-                self.write_to_log(f"最终击杀目标: {target.name}")
-                # 只记录击杀目标，不立即标记死亡
-                self.game_state._night_actions["werewolf_kill"] = {"target_id": target_id}
-                self.game_state._last_night_killed = target_id
-                self.write_to_log("[DEBUG] 已记录狼人击杀目标到夜晚行动")
-            else:
-                self.write_to_log("狼人没有选择击杀目标")
-        
-        # 预言家行动
-        seer = next((p for p in self.game_state.players if p.role.role_type == RoleType.SEER and p.is_alive), None)
-        if seer:
-            self.write_to_log("\n预言家行动阶段:")
-            action = await self.api_controller.generate_night_action(seer, self.game_state)
-            if "seer_check" in action and action["seer_check"]["target_id"] is not None:
-                target_id = action["seer_check"]["target_id"]
-                target = self.game_state.get_player_by_id(target_id)
-                if target:
-                    is_werewolf = target.role.role_type == RoleType.WEREWOLF
-                    # 记录查验行为和结果到主持人日志
-                    self.write_to_log(f"预言家查验了 {target.name}，Ta是{'狼人' if is_werewolf else '好人'}")
-                    
-                    # 记录查验结果（只对预言家可见）
-                    check_result = f"你查验了 {target.name}，Ta是{'狼人' if is_werewolf else '好人'}"
-                    self.game_log.add_event(GameEvent(
-                        GameEventType.SEER_CHECK,
-                        {
-                            "player_id": seer.id,
-                            "target_id": target.id,
-                            "target_name": target.name,
-                            "role": "狼人" if is_werewolf else "好人",
-                            "message": check_result
-                        },
-                        public=False  # 查验结果是私密的
-                    ))
-                    
-                    # 记录到游戏状态
-                    self.game_state.record_night_action("seer_check", {"target_id": target.id})
-                    # 记录查验结果到游戏状态
-                    self.game_state._check_results[seer.id] = {
-                        "player": target,
-                        "role": "狼人" if is_werewolf else "好人"
-                    }
-                else:
-                    self.write_to_log("预言家选择的目标无效")
-            else:
-                self.write_to_log("预言家没有选择查验目标")
+            scheduler.add("werewolf", lambda: self._run_werewolf_action(werewolves))
         
-        # 女巫行动
-        witch = next((p for p in self.game_state.players if p.role.role_type == RoleType.WITCH and p.is_alive), None)
-        if witch:
-            self.write_to_log("\n女巫行动阶段:")
-            self.write_to_log(f"[DEBUG] 女巫信息 - ID: {witch.id}, 名字: {witch.name}")
-            
-            # 获取女巫药水状态
-            witch_potions = self.game_state.get_witch_potions(witch.id)
-            self.write_to_log(f"[DEBUG] 女巫药水状态: 解药{'可用' if witch_potions['save'] else '已用'}, 毒药{'可用' if witch_potions['poison'] else '已用'}")
-            
-            # 获取今晚被杀的玩家
-            killed_player = self.game_state.get_killed_player(witch.id)
-            self.write_to_log(f"[DEBUG] 夜晚行动记录: {self.game_state._night_actions}")
-            self.write_to_log(f"[DEBUG] 今晚被杀玩家: {killed_player.name if killed_player else '无'}")
-            
-            action = await self.api_controller.generate_night_action(witch, self.game_state)
-            if "witch_save" in action:
-                if action["witch_save"]["used"]:
-                    target_id = self.game_state._last_night_killed
-                    target = self.game_state.get_player_by_id(target_id)
-                    # 检查是否是女巫自救
-                    is_self_save = target and target.id == witch.id
-                    # 第一夜可以自救，之后不能自救
-                    if is_self_save and self.game_state.round_number > 0:
-                        self.write_to_log("女巫不能在第一夜之后自救")
-                    elif target:  # 只要目标存在就可以救
-                        self.game_state._last_night_saved = True  # 标记已被救活
-                        # 只在主持人日志中记录
-                        self.write_to_log(f"女巫使用解药救活了 {target.name}")
-                        # 记录救人结果（只对女巫可见）
-                        self.game_log.add_event(GameEvent(
-                            GameEventType.WITCH_SAVE,
-                            {
-                                "player_id": witch.id,
-                                "target_id": target_id,
-                                "target_name": target.name,
-                                "message": "你使用解药救活了一名玩家"
-                            },
-                            public=False
-                        ))
-                        # 更新女巫的药水状态
-                        self.game_state._witch_potions[witch.id]["save"] = False
-                else:
-                    self.write_to_log("女巫没有使用解药")
-            
-            if "witch_poison" in action and action["witch_poison"]["target_id"] is not None:
-                target_id = action["witch_poison"]["target_id"]
-                target = self.game_state.get_player_by_id(target_id)
-                if target and target.is_alive:
-                    # 记录毒药目标，不立即标记死亡
-                    self.game_state._last_night_poisoned = target_id
-                    # 更新女巫的毒药状态
-                    self.game_state._witch_potions[witch.id]["poison"] = False
-                    # 只在主持人日志中记录
-                    self.write_to_log(f"女巫使用毒药毒死了 {target.name}")
-                    # 记录毒人结果（只对女巫可见）
-                    self.game_log.add_event(GameEvent(
-                        GameEventType.WITCH_POISON,
-                        {
-                            "player_id": witch.id,
-                            "target_id": target_id,
-                            "target_name": target.name,
-                            "message": "你使用毒药毒死了一名玩家"
-                        },
-                        public=False
-                    ))
-            else:
-                self.write_to_log("女巫没有使用毒药")
+        for seer in self.game_state.get_players_by_role(RoleType.SEER, alive_only=True):
+            scheduler.add(f"seer_{seer.id}", lambda seer=seer: self._run_seer_action(seer))
+        
+        for guard in self.game_state.get_players_by_role(RoleType.GUARD, alive_only=True):
+            scheduler.add(f"guard_{guard.id}", lambda guard=guard: self._run_guard_action(guard))
+        
+        previous = ("werewolf",) if "werewolf" in scheduler else ()
+        for witch in self.game_state.get_players_by_role(RoleType.WITCH, alive_only=True):
+            scheduler.add(f"witch_{witch.id}", lambda witch=witch: self._run_witch_action(witch), depends_on=previous)
+            previous = (f"witch_{witch.id}",)
+        
+        await scheduler.run()
         
         # 处理夜晚新死亡的玩家
-        current_dead_players = set(p.id for p in self.game_state.players if not p.is_alive)
-        new_dead_players = [p for p in self.game_state.players if p.id in (current_dead_players - initial_dead_players)]
+        new_dead_players = [p for p in initial_alive_players if not p.is_alive]
         
-        # 如果没有被女巫救活，则标记狼人击杀的目标死亡
-        if self.game_state._last_night_killed and not self.game_state._last_night_saved:
+        # 如果没有被女巫救活、也没有被守卫守护，则标记狼人击杀的目标死亡
+        if self.game_state.is_killed_tonight():
             killed_player = self.game_state.get_player_by_id(self.game_state._last_night_killed)
             if killed_player and killed_player.is_alive:
                 killed_player.is_alive = False
@@ -259,11 +390,219 @@ class GameController:
             self.write_to_log("\n今晚死亡的玩家:")
             for player in new_dead_players:
                 self.write_to_log(f"- {player.name} ({player.role.role_type.value})")
-                await self._handle_player_death(player)
+            await self._handle_player_deaths(new_dead_players)
         else:
             self.write_to_log("\n今晚是平安夜，没有玩家死亡")
         
         self.write_to_log("=" * 30)
+        await self._flush_log()
+    
+    @traced()
+    async def _run_werewolf_action(self, werewolves: List[Player]):
+        """狼人行动：每个狼人选择目标，得票最多者为今晚的击杀目标（joint 模式下全队一次决定）"""
+        self.write_to_log("\n狼人行动阶段:")
+        self.write_to_log(f"存活狼人: {', '.join(w.name for w in werewolves)}")
+        
+        if self.werewolf_mode == "joint" and await self._run_werewolf_team_action(werewolves):
+            return
+        
+        # 获取每个狼人的选择
+        self.write_to_log("-> 狼人开始决定击杀目标...")
+        votes = {}
+        for wolf in werewolves:
+            self.write_to_log(f"-> {wolf.name} 正在决策中...")
+        actions = await self._gather_decisions(werewolves, self.api_controller.generate_night_action)
+        for wolf, action in zip(werewolves, actions):
+            if "werewolf_kill" in action and action["werewolf_kill"]["target_id"] is not None:
+                target_id = action["werewolf_kill"]["target_id"]
+                target = self.game_state.get_player_by_id(target_id)
+                if target:
+                    self.write_to_log(f"-> {wolf.name} 选择击杀 {target.name}")
+                    votes[target_id] = votes.get(target_id, 0) + 1
+        
+        # 确定最终击杀目标
+        if votes:
+            max_votes = max(votes.values())
+            targets = [tid for tid, v in votes.items() if v == max_votes]
+            target_id = self.rng.choice(targets)
+            target = self.game_state.get_player_by_id(target_id)
+            self.write_to_log(f"最终击杀目标: {target.name}")
+            # 只记录击杀目标，不立即标记死亡
+            self.game_state._night_actions["werewolf_kill"] = {"target_id": target_id}
+            self.game_state._last_night_killed = target_id
+            self.write_to_log("[DEBUG] 已记录狼人击杀目标到夜晚行动")
+        else:
+            self.write_to_log("狼人没有选择击杀目标")
+    
+    async def _run_werewolf_team_action(self, werewolves: List[Player]) -> bool:
+        """全队一次决策：记录每匹狼的发言和最终目标；后端没有给出有效目标时返回 False，改为每匹狼各自决策"""
+        self.write_to_log("-> 狼人队伍一起商量击杀目标...")
+        action = await self._decide(self.api_controller.generate_werewolf_team_action, werewolves, self.game_state)
+        
+        target_id = (action.get("werewolf_kill") or {}).get("target_id")
+        target = self.game_state.get_player_by_id(target_id) if target_id is not None else None
+        if target is None or not target.is_alive or target_id in self.game_state._werewolves:
+            self.write_to_log("狼人队伍没有给出有效的击杀目标，改为各自决策")
+            return False
+        
+        # 后端可能是第三方实现：跳过格式不对的发言，只记录这次参与决策的狼人
+        wolves_by_id = {wolf.id: wolf for wolf in werewolves}
+        for item in action.get("discussion") or []:
+            if not isinstance(item, dict):
+                continue
+            wolf = wolves_by_id.get(item.get("wolf_id"))
+            argument = item.get("argument")
+            if wolf and isinstance(argument, str):
+                self.write_to_log(f"-> {wolf.name}: {argument}")
+        self.write_to_log(f"最终击杀目标: {target.name}")
+        self.game_state._night_actions["werewolf_kill"] = {"target_id": target_id}
+        self.game_state._last_night_killed = target_id
+        return True
+    
+    @traced()
+    async def _run_seer_action(self, seer: Player):
+        """预言家行动：查验一名玩家的身份"""
+        self.write_to_log("\n预言家行动阶段:")
+        action = await self._decide(self.api_controller.generate_night_action, seer, self.game_state)
+        if "seer_check" in action and action["seer_check"]["target_id"] is not None:
+            target_id = action["seer_check"]["target_id"]
+            # LLM 后端可能返回玩家名字
+            target = self.game_state.get_player_by_id(target_id) or self.game_state.get_player_by_name(target_id)
+            if target:
+                is_werewolf = target.role.role_type == RoleType.WEREWOLF
+                # 记录查验行为和结果到主持人日志
+                self.write_to_log(f"预言家查验了 {target.name}，Ta是{'狼人' if is_werewolf else '好人'}")
+                
+                # 记录查验结果（只对预言家可见）
+                check_result = f"你查验了 {target.name}，Ta是{'狼人' if is_werewolf else '好人'}"
+                self.game_log.add_event(GameEvent(
+                    GameEventType.SEER_CHECK,
+                    {
+                        "player_id": seer.id,
+                        "target_id": target.id,
+                        "target_name": target.name,
+                        "role": "狼人" if is_werewolf else "好人",
+                        "message": check_result
+                    },
+                    public=False  # 查验结果是私密的
+                ))
+                
+                # 记录到游戏状态
+                self.game_state.record_night_action("seer_check", {"target_id": target.id, "seer_id": seer.id})
+                self.game_state._checked_players[seer.id].add(target.id)
+                # 记录查验结果到游戏状态
+                self.game_state._check_results[seer.id] = {
+                    "player": target,
+                    "role": "狼人" if is_werewolf else "好人"
+                }
+            else:
+                self.write_to_log("预言家选择的目标无效")
+        else:
+            self.write_to_log("预言家没有选择查验目标")
+    
+    @traced()
+    async def _run_witch_action(self, witch: Player):
+        """女巫行动：依赖狼人的击杀目标决定是否用药"""
+        self.write_to_log("\n女巫行动阶段:")
+        self.write_to_log(f"[DEBUG] 女巫信息 - ID: {witch.id}, 名字: {witch.name}")
+        
+        # 获取女巫药水状态
+        witch_potions = self.game_state.get_witch_potions(witch.id)
+        self.write_to_log(f"[DEBUG] 女巫药水状态: 解药{'可用' if witch_potions['save'] else '已用'}, 毒药{'可用' if witch_potions['poison'] else '已用'}")
+        
+        # 获取今晚被杀的玩家
+        killed_player = self.game_state.get_killed_player(witch.id)
+        self.write_to_log(f"[DEBUG] 夜晚行动记录: {self.game_state._night_actions}")
+        self.write_to_log(f"[DEBUG] 今晚被杀玩家: {killed_player.name if killed_player else '无'}")
+        
+        action = await self._decide(self.api_controller.generate_night_action, witch, self.game_state)
+        if "witch_save" in action:
+            if action["witch_save"]["used"]:
+                target_id = self.game_state._last_night_killed
+                target = self.game_state.get_player_by_id(target_id)
+                # 检查是否是女巫自救
+                is_self_save = target and target.id == witch.id
+                # 第一夜可以自救，之后不能自救
+                if self.game_state._last_night_saved:
+                    # 多名女巫时每晚只有一瓶解药生效
+                    self.write_to_log("今晚已经有女巫用过解药")
+                elif is_self_save and self.game_state.round_number > 0:
+                    self.write_to_log("女巫不能在第一夜之后自救")
+                elif target:  # 只要目标存在就可以救
+                    self.game_state._last_night_saved = True  # 标记已被救活
+                    # 只在主持人日志中记录
+                    self.write_to_log(f"女巫使用解药救活了 {target.name}")
+                    # 记录救人结果（只对女巫可见）
+                    self.game_log.add_event(GameEvent(
+                        GameEventType.WITCH_SAVE,
+                        {
+                            "player_id": witch.id,
+                            "target_id": target_id,
+                            "target_name": target.name,
+                            "message": "你使用解药救活了一名玩家"
+                        },
+                        public=False
+                    ))
+                    # 更新女巫的药水状态
+                    self.game_state._witch_potions[witch.id]["save"] = False
+            else:
+                self.write_to_log("女巫没有使用解药")
+        
+        if "witch_poison" in action and action["witch_poison"]["target_id"] is not None:
+            target_id = action["witch_poison"]["target_id"]
+            target = self.game_state.get_player_by_id(target_id)
+            if "witch_poison" in self.game_state._night_actions:
+                # 多名女巫时每晚只有一瓶毒药生效，没生效的毒药不消耗
+                self.write_to_log("今晚已经有女巫用过毒药")
+            elif target and target.is_alive:
+                self.game_state.record_night_action("witch_poison", {"target_id": target_id, "witch_id": witch.id})
+                # 记录毒药目标，不立即标记死亡
+                self.game_state._last_night_poisoned = target_id
+                # 更新女巫的毒药状态
+                self.game_state._witch_potions[witch.id]["poison"] = False
+                # 只在主持人日志中记录
+                self.write_to_log(f"女巫使用毒药毒死了 {target.name}")
+                # 记录毒人结果（只对女巫可见）
+                self.game_log.add_event(GameEvent(
+                    GameEventType.WITCH_POISON,
+                    {
+                        "player_id": witch.id,
+                        "target_id": target_id,
+                        "target_name": target.name,
+                        "message": "你使用毒药毒死了一名玩家"
+                    },
+                    public=False
+                ))
+        else:
+            self.write_to_log("女巫没有使用毒药")
+    
+    @traced()
+    async def _run_guard_action(self, guard: Player):
+        """守卫行动：守护一名玩家，使其今晚不被狼人杀害（不能连续两晚守护同一人）"""
+        self.write_to_log("\n守卫行动阶段:")
+        action = await self._decide(self.api_controller.generate_night_action, guard, self.game_state)
+        target_id = action.get("guard_protect", {}).get("target_id")
+        target = self.game_state.get_player_by_id(target_id) if target_id is not None else None
+        if target is None or not target.is_alive:
+            self.write_to_log("守卫没有守护任何人")
+            target_id = None
+        elif target_id == self.game_state.get_guard_target(guard.id):
+            self.write_to_log(f"守卫不能连续两晚守护 {target.name}")
+            target_id = None
+        else:
+            self.write_to_log(f"守卫守护了 {target.name}")
+            self.game_state._last_night_guarded.add(target_id)
+            self.game_log.add_event(GameEvent(
+                GameEventType.GUARD_PROTECT,
+                {
+                    "player_id": guard.id,
+                    "target_id": target_id,
+                    "target_name": target.name,
+                    "message": f"你守护了 {target.name}"
+                },
+                public=False
+            ))
+        self.game_state._guard_targets[guard.id] = target_id
     
     async def run_day_phase(self):
         """运行白天阶段"""
@@ -299,6 +638,7 @@ class GameController:
         
         # 进行讨论
         await self.run_discussion()
+        await self._flush_log()
     
     async def run_vote_phase(self):
         """运行投票阶段"""
@@ -310,8 +650,8 @@ class GameController:
         
         # 获取每个玩家的投票
         alive_players = self.game_state.get_alive_players()
-        for player in alive_players:
-            vote_response = await self.api_controller.generate_vote(player, self.game_state)
+        vote_responses = await self._gather_decisions(alive_players, self.api_controller.generate_vote)
+        for player, vote_response in zip(alive_players, vote_responses):
             target_id = None
             
             if isinstance(vote_response, dict) and vote_response.get("type") == "vote":
@@ -367,7 +707,7 @@ class GameController:
             
             # 获取并记录遗言
             self.write_to_log("\n遗言：")
-            last_words = await self.api_controller.generate_discussion(voted_player, self.game_state)
+            last_words = await self._decide(self.api_controller.generate_discussion, voted_player, self.game_state)
             self.write_to_log(f"{voted_player.name}：{last_words}")
             
             # 记录遗言事件
@@ -381,46 +721,53 @@ class GameController:
                 }
             ))
             
-            # 处理玩家死亡
+            # 处理玩家死亡（被放逐的猎人在这里开枪）
             await self._handle_player_death(voted_player)
-            
-            # 如果被放逐的是猎人，给他开枪的机会
-            if voted_player.role.role_type == RoleType.HUNTER:
-                self.write_to_log("\n猎人开枪阶段：")
-                
-                # 获取猎人的开枪目标
-                shot_target = await self.api_controller.generate_night_action(voted_player, self.game_state)
-                if "hunter_shot" in shot_target and shot_target["hunter_shot"]["target_id"] is not None:
-                    target_id = shot_target["hunter_shot"]["target_id"]
-                    if await self.handle_hunter_shot(voted_player.id, target_id):
-                        target = self.game_state.get_player_by_id(target_id)
-                        self.write_to_log(f"猎人开枪带走了 {target.name}")
         
+        self._summarize_round(self.game_state.round_number)
         self.write_to_log("=" * 30)
+        await self._flush_log()
+    
+    def _summarize_round(self, round_number: int):
+        """生成并缓存一个回合的摘要，每回合只生成一次"""
+        if self.round_summarizer and self.game_log.get_round_summary(round_number) is None:
+            summary = self.round_summarizer.summarize(self.game_log.round_events(round_number))
+            self.game_log.set_round_summary(round_number, summary)
     
     async def _handle_player_death(self, player: Player):
         """处理玩家死亡"""
-        # 记录死亡事件
-        self.game_log.add_event(GameEvent(
-            GameEventType.PLAYER_DEATH,
-            {
-                "player_id": player.id,
-                "player_name": player.name,
-                "role": player.role.role_type.value,
-                "role_revealed": True
-            }
-        ))
-        
-        # 如果是猎人，立即处理开枪
-        if player.role.role_type == RoleType.HUNTER:
-            self.write_to_log(f"\n猎人 {player.name} 开枪阶段：")
-            # 获取猎人的开枪目标
-            shot_target = await self.api_controller.generate_night_action(player, self.game_state)
-            if "hunter_shot" in shot_target and shot_target["hunter_shot"]["target_id"] is not None:
-                target_id = shot_target["hunter_shot"]["target_id"]
-                if await self.handle_hunter_shot(player.id, target_id):
-                    target = self.game_state.get_player_by_id(target_id)
-                    self.write_to_log(f"猎人开枪带走了 {target.name}")
+        await self._handle_player_deaths([player])
+    
+    async def _handle_player_deaths(self, players: List[Player]):
+        """处理一批同时死亡的玩家：先公布全部死亡，再同时处理各个猎人的开枪"""
+        scheduler = ActionScheduler()
+        for player in players:
+            # 记录死亡事件
+            self.game_log.add_event(GameEvent(
+                GameEventType.PLAYER_DEATH,
+                {
+                    "player_id": player.id,
+                    "player_name": player.name,
+                    "role": player.role.role_type.value,
+                    "role_revealed": True
+                }
+            ))
+            # 如果是猎人，安排开枪
+            if player.role.role_type == RoleType.HUNTER:
+                scheduler.add(f"hunter_shot_{player.id}", lambda hunter=player: self._run_hunter_shot(hunter))
+        await scheduler.run()
+    
+    @traced()
+    async def _run_hunter_shot(self, hunter: Player):
+        """猎人开枪行动"""
+        self.write_to_log(f"\n猎人 {hunter.name} 开枪阶段：")
+        # 获取猎人的开枪目标
+        shot_target = await self._decide(self.api_controller.generate_night_action, hunter, self.game_state)
+        if "hunter_shot" in shot_target and shot_target["hunter_shot"]["target_id"] is not None:
+            target_id = shot_target["hunter_shot"]["target_id"]
+            if await self.handle_hunter_shot(hunter.id, target_id):
+                target = self.game_state.get_player_by_id(target_id)
+                self.write_to_log(f"猎人开枪带走了 {target.name}")
     
     async def handle_hunter_shot(self, hunter_id: int, target_id: int) -> bool:
         """处理猎人开枪
@@ -517,13 +864,24 @@ class GameController:
     async def next_phase(self):
         """进入下一个游戏阶段"""
         current_phase = self.game_state.current_phase
-        
-        if current_phase == GamePhase.NIGHT:
-            await self.run_night_phase()
-        elif current_phase == GamePhase.DAY:
-            await self.run_day_phase()
-        elif current_phase == GamePhase.VOTE:
-            await self.run_vote_phase()
+        start = time.perf_counter()
+        
+        try:
+            with span(f"run_{current_phase.value}_phase", parent=self._game_span, round=self.game_state.round_number):
+                if current_phase == GamePhase.NIGHT:
+                    await self.run_night_phase()
+                elif current_phase == GamePhase.DAY:
+                    await self.run_day_phase()
+                elif current_phase == GamePhase.VOTE:
+                    await self.run_vote_phase()
+        except BaseException as e:
+            # 异常中断了本局：结束 game span 并记下原因，否则它永远不会被导出
+            if self._game_span:
+                self._game_span.error = f"{type(e).__name__}: {e}"
+                self._game_span.end()
+                self._game_span = None
+            raise
+        self._phase_seconds.labels(current_phase.value).observe(time.perf_counter() - start)
         
         # 检查游戏是否结束
         game_over, winning_team = self.game_state.check_game_over()
@@ -542,39 +900,49 @@ class GameController:
             for player in dead_players:
                 self.write_to_log(f"{player.name}({player.role.role_type.value})")
             
+            self._games_finished.labels(winning_team.value).inc()
+            if self._game_span:
+                self._game_span.set_attribute("winning_team", winning_team.value)
+                self._game_span.set_attribute("rounds", self.game_state.round_number)
+                self._game_span.end()
+                self._game_span = None
+            await self._dump_metrics()
             # 关闭日志文件
-            if self.game_output_file:
-                self.game_output_file.close()
-                self.game_output_file = None
+            await self._close_log_async()
         
         # 进入下一个阶段
         self.game_state.next_phase()
+        if self.store:
+            if self.game_state.current_phase == GamePhase.GAME_OVER:
+                self.store.mark_finished(self.game_id, self.game_state.get_game_result())
+            else:
+                self._save_snapshot()
     
     def get_player_events(self, player_id: int, start_index: int = 0) -> List[str]:
         """获取玩家可见的事件记录"""
-        self.write_to_log(f"[DEBUG] 获取玩家 {player_id} 的事件，当前事件总数: {len(self.game_log._events)}")
-        events = self.game_log.get_player_events(player_id, start_index)
-        formatted_events = [self.game_log.format_event(event) for event in events]
-        self.write_to_log(f"[DEBUG] 玩家 {player_id} 可见事件数: {len(formatted_events)}")
-        return formatted_events
+        events, _ = self.game_log.events_since(start_index, player_id)
+        return [self.game_log.format_event(event) for event in events]
     
     def get_public_events(self, start_index: int = 0) -> List[str]:
         """获取公开事件记录"""
-        events = self.game_log.get_public_events(start_index)
+        events, _ = self.game_log.events_since(start_index)
         return [self.game_log.format_event(event) for event in events]
     
+    @traced()
     async def run_discussion(self):
         """运行讨论阶段"""
         alive_players = self.game_state.get_alive_players()
         for player in alive_players:
             # 获取玩家发言
-            message = await self.api_controller.generate_discussion(player, self.game_state)
+            message = await self._decide(self.api_controller.generate_discussion, player, self.game_state)
             
             # 记录发言
             self.record_player_speech(player.id, message)
             
             # 等待一小段时间，模拟真实对话节奏
-            await asyncio.sleep(1)
+            if self.discussion_delay > 0:
+                with span("discussion_delay", seconds=self.discussion_delay):
+                    await asyncio.sleep(self.discussion_delay)
 
     def check_game_over(self) -> str:
         """检查游戏是否结束
@@ -582,15 +950,15 @@ class GameController:
         Returns:
             str: 获胜阵营，"werewolf" 表示狼人胜利，"villager" 表示好人胜利，None 表示游戏未结束
         """
-        werewolves = [p for p in self.game_state.players if p.role.role_type == RoleType.WEREWOLF and p.is_alive]
-        villagers = [p for p in self.game_state.players if p.role.role_type != RoleType.WEREWOLF and p.is_alive]
+        werewolves = self.game_state._alive_werewolf_count
+        villagers = self.game_state._alive_villager_count
         
         if not werewolves:
             return "villager"  # 所有狼人死亡，好人胜利
-        elif len(werewolves) >= len(villagers):
+        elif werewolves >= villagers:
             return "werewolf"  # 狼人数量大于等于好人，狼人胜利
         return None  # 游戏继续
 
     def get_player_by_name(self, name: str) -> Optional[Player]:
         """通过名字获取玩家"""
-        return next((p for p in self.game_state.players if p.name == name), None) 
\ No newline at end of file
+        return self.game_state.get_player_by_name(name)
\ No newline at end of file
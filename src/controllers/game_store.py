@@ -0,0 +1,216 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import asyncio
+import json
+import sqlite3
+import time
+from ..models.game_log import GameEvent
+from .response_cache import ResponseCache
+
+def _report_error(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"[STORE] 写入事件存储失败: {future.exception()}")
+
+
+class GameStore:
+    """对局的持久化事件存储（SQLite，WAL 模式）
+
+    每条 GameEvent 追加到 events 表，在内存中攒批，满 batch_size 条或保存快照时一次提交；
+    每个阶段结束时保存一份 GameState 的紧凑快照（含随机数和决策后端的记忆），只保留最近 keep_snapshots 份。
+    恢复时读取最新快照和快照之前的事件，快照之后、没跑完的阶段的事件直接丢弃，由恢复后的对局重新执行。
+    恢复不会重新执行已经完成的阶段（不调用决策后端），但快照之前的事件仍要全部读出并载入日志
+    （事件接口从头读取时需要它们），这一步的耗时与对局长短成正比。
+    重新执行的阶段中已经付费的 LLM 调用由同一个数据库文件中的响应缓存命中，见 response_cache()。
+
+    所有数据库操作都在专用的写线程中按调用顺序执行：写入（事件、快照、状态）只是排队，不在事件循环上提交事务；
+    查询会等到之前排队的写入完成后返回，因此总能读到自己写入的内容。
+    """
+
+    RUNNING = "running"  # 未结束（包括进程退出或出错中断的对局），可以恢复
+    FINISHED = "finished"
+    CANCELLED = "cancelled"
+    FAILED = "failed"  # 元数据无法重建对局，不再恢复
+
+    def __init__(self, path: str, batch_size: int = 64, keep_snapshots: int = 2):
+        self.path = path
+        self.batch_size = batch_size
+        self.keep_snapshots = keep_snapshots
+        self._db = sqlite3.connect(path, check_same_thread=False)  # 建表之后只在写线程中使用
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL 下提交不必每次 fsync，检查点时落盘
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS games (
+                game_id TEXT PRIMARY KEY, status TEXT NOT NULL, metadata TEXT NOT NULL,
+                created REAL NOT NULL, updated REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS events (
+                game_id TEXT NOT NULL, seq INTEGER NOT NULL, round INTEGER NOT NULL, type TEXT NOT NULL,
+                public INTEGER NOT NULL, details TEXT NOT NULL, timestamp TEXT NOT NULL,
+                PRIMARY KEY (game_id, seq));
+            CREATE TABLE IF NOT EXISTS snapshots (
+                game_id TEXT NOT NULL, phase_index INTEGER NOT NULL, event_count INTEGER NOT NULL,
+                state TEXT NOT NULL, created REAL NOT NULL,
+                PRIMARY KEY (game_id, phase_index));
+        """)
+        self._db.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="game-store")
+        self._pending: List[tuple] = []  # 尚未交给写线程的事件行
+        self.commits = 0
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        """把一个数据库操作排到写线程中执行；写入失败只打印，不影响对局"""
+        future = self._writer.submit(fn, *args)
+        future.add_done_callback(_report_error)
+        return future
+
+    def _query(self, fn: Callable, *args):
+        """在写线程中执行查询并等待结果（排在之前的写入之后）"""
+        self.flush()
+        return self._writer.submit(fn, *args).result()
+
+    def sync(self):
+        """等待之前排队的写入全部提交"""
+        self._query(lambda: None)
+
+    async def sync_async(self):
+        """不阻塞事件循环地等待之前排队的写入全部提交"""
+        await asyncio.to_thread(self.sync)
+
+    def create_game(self, game_id: str, metadata: Optional[Dict] = None):
+        """登记一局游戏（开始前或开局时）；同一编号重新开局时清掉旧的事件和快照
+
+        metadata 为 None 时保留已登记的元数据（例如服务端建局时记下的决策后端、模型和种子）。
+        """
+        self.flush()
+        self._submit(self._create_game, game_id, metadata)
+
+    def _create_game(self, game_id: str, metadata: Optional[Dict]):
+        now = time.time()
+        if metadata is None:
+            metadata = self._game_metadata(game_id) or {}
+        self._db.execute("DELETE FROM events WHERE game_id = ?", (game_id,))
+        self._db.execute("DELETE FROM snapshots WHERE game_id = ?", (game_id,))
+        self._db.execute(
+            "INSERT OR REPLACE INTO games (game_id, status, metadata, created, updated) VALUES (?, ?, ?, ?, ?)",
+            (game_id, self.RUNNING, json.dumps(metadata, ensure_ascii=False), now, now)
+        )
+        self._commit()
+
+    def append_event(self, game_id: str, event: GameEvent):
+        """追加一条事件（攒批提交）"""
+        self._pending.append((game_id, event.seq, event.round, event.event_type.value, int(event.public),
+                              json.dumps(event.details, ensure_ascii=False, default=str),
+                              event.timestamp.isoformat()))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把攒着的事件交给写线程提交（不等待提交完成）"""
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        self._submit(self._insert_events, rows, True)
+
+    def _insert_events(self, rows: List[tuple], commit: bool):
+        if rows:
+            self._db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        if commit:
+            self._commit()
+
+    def _commit(self):
+        self._db.commit()
+        self.commits += 1
+
+    def save_snapshot(self, game_id: str, phase_index: int, event_count: int, state: Dict):
+        """保存阶段边界的快照，和之前攒着的事件在同一个事务里提交（快照在调用方线程中序列化）"""
+        rows, self._pending = self._pending, []
+        self._submit(self._save_snapshot, rows, game_id, phase_index, event_count,
+                     json.dumps(state, ensure_ascii=False))
+
+    def _save_snapshot(self, rows: List[tuple], game_id: str, phase_index: int, event_count: int, state: str):
+        self._insert_events(rows, False)
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO snapshots (game_id, phase_index, event_count, state, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (game_id, phase_index, event_count, state, now)
+        )
+        self._db.execute(
+            "DELETE FROM snapshots WHERE game_id = ? AND phase_index NOT IN "
+            "(SELECT phase_index FROM snapshots WHERE game_id = ? ORDER BY phase_index DESC LIMIT ?)",
+            (game_id, game_id, self.keep_snapshots)
+        )
+        self._db.execute("UPDATE games SET updated = ? WHERE game_id = ?", (now, game_id))
+        self._commit()
+
+    def latest_snapshot(self, game_id: str) -> Optional[Dict]:
+        """最新的快照 {"phase_index", "event_count", "state"}，没有时返回 None"""
+        row = self._query(lambda: self._db.execute(
+            "SELECT phase_index, event_count, state FROM snapshots WHERE game_id = ? "
+            "ORDER BY phase_index DESC LIMIT 1", (game_id,)
+        ).fetchone())
+        if row is None:
+            return None
+        return {"phase_index": row[0], "event_count": row[1], "state": json.loads(row[2])}
+
+    def load_events(self, game_id: str, limit: Optional[int] = None) -> List[GameEvent]:
+        """按顺序读取一局的事件；limit 为快照的事件数时只读快照之前的部分"""
+        query = "SELECT seq, round, type, public, details, timestamp FROM events WHERE game_id = ?"
+        params: tuple = (game_id,)
+        if limit is not None:
+            query += " AND seq < ?"
+            params += (limit,)
+        rows = self._query(lambda: self._db.execute(query + " ORDER BY seq", params).fetchall())
+        return [GameEvent.from_dict({"seq": seq, "round": round_number, "type": event_type, "public": bool(public),
+                                     "details": json.loads(details), "timestamp": timestamp})
+                for seq, round_number, event_type, public, details, timestamp in rows]
+
+    def truncate_events(self, game_id: str, event_count: int):
+        """删除序号不小于 event_count 的事件（快照之后没跑完的阶段）"""
+        self._pending = [row for row in self._pending if row[0] != game_id or row[1] < event_count]
+        self._submit(self._truncate_events, game_id, event_count)
+
+    def _truncate_events(self, game_id: str, event_count: int):
+        self._db.execute("DELETE FROM events WHERE game_id = ? AND seq >= ?", (game_id, event_count))
+        self._commit()
+
+    def mark_finished(self, game_id: str, result: Optional[Dict] = None, status: str = FINISHED):
+        """对局结束或被取消：提交剩余事件并记录结果，之后不再作为待恢复的对局"""
+        self.flush()
+        self._submit(self._mark_finished, game_id, result, status)
+
+    def _mark_finished(self, game_id: str, result: Optional[Dict], status: str):
+        metadata = self._game_metadata(game_id) or {}
+        if result is not None:
+            metadata["result"] = result
+        self._db.execute("UPDATE games SET status = ?, metadata = ?, updated = ? WHERE game_id = ?",
+                         (status, json.dumps(metadata, ensure_ascii=False), time.time(), game_id))
+        self._commit()
+
+    def game_metadata(self, game_id: str) -> Optional[Dict]:
+        return self._query(self._game_metadata, game_id)
+
+    def _game_metadata(self, game_id: str) -> Optional[Dict]:
+        row = self._db.execute("SELECT metadata FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def unfinished_games(self) -> List[str]:
+        """尚未结束的对局编号（按开始时间），进程重启后据此恢复"""
+        rows = self._query(lambda: self._db.execute(
+            "SELECT game_id FROM games WHERE status = ? ORDER BY created", (self.RUNNING,)
+        ).fetchall())
+        return [row[0] for row in rows]
+
+    def response_cache(self, **kwargs) -> ResponseCache:
+        """与本存储共用数据库文件的响应缓存
+
+        交给 APIController 后每次调用的响应都落盘，恢复时以 READ_THROUGH 模式重跑中断的阶段，
+        已经拿到响应的调用直接命中，不再付费。namespace 传对局编号，避免不同对局共用响应。
+        """
+        return ResponseCache(db_path=self.path, **kwargs)
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._writer.shutdown()
+            self._db.close()
+            self._db = None
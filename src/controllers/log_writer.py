@@ -0,0 +1,143 @@
+from typing import Dict, List, Optional
+import asyncio
+import atexit
+import json
+import threading
+
+class _Flusher:
+    """所有日志写入器共用的后台刷盘线程
+
+    每隔 interval 秒（或被写满的写入器唤醒时）把各写入器缓冲的内容写入文件，
+    几百局同时进行时也只有这一个线程做磁盘 I/O。
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._writers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, writer: "BufferedLogWriter"):
+        with self._lock:
+            self._writers.add(writer)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-flusher", daemon=True)
+                self._thread.start()
+
+    def unregister(self, writer: "BufferedLogWriter"):
+        with self._lock:
+            self._writers.discard(writer)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def flush_all(self):
+        """把所有写入器的缓冲写入文件（解释器退出时也会调用）"""
+        with self._lock:
+            writers = list(self._writers)
+        for writer in writers:
+            writer.flush()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush_all()
+            except Exception as e:
+                print(f"[LOG] 日志刷盘失败: {str(e)}")
+
+
+_flusher = _Flusher()
+atexit.register(_flusher.flush_all)
+
+
+class BufferedLogWriter:
+    """带缓冲的游戏日志写入器
+
+    write() 只把文本追加到内存缓冲，不做磁盘 I/O；缓冲由共享的后台线程
+    定时写入，超过 max_buffer_bytes 时提前唤醒它，阶段结束时由调用方 flush。
+    可选地把结构化事件逐行写入 JSONL 文件。
+    用法与文本文件相同（name / write / flush / close），可以直接替换 open() 的结果。
+    """
+
+    def __init__(self, path: str, jsonl_path: Optional[str] = None, max_buffer_bytes: int = 64 * 1024):
+        self.name = path
+        self.jsonl_name = jsonl_path
+        self.max_buffer_bytes = max_buffer_bytes
+        self._text_file = open(path, "w", encoding="utf-8")
+        self._jsonl_file = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+        self._buffer_lock = threading.Lock()  # 保护缓冲区
+        self._io_lock = threading.Lock()  # 保证批次按顺序写入文件
+        self._text: List[str] = []
+        self._records: List[str] = []
+        self._pending_bytes = 0
+        self._closed = False
+        _flusher.register(self)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def write(self, text: str):
+        """追加文本（不立即写盘）"""
+        self._append(self._text, text)
+
+    def write_record(self, record: Dict):
+        """追加一条结构化记录到 JSONL 文件；没有配置 JSONL 文件时忽略"""
+        if self._jsonl_file is None:
+            return
+        self._append(self._records, json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def _append(self, buffer: List[str], text: str):
+        if self._closed:
+            raise ValueError("日志写入器已关闭")
+        with self._buffer_lock:
+            buffer.append(text)
+            self._pending_bytes += len(text)
+            full = self._pending_bytes >= self.max_buffer_bytes
+        if full:
+            _flusher.wake()
+
+    def flush(self):
+        """把缓冲中的内容写入文件（同步，会做磁盘 I/O）"""
+        with self._io_lock:
+            with self._buffer_lock:
+                text, self._text = self._text, []
+                records, self._records = self._records, []
+                self._pending_bytes = 0
+            if self._text_file.closed:
+                return
+            if text:
+                self._text_file.write("".join(text))
+                self._text_file.flush()
+            if records and self._jsonl_file is not None:
+                self._jsonl_file.write("".join(records))
+                self._jsonl_file.flush()
+
+    async def flush_async(self):
+        """在线程池中 flush，不阻塞事件循环"""
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """写完剩余缓冲并关闭文件，可重复调用"""
+        if self._closed:
+            return
+        self._closed = True
+        _flusher.unregister(self)
+        self.flush()
+        with self._io_lock:
+            self._text_file.close()
+            if self._jsonl_file is not None:
+                self._jsonl_file.close()
+
+    async def close_async(self):
+        """在线程池中 close，不阻塞事件循环"""
+        await asyncio.to_thread(self.close)
+
+    def __enter__(self) -> "BufferedLogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,236 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
+
+# 耗时直方图的默认分桶（秒），覆盖本地模拟的微秒级阶段到推理模型的分钟级调用
+DEFAULT_SECONDS_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# token 数直方图的默认分桶
+DEFAULT_TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+class Counter:
+    """只增不减的计数；parent 是上级注册表里的同一条序列，计数同时记到它上面"""
+
+    def __init__(self, parent: Optional["Counter"] = None):
+        self.value = 0.0
+        self.parent = parent
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+        if self.parent is not None:
+            self.parent.inc(amount)
+
+    def to_dict(self) -> Dict:
+        return {"value": self.value}
+
+
+class Histogram:
+    """固定分桶的直方图
+
+    observe() 只做一次二分查找和几次加法，可以一直开着；
+    各桶只记录落在本桶的数量，导出时再累加成 Prometheus 要求的累计计数。
+    """
+
+    def __init__(self, buckets: Sequence[float], parent: Optional["Histogram"] = None):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.parent = parent
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.parent is not None:
+            self.parent.observe(value)
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """[(上界, 不超过该上界的观测数)]，最后一项的上界是 +Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else _format_number(bound), total))
+        return result
+
+    def to_dict(self) -> Dict:
+        return {"count": self.count, "sum": self.sum, "buckets": dict(self.cumulative())}
+
+
+class MetricFamily:
+    """同名指标按标签值分成多条序列"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Tuple[str, ...],
+                 buckets: Optional[Sequence[float]] = None, parent: Optional["MetricFamily"] = None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind  # "counter" 或 "histogram"
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets)) if buckets else DEFAULT_SECONDS_BUCKETS
+        self.parent = parent  # 上级注册表中的同名指标
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values) -> object:
+        """取得（必要时创建）一组标签值对应的序列"""
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.label_names}，收到 {key}")
+            parent = self.parent.labels(*key) if self.parent else None
+            series = Histogram(self.buckets, parent) if self.kind == "histogram" else Counter(parent)
+            self._series[key] = series
+        return series
+
+    def series(self) -> List[Tuple[Dict[str, str], object]]:
+        return [(dict(zip(self.label_names, key)), series) for key, series in self._series.items()]
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，可导出为 Prometheus 文本格式或 JSON
+
+    游戏在单个事件循环里运行，记录指标不加锁；多进程模拟时每个进程各有一份。
+    指定 parent 时是一局游戏自己的注册表：只导出本局的数据，同时把每次记录转记到 parent（通常是进程共享的注册表）。
+    """
+
+    def __init__(self, parent: Optional["MetricsRegistry"] = None):
+        self.parent = parent
+        self._families: Dict[str, MetricFamily] = {}
+
+    def _family(self, name: str, help_text: str, kind: str, label_names: Sequence[str],
+                buckets: Optional[Sequence[float]] = None) -> MetricFamily:
+        family = self._families.get(name)
+        if family is None:
+            parent = self.parent._family(name, help_text, kind, label_names, buckets) if self.parent else None
+            family = MetricFamily(name, help_text, kind, tuple(label_names), buckets, parent)
+            self._families[name] = family
+        elif family.kind != kind or family.label_names != tuple(label_names):
+            raise ValueError(f"指标 {name} 已以不同的类型或标签注册")
+        return family
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, help_text, "counter", label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_SECONDS_BUCKETS) -> MetricFamily:
+        return self._family(name, help_text, "histogram", label_names, buckets)
+
+    def get(self, name: str) -> Optional[MetricFamily]:
+        return self._families.get(name)
+
+    def reset(self):
+        """清空所有序列（保留已注册的指标）"""
+        for family in self._families.values():
+            family._series.clear()
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式（exposition format 0.0.4）"""
+        lines = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {_escape_help(family.help)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for labels, series in family.series():
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_format_labels(labels)} {_format_number(series.value)}")
+                    continue
+                for bound, count in series.cumulative():
+                    lines.append(f"{family.name}_bucket{_format_labels(dict(labels, le=bound))} {count}")
+                lines.append(f"{family.name}_sum{_format_labels(labels)} {_format_number(series.sum)}")
+                lines.append(f"{family.name}_count{_format_labels(labels)} {series.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_dict(self) -> Dict:
+        return {
+            family.name: {
+                "type": family.kind,
+                "help": family.help,
+                "series": [dict(series.to_dict(), labels=labels) for labels, series in family.series()]
+            }
+            for family in self._families.values()
+        }
+
+    def dump_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+def _format_number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+class LLMCallMetrics:
+    """APIController 每次决策调用的指标
+
+    一次调用从组装提示词开始，到拿到可用的 JSON（或放弃）结束，包含所有重试。
+    prices 是每个模型每百万 token 的 (输入价格, 输出价格)，配置后同时累计费用。
+    """
+
+    def __init__(self, registry: MetricsRegistry, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.prices = prices or {}
+        self.call_seconds = registry.histogram(
+            "werewolf_llm_call_seconds", "一次决策调用的总耗时（含重试和等待）", ("model", "phase"))
+        self.queue_seconds = registry.histogram(
+            "werewolf_llm_queue_seconds", "请求在限流器和连接池中排队的时间", ("model",))
+        self.retries = registry.counter(
+            "werewolf_llm_retries_total", "决策调用的重试次数", ("model",))
+        self.parse_failures = registry.counter(
+            "werewolf_llm_parse_failures_total", "模型回复无法解析为 JSON 的次数", ("model",))
+        self.calls = registry.counter(
+            "werewolf_llm_calls_total", "决策调用次数", ("model", "phase", "outcome"))
+        self.tokens = registry.histogram(
+            "werewolf_llm_tokens", "每次请求的 token 用量（来自服务端 usage）", ("model", "kind"),
+            DEFAULT_TOKEN_BUCKETS)
+        self.cost = registry.counter(
+            "werewolf_llm_cost_total", "按配置价格累计的费用", ("model",))
+        self.cached_tokens = registry.counter(
+            "werewolf_llm_cached_tokens_total", "缓存命中或重放的响应当初用掉的 token（这次没有付费）", ("model", "kind"))
+
+    def record_usage(self, model: str, usage: Dict, cached: bool = False):
+        """记录一次请求的 token 用量；usage 可能为空
+
+        cached 为 True 表示响应来自缓存或重放，没有付费：只计入 cached_tokens，不计入 tokens 和费用。
+        """
+        if not usage:
+            return
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        if cached:
+            self.cached_tokens.labels(model, "prompt").inc(prompt)
+            self.cached_tokens.labels(model, "completion").inc(completion)
+            return
+        details = usage.get("completion_tokens_details") or {}
+        reasoning = details.get("reasoning_tokens") or usage.get("reasoning_tokens") or 0
+        self.tokens.labels(model, "prompt").observe(prompt)
+        self.tokens.labels(model, "completion").observe(completion)
+        if reasoning:
+            self.tokens.labels(model, "reasoning").observe(reasoning)
+        if model in self.prices:
+            prompt_price, completion_price = self.prices[model]
+            self.cost.labels(model).inc((prompt * prompt_price + completion * completion_price) / 1_000_000)
+
+    def record_call(self, model: str, phase: str, seconds: float, queue_seconds: float,
+                    retries: int, parse_failures: int, outcome: str):
+        self.call_seconds.labels(model, phase).observe(seconds)
+        self.queue_seconds.labels(model).observe(queue_seconds)
+        self.calls.labels(model, phase, outcome).inc()
+        if retries:
+            self.retries.labels(model).inc(retries)
+        if parse_failures:
+            self.parse_failures.labels(model).inc(parse_failures)
+
+
+# 进程内共享的默认注册表
+shared_metrics = MetricsRegistry()
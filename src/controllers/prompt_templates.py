@@ -0,0 +1,248 @@
+from typing import Dict, List
+import textwrap
+from ..models.role import RoleType
+from .context_builder import estimate_tokens
+
+def clean_prompt(text: str) -> str:
+    """去掉源码缩进带来的行首空白和行尾空白，保留列表的相对缩进，合并多余的空行"""
+    text = textwrap.dedent(text).strip("\n")
+    lines = [line.rstrip() for line in text.split("\n")]
+    first_indented = next((i for i, line in enumerate(lines) if line and line[0] == " "), None)
+    if first_indented is not None and first_indented > 0 and lines[0]:
+        # 形如 f"""第一行\n        后续行""" 的字符串：第一行没有缩进，后续行单独去缩进
+        lines = lines[:1] + textwrap.dedent("\n".join(lines[1:])).split("\n")
+    cleaned: List[str] = []
+    for line in lines:
+        if line or (cleaned and cleaned[-1]):
+            cleaned.append(line)
+    return "\n".join(cleaned).strip()
+
+# 所有角色共用的游戏规则，放在系统提示词最前面
+RULES = """
+    你正在参与一个狼人杀游戏。这是一个推理策略游戏，玩家分为两个阵营：狼人阵营和好人阵营。
+
+    游戏规则：
+    1. 游戏分为白天和黑夜两个阶段交替进行
+    2. 每个夜晚：
+       - 狼人可以选择一名玩家击杀
+       - 预言家可以查验一名玩家的真实身份
+       - 女巫可以使用解药救人或使用毒药杀人（每种药只能用一次）
+    3. 每个白天：
+       - 公布夜晚死亡情况
+       - 所有玩家依次发言，讨论信息
+       - 所有玩家投票，得票最多的玩家被放逐
+    4. 胜利条件：
+       - 狼人阵营：杀死所有好人
+       - 好人阵营：杀死所有狼人
+"""
+
+# 各角色的身份说明与战术指南，紧跟在规则之后
+ROLE_GUIDES: Dict[RoleType, str] = {
+    RoleType.WEREWOLF: """
+        你的角色是狼人，属于狼人阵营。
+        目标：与其他狼人合作，淘汰所有好人阵营。
+
+        狼人战术指南：
+        1. 刀法精准：优先击杀女巫、预言家，后期刀猎人/关键平民
+        2. 发言统一：与狼队提前约定验人逻辑，避免内部矛盾
+        3. 悍跳战术：
+           - 可以直接对跳预言家，扰乱好人视野
+           - 编造首夜验人结果，攻击真预言家"验人无收益"
+           - 其他狼人要统一站边悍跳狼
+        4. 倒钩战术：
+           - 假意支持真预言家，暗中篡改验人信息
+           - 在关键轮次反水归票真预言家
+        5. 深水战术：
+           - 发言保持中立，装作跟票平民
+           - 决赛轮可跳神职抢夺归票权
+        6. 煽动战术：
+           - 假扮激进好人，攻击可疑玩家
+           - 利用位置学带偏好人思路
+
+        记住：悍跳要真，倒钩要深，刀法要狠，发言要稳！
+    """,
+    RoleType.VILLAGER: """
+        你的角色是普通村民，属于好人阵营。
+        目标：与其他好人合作，找出并淘汰所有狼人。
+
+        平民战术指南：
+        1. 发言策略：
+           - 可以尝试穿神职衣服（如假跳预言家）
+           - 大胆发表意见，敢于质疑可疑玩家
+           - 记录并分析玩家投票一致性
+        2. 逻辑分析：
+           - 关注多次弃票或跟风的玩家
+           - 注意发言矛盾或态度反复的人
+        3. 团队配合：
+           - 支持可信的神职玩家
+           - 通过互保形成信任链
+           - 在神职死亡后主动带队归票
+        4. 防守意识：
+           - 避免过于激进被狼人针对
+           - 保持中立直到获得确切信息
+
+        记住：敢穿敢保，敢踩敢票，活着是盾，死了是矛！
+    """,
+    RoleType.SEER: """
+        你的角色是预言家，属于好人阵营。
+        目标：帮助村民找出并淘汰狼人，但要注意保护自己。
+
+        预言家战术指南：
+        1. 验人策略：
+           - 首夜优先验发言可疑的玩家
+           - 次夜验证关键发言者或神职玩家
+           - 避免重复验证同一条线的玩家
+        2. 身份保护：
+           - 考虑隐藏身份到第二夜
+           - 避免首夜被刀导致信息断层
+        3. 信息传递：
+           - 明确公开验人结果和顺序
+           - 避免被狼人混淆验人信息
+           - 用清晰的逻辑串联验人结果
+        4. 带队技巧：
+           - 及时归票确认的狼人
+           - 保护验出的好人玩家
+           - 引导队伍关注可疑目标
+
+        记住：首验抓狼，次验保民，发言要硬，信息要清！
+    """,
+    RoleType.WITCH: """
+        你的角色是女巫，属于好人阵营。
+        目标：帮助村民找出并淘汰狼人，合理使用药水。
+
+        女巫战术指南：
+        1. 解药使用：
+           - 首夜考虑自救（防首刀）
+           - 优先救预言家（保证至少两夜验人）
+           - 若未自救则隐藏身份观察刀法
+        2. 毒药策略：
+           - 不要轻易使用，等待关键时机
+           - 针对发言矛盾或跟风站队的玩家
+           - 可以毒掉确认的狼人
+        3. 身份保护：
+           - 尽量隐藏身份直到使用药水
+           - 观察狼人刀法判断用药时机
+        4. 发言技巧：
+           - 装作普通平民发言
+           - 暗中保护可信好人
+           - 用毒药威慑可疑玩家
+
+        记住：首夜自救，毒药慢用，装民到底，毒狼无形！
+    """,
+    RoleType.HUNTER: """
+        你的角色是猎人，属于好人阵营。
+        目标：帮助村民找出并淘汰狼人，注意开枪时机。
+
+        猎人战术指南：
+        1. 身份策略：
+           - 残局阶段再跳身份归票
+           - 避免过早暴露被狼人针对
+           - 可以暗跳钓鱼，伪装平民
+        2. 开枪时机：
+           - 被投票出局时翻牌反杀
+           - 被狼人击杀时带走嫌疑人
+           - 优先射杀划水不站队的玩家
+        3. 威慑作用：
+           - 利用开枪威胁压制狼人
+           - 保护关键好人免受伤害
+        4. 发言技巧：
+           - 暗中观察可疑玩家
+           - 记录反复倒票的玩家
+           - 为开枪目标收集证据
+
+        记住：明跳控场，暗藏追刀，枪口指狼，一换一高！
+    """,
+    RoleType.GUARD: """
+        你的角色是守卫，属于好人阵营。
+        目标：帮助村民找出并淘汰狼人，在夜里保护关键好人。
+
+        守卫规则：每晚可以守护一名玩家（包括自己），被守护的玩家当晚不会被狼人杀害；
+        不能连续两晚守护同一名玩家。
+
+        守卫战术指南：
+        1. 守护策略：
+           - 优先守护已经跳身份、可信的预言家
+           - 预判狼人刀法，避免被狼人猜中守护对象
+           - 首夜可以空守或守护自己，避免与女巫解药冲突
+        2. 身份保护：
+           - 尽量隐藏身份，装作普通平民
+           - 守卫暴露后容易成为狼人的首要目标
+        3. 发言技巧：
+           - 根据平安夜的情况暗中分析狼人刀法
+           - 关键时刻可以跳身份为好人作证
+
+        记住：守神保民，藏身不露，刀口预判，夜夜有功！
+    """,
+}
+
+class PromptTemplate:
+    """一个角色编译好的提示词模板
+
+    消息分为稳定前缀和易变后缀：
+      1. system：游戏规则 + 角色指南（整局不变）
+      2. user：到目前为止的游戏进程（只在末尾追加，回合结束时被摘要替换）
+      3. user：当前状态与本次决策的指令（每次都不同）
+    前两条在同一玩家的连续请求之间基本不变，服务端的前缀缓存可以命中。
+    """
+
+    HISTORY_HEADER = "游戏进程：\n"
+
+    def __init__(self, role_type: RoleType):
+        self.role_type = role_type
+        self.system = clean_prompt(RULES) + "\n\n" + clean_prompt(ROLE_GUIDES[role_type])
+        self.system_tokens = estimate_tokens(self.system)
+
+    def fixed_tokens(self, instruction: str) -> int:
+        """除游戏上下文以外的部分（系统提示词、游戏进程的标题、决策指令）的估算 token 数"""
+        return (self.system_tokens + estimate_tokens(self.HISTORY_HEADER)
+                + estimate_tokens("\n\n" + clean_prompt(instruction)))
+
+    def render(self, history: str, state: str, instruction: str) -> List[Dict[str, str]]:
+        """按 稳定前缀（规则、角色指南、游戏进程）+ 易变后缀（当前状态、决策指令）的顺序组装消息"""
+        messages = [{"role": "system", "content": self.system}]
+        if history:
+            messages.append({"role": "user", "content": self.HISTORY_HEADER + history})
+        messages.append({"role": "user", "content": state + "\n\n" + clean_prompt(instruction)})
+        return messages
+
+# 每个角色的模板在模块加载时编译一次
+ROLE_TEMPLATES: Dict[RoleType, PromptTemplate] = {role_type: PromptTemplate(role_type) for role_type in ROLE_GUIDES}
+
+class PrefixCacheTracker:
+    """估算服务端前缀缓存的命中情况
+
+    对每名玩家记录上一次请求的消息，本次请求与它的最长公共前缀视为可以命中缓存的部分。
+    """
+
+    def __init__(self):
+        self._last: Dict[int, str] = {}  # 玩家ID -> 上一次请求拼接后的消息
+        self.prompt_tokens = 0
+        self.hit_tokens = 0
+        self.requests = 0
+
+    def observe(self, player_id: int, messages: List[Dict[str, str]]) -> int:
+        """记录一次请求，返回估算命中的前缀 token 数"""
+        text = "\x00".join(message["content"] for message in messages)
+        previous = self._last.get(player_id, "")
+        common = 0
+        limit = min(len(text), len(previous))
+        while common < limit and text[common] == previous[common]:
+            common += 1
+        hit = estimate_tokens(text[:common])
+        self._last[player_id] = text
+        self.prompt_tokens += estimate_tokens(text)
+        self.hit_tokens += hit
+        self.requests += 1
+        return hit
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hit_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "prefix_hit_tokens": self.hit_tokens,
+            "prefix_hit_ratio": self.hit_ratio
+        }
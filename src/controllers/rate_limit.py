@@ -0,0 +1,199 @@
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import asyncio
+import random
+import time
+import openai
+from .client_pool import evict_closed_loops
+
+class RateLimit:
+    """单个模型的限流配置"""
+
+    def __init__(self, requests_per_second: float, burst: int, max_concurrency: int,
+                 backoff_base: float = 1.0, backoff_cap: float = 30.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.requests_per_second = requests_per_second  # 令牌生成速率
+        self.burst = burst  # 令牌桶容量
+        self.max_concurrency = max_concurrency  # 同时在途的请求上限
+        self.backoff_base = backoff_base  # 指数退避的基础等待秒数
+        self.backoff_cap = backoff_cap  # 单次退避的最长等待秒数
+        self.failure_threshold = failure_threshold  # 连续失败多少次后熔断
+        self.reset_timeout = reset_timeout  # 熔断后多久允许试探请求
+
+
+# R1 带推理过程，单次请求更慢、配额更紧
+MODEL_LIMITS: Dict[str, RateLimit] = {
+    "deepseek-r1": RateLimit(requests_per_second=2.0, burst=4, max_concurrency=8),
+    "deepseek-chat": RateLimit(requests_per_second=5.0, burst=10, max_concurrency=16),
+}
+DEFAULT_LIMIT = RateLimit(requests_per_second=2.0, burst=4, max_concurrency=8)
+
+
+class TokenBucket:
+    """令牌桶限流器
+
+    令牌不足时预占未来的令牌并等待，先到的调用者先拿到令牌，
+    大量并发请求会被均匀地摊开，而不是同时打到服务端。
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class CircuitOpenError(Exception):
+    """服务端处于熔断状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后在 reset_timeout 内直接拒绝请求，之后放行一个试探请求"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """当前是否允许发出请求"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            return True
+        # 半开状态下只放行一个试探请求，其结果决定关闭还是重新熔断
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self._failures = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """试探请求没有得出结果（例如被取消）时交还试探名额，下一次调用立即重新试探"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic() - self.reset_timeout
+
+
+class ProviderGuard:
+    """一个模型的限流器、并发上限与熔断器"""
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.bucket = TokenBucket(limit.requests_per_second, limit.burst)
+        self.slots = asyncio.Semaphore(limit.max_concurrency)
+        self.breaker = CircuitBreaker(limit.failure_threshold, limit.reset_timeout)
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个并发名额和一个令牌，并在每条退出路径上把请求结果记入熔断器
+
+        可重试的错误（限流、超时、5xx）记为失败；其他错误（如 4xx、解析错误）说明服务端可用，记为成功；
+        被取消时没有结果，只交还半开状态的试探名额。
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("服务暂不可用（熔断中）")
+        try:
+            async with self.slots:
+                await self.bucket.acquire()
+                yield
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        else:
+            self.breaker.record_success()
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """带抖动的指数退避等待时间（full jitter），服务端给出 Retry-After 时以其为下限"""
+        delay = random.uniform(0, min(self.limit.backoff_cap, self.limit.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RateLimiterRegistry:
+    """按模型共享的限流器，所有玩家、所有对局共用"""
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None):
+        self.limits = dict(MODEL_LIMITS if limits is None else limits)
+        # 事件循环 -> 模型名 -> 限流器；信号量与事件循环绑定，已关闭的循环的条目会被清除
+        self._guards: Dict[asyncio.AbstractEventLoop, Dict[str, ProviderGuard]] = {}
+
+    def get(self, model_name: str) -> ProviderGuard:
+        loop = asyncio.get_running_loop()
+        guards = self._guards.get(loop)
+        if guards is None:
+            evict_closed_loops(self._guards)
+            guards = self._guards[loop] = {}
+        guard = guards.get(model_name)
+        if guard is None:
+            guard = guards[model_name] = ProviderGuard(self.limits.get(model_name, DEFAULT_LIMIT))
+        return guard
+
+
+def is_retryable(error: Exception) -> bool:
+    """是否是值得重试的服务端错误（限流、超时、连接失败、5xx）"""
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应的 Retry-After / retry-after-ms 头中读取建议的等待秒数"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# 进程内所有 APIController 默认共享的限流器
+shared_rate_limiter = RateLimiterRegistry()
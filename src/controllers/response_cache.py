@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+class CacheMode(Enum):
+    OFF = "off"  # 不读不写
+    READ_THROUGH = "read_through"  # 先查缓存，未命中时请求并写入
+    RECORD_ONLY = "record_only"  # 总是请求，只把结果写入缓存
+
+
+class ResponseCache:
+    """按内容寻址的 LLM 响应缓存
+
+    键是请求内容（模型、系统提示词、上下文与提示词、采样参数）的哈希。
+    内存中是按字节数淘汰的 LRU，可选的 SQLite 文件作为持久层，
+    重放、测试和固定种子的重复对局可以直接命中，不必再付费请求。
+    写入持久层的响应攒批提交（满 batch_size 条、flush() 或 close() 时），不必每次调用都提交一次事务；
+    写入和提交在专用的写线程中完成，put() 不会在事件循环上做磁盘 I/O；
+    get() 用单独的只读连接查询，不和写线程争用连接，也不会等待正在进行的提交。
+    """
+
+    def __init__(self, mode: CacheMode = CacheMode.READ_THROUGH, max_memory_bytes: int = 16 * 1024 * 1024,
+                 db_path: Optional[str] = None, namespace: Optional[str] = None, batch_size: int = 16):
+        self.mode = mode
+        # 键的前缀；按对局划分命名空间时，不同对局中内容相同的请求不会共用响应
+        self.namespace = namespace
+        self.max_memory_bytes = max_memory_bytes
+        self.batch_size = batch_size
+        self._pending: Dict[str, Tuple[str, float]] = {}  # 尚未提交到持久层的响应：键 -> (值, 写入时间)
+        self._pending_lock = threading.Lock()
+        self._writing: Optional[Future] = None  # 写线程中排队或进行中的提交
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._db = None  # 只在写线程中使用
+        self._reader = None  # 查询用的连接：WAL 模式下读不会被写线程的提交阻塞
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if db_path:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._reader = sqlite3.connect(db_path, check_same_thread=False)
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(request: Dict) -> str:
+        """计算请求的缓存键"""
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _key(self, request: Dict) -> str:
+        key = self.make_key(request)
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    @property
+    def readable(self) -> bool:
+        return self.mode == CacheMode.READ_THROUGH
+
+    @property
+    def writable(self) -> bool:
+        return self.mode in (CacheMode.READ_THROUGH, CacheMode.RECORD_ONLY)
+
+    def get(self, request: Dict) -> Optional[Dict]:
+        """查询缓存，未命中返回 None"""
+        if not self.readable:
+            return None
+        key = self._key(request)
+        value = self._memory.get(key)
+        pending = self._pending.get(key) if value is None else None
+        if value is not None:
+            self._memory.move_to_end(key)
+        elif pending is not None:  # 已被内存淘汰、但还没提交的响应
+            value = pending[0].encode("utf-8")
+            self._remember(key, value)
+        elif self._reader is not None:
+            row = self._reader.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                value = row[0].encode("utf-8")
+                self.disk_hits += 1
+                self._remember(key, value)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def put(self, request: Dict, response: Dict):
+        """写入缓存"""
+        if not self.writable:
+            return
+        key = self._key(request)
+        value = json.dumps(response, ensure_ascii=False)
+        self._remember(key, value.encode("utf-8"))
+        if self._db is not None:
+            with self._pending_lock:
+                self._pending[key] = (value, time.time())
+                full = len(self._pending) >= self.batch_size
+            if full and (self._writing is None or self._writing.done()):
+                self._writing = self._writer.submit(self._write_pending)
+        self.writes += 1
+
+    def flush(self):
+        """把攒着的响应提交到持久层，等待提交完成（同步，会阻塞调用方）"""
+        if self._db is not None:
+            self._writer.submit(self._write_pending).result()
+
+    async def flush_async(self):
+        """在写线程中提交攒着的响应，不阻塞事件循环"""
+        if self._db is not None:
+            await asyncio.wrap_future(self._writer.submit(self._write_pending))
+
+    def _write_pending(self):
+        """（写线程）提交当前攒着的响应；提交完成前它们留在 _pending 中，仍能被 get() 命中"""
+        with self._pending_lock:
+            rows = list(self._pending.items())
+        if not rows:
+            return
+        self._db.executemany("INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                             [(key, value, created) for key, (value, created) in rows])
+        self._db.commit()
+        with self._pending_lock:
+            for key, entry in rows:
+                if self._pending.get(key) is entry:  # 提交期间被重新写入的保留到下一批
+                    del self._pending[key]
+
+    def invalidate(self, request: Dict):
+        """删除一个请求的缓存（例如响应格式不正确，需要重新请求）"""
+        key = self._key(request)
+        value = self._memory.pop(key, None)
+        if value is not None:
+            self._memory_bytes -= len(value)
+        with self._pending_lock:
+            self._pending.pop(key, None)
+        if self._db is not None:
+            self._writer.submit(self._delete, key)  # 写线程按提交顺序执行，排在之前的写入之后
+
+    def _delete(self, key: str):
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._db.commit()
+
+    def _remember(self, key: str, value: bytes):
+        """放入内存 LRU，超出字节上限时淘汰最久未使用的条目"""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        if len(value) > self.max_memory_bytes:
+            return
+        self._memory[key] = value
+        self._memory_bytes += len(value)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode.value,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._writer.shutdown()
+            self._db.close()
+            self._reader.close()
+            self._db = None
+            self._reader = None
+            self._writer = None
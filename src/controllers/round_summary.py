@@ -0,0 +1,46 @@
+from typing import Dict, List
+from ..models.game_log import GameEvent, GameEventType
+
+class RoundSummarizer:
+    """把一个回合的公开事件压缩成一行摘要
+
+    纯规则抽取，不调用模型：死亡、每人发言的开头、投票去向和放逐结果。
+    每回合结束时由 GameController 调用一次，结果缓存在 GameLog 上供之后所有玩家的提示词复用。
+    """
+
+    def __init__(self, max_speech_chars: int = 20):
+        self.max_speech_chars = max_speech_chars
+
+    def _shorten(self, message: str) -> str:
+        message = " ".join(message.split())
+        if len(message) <= self.max_speech_chars:
+            return message
+        return message[:self.max_speech_chars] + "…"
+
+    def summarize(self, events: List[GameEvent]) -> str:
+        deaths: List[str] = []
+        speeches: List[str] = []
+        votes: Dict[str, List[str]] = {}  # 被投票者 -> 投票者
+        results: List[str] = []
+        for event in events:
+            details = event.details
+            if event.event_type == GameEventType.PLAYER_DEATH and details.get("player_name"):
+                death = f"{details['player_name']}({details['role']})" if details.get("role_revealed") \
+                    else details["player_name"]
+                if death not in deaths:  # 夜晚死亡在夜晚结束和白天公布时各记录一次
+                    deaths.append(death)
+            elif event.event_type == GameEventType.PLAYER_SPEAK:
+                prefix = "[遗言]" if details.get("is_last_words") else ""
+                speeches.append(f"{prefix}{details['player_name']}：{self._shorten(details['message'])}")
+            elif event.event_type == GameEventType.PLAYER_VOTE:
+                votes.setdefault(details["target_name"], []).append(details["voter_name"])
+            elif event.event_type in (GameEventType.VOTE_RESULT, GameEventType.HUNTER_SHOT):
+                results.append(event.text)
+
+        parts = [f"死亡：{'、'.join(deaths)}" if deaths else "无人死亡"]
+        if speeches:
+            parts.append("发言：" + "；".join(speeches))
+        if votes:
+            parts.append("投票：" + "；".join(f"{target}←{'、'.join(voters)}" for target, voters in votes.items()))
+        parts.extend(results)
+        return " | ".join(parts)
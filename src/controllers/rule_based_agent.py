@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional, Set
+import random
+from ..models.player import Player
+from ..models.role import RoleType
+from ..models.game_state import GameState
+from .agent_backend import AgentBackend
+
+class RuleBasedAgent(AgentBackend):
+    """基于规则的决策后端，不访问网络，用于大规模模拟
+
+    policy:
+        heuristic  预言家查到狼人后公开指认，好人跟票被指认的狼人，狼人优先刀跳出来的预言家，守卫优先守护跳出来的预言家
+        random     所有决策都在合法目标中均匀随机
+    一局游戏内所有玩家共用一个实例，实例上只保存公开信息和各自角色本应知道的信息。
+    """
+
+    POLICIES = ("heuristic", "random")
+
+    def __init__(self, policy: str = "heuristic", rng: Optional[random.Random] = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的策略: {policy}，可选: {', '.join(self.POLICIES)}")
+        self.policy = policy
+        self.rng = rng or random.Random()
+        self._seer_results: Dict[int, Dict[int, bool]] = {}  # 预言家ID -> {玩家ID: 是否狼人}（预言家私有）
+        self._accused: Set[int] = set()  # 被预言家公开指认为狼人的玩家（公开信息）
+        self._claimed_seers: Set[int] = set()  # 公开跳出来的预言家（公开信息）
+
+    def get_state(self) -> Dict:
+        return {
+            "rng": self.rng.getstate(),
+            "seer_results": self._seer_results,
+            "accused": sorted(self._accused),
+            "claimed_seers": sorted(self._claimed_seers)
+        }
+
+    def set_state(self, state: Dict):
+        if not state:
+            return
+        version, internal, gauss_next = state["rng"]
+        self.rng.setstate((version, tuple(internal), gauss_next))
+        self._seer_results = {int(seer_id): {int(pid): is_wolf for pid, is_wolf in results.items()}
+                              for seer_id, results in state["seer_results"].items()}
+        self._accused = set(state["accused"])
+        self._claimed_seers = set(state["claimed_seers"])
+
+    def fork(self, rng: Optional[random.Random] = None) -> "RuleBasedAgent":
+        branch = RuleBasedAgent(self.policy, rng)
+        branch._seer_results = {seer_id: dict(results) for seer_id, results in self._seer_results.items()}
+        branch._accused = set(self._accused)
+        branch._claimed_seers = set(self._claimed_seers)
+        return branch
+
+    def _choose(self, candidates: List[Player]) -> Optional[int]:
+        return self.rng.choice(candidates).id if candidates else None
+
+    async def generate_night_action(self, player: Player, game_state: GameState) -> Dict:
+        role_type = player.role.role_type
+        alive = game_state.get_alive_players()
+        others = [p for p in alive if p.id != player.id]
+        heuristic = self.policy == "heuristic"
+
+        if role_type == RoleType.WEREWOLF:
+            return {"werewolf_kill": {"target_id": self._kill_target(game_state)}}
+
+        if role_type == RoleType.SEER:
+            known = self._seer_results.setdefault(player.id, {})
+            unchecked = [p for p in others if p.id not in known]
+            target_id = self._choose(unchecked if heuristic and unchecked else others)
+            if target_id is not None:
+                target = game_state.get_player_by_id(target_id)
+                known[target_id] = target.role.role_type == RoleType.WEREWOLF
+            return {"seer_check": {"target_id": target_id}}
+
+        if role_type == RoleType.WITCH:
+            potions = game_state.get_witch_potions(player.id)
+            killed = game_state.get_killed_player(player.id)
+            can_save = (potions["save"] and killed is not None
+                        and (killed.id != player.id or game_state.round_number == 0))
+            if heuristic:
+                save = can_save
+                accused = [p for p in others if p.id in self._accused]
+                poison_target = self._choose(accused) if potions["poison"] and not save else None
+            else:
+                save = can_save and self.rng.random() < 0.5
+                poison_target = (self._choose(others)
+                                 if potions["poison"] and not save and self.rng.random() < 0.2 else None)
+            return {"witch_save": {"used": save}, "witch_poison": {"target_id": poison_target}}
+
+        if role_type == RoleType.GUARD:
+            # 不能连续两晚守护同一人；启发式策略优先守护跳出来的预言家
+            last_target = game_state.get_guard_target(player.id)
+            targets = [p for p in alive if p.id != last_target]
+            seers = [p for p in targets if p.id in self._claimed_seers]
+            return {"guard_protect": {"target_id": self._choose(seers if heuristic and seers else targets)}}
+
+        if role_type == RoleType.HUNTER:
+            accused = [p for p in others if p.id in self._accused]
+            return {"hunter_shot": {"target_id": self._choose(accused if heuristic and accused else others)}}
+
+        return {}
+
+    def _kill_target(self, game_state: GameState) -> Optional[int]:
+        targets = [p for p in game_state.get_alive_players() if p.id not in game_state._werewolves]
+        seers = [p for p in targets if p.id in self._claimed_seers]
+        return self._choose(seers if self.policy == "heuristic" and seers else targets)
+
+    async def generate_werewolf_team_action(self, werewolves: List[Player], game_state: GameState) -> Dict:
+        target_id = self._kill_target(game_state)
+        if target_id is None:
+            return {}
+        target = game_state.get_player_by_id(target_id)
+        return {"discussion": [{"wolf_id": wolf.id, "argument": f"刀{target.name}。"} for wolf in werewolves],
+                "werewolf_kill": {"target_id": target_id}}
+
+    async def generate_discussion(self, player: Player, game_state: GameState) -> str:
+        if self.policy == "heuristic" and player.role.role_type == RoleType.SEER:
+            wolves = [game_state.get_player_by_id(pid) for pid, is_wolf in self._seer_results.get(player.id, {}).items()
+                      if is_wolf]
+            wolves = [p for p in wolves if p and p.is_alive]
+            if wolves:
+                self._claimed_seers.add(player.id)
+                self._accused.update(p.id for p in wolves)
+                return f"我是预言家，我查验了{'、'.join(p.name for p in wolves)}，是狼人。"
+        return "过。"
+
+    async def generate_vote(self, player: Player, game_state: GameState) -> int:
+        others = [p for p in game_state.get_alive_players() if p.id != player.id]
+        if self.policy == "heuristic":
+            if player.role.role_type == RoleType.WEREWOLF:
+                good = [p for p in others if p.id not in game_state._werewolves]
+                seers = [p for p in good if p.id in self._claimed_seers]
+                candidates = seers or good
+            elif player.role.role_type == RoleType.SEER:
+                known = self._seer_results.get(player.id, {})
+                candidates = ([p for p in others if known.get(p.id)]
+                              or [p for p in others if p.id not in known])
+            else:
+                candidates = [p for p in others if p.id in self._accused]
+            target_id = self._choose(candidates or others)
+        else:
+            target_id = self._choose(others)
+        return -1 if target_id is None else target_id
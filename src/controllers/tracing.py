@@ -0,0 +1,192 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional
+import asyncio
+import functools
+import json
+import os
+import time
+
+class Span:
+    """一段有起止时间的操作，通过 parent 组成树"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent", "attributes",
+                 "start_ns", "end_ns", "lane", "error")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()  # 不消耗游戏使用的随机数
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.lane = tracer._lane()
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ns(self) -> int:
+        return (self.end_ns or time.time_ns()) - self.start_ns
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        """结束 span，重复调用没有效果"""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer._record(self)
+
+
+# 当前协程所在的 span；asyncio 创建任务时复制上下文，子任务里的 span 会自动挂到创建它的 span 下
+_current_span: ContextVar[Optional[Span]] = ContextVar("werewolf_current_span", default=None)
+
+
+class Tracer:
+    """收集一局（或多局）游戏的 span，导出为 Chrome trace 或 OTLP JSON
+
+    Chrome trace 可在 chrome://tracing 或 https://ui.perfetto.dev 打开；
+    每个 asyncio 任务占一条泳道，并发的决策和夜晚行动会显示为平行的条。
+    只保留最近结束的 max_spans 个 span，长时间运行的服务不会无限占用内存；被挤掉的数量记在 dropped。
+    """
+
+    def __init__(self, service_name: str = "ai-werewolf", max_spans: int = 100_000):
+        self.service_name = service_name
+        self.spans: Deque[Span] = deque(maxlen=max_spans)  # 已结束的 span，按结束顺序
+        self.dropped = 0
+        self._lanes: Dict[int, int] = {}
+
+    def _record(self, span: Span):
+        if len(self.spans) == self.spans.maxlen:
+            self.dropped += 1
+        self.spans.append(span)
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            return 0
+        return self._lanes.setdefault(id(task), len(self._lanes) + 1)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """开始一个不设为当前 span 的 span（用于跨越多次调用的操作，例如整局游戏），需手动 end()"""
+        return Span(self, name, parent, attributes)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes) -> Iterator[Span]:
+        """在 with 块内记录一个 span，并把它设为当前 span；parent 默认为当前 span"""
+        current = Span(self, name, parent or _current_span.get(), attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end()
+
+    def clear(self):
+        self.spans.clear()
+        self.dropped = 0
+        self._lanes.clear()
+
+    def to_chrome_trace(self) -> Dict:
+        """Chrome trace 事件格式（完整事件 "ph": "X"，时间单位微秒）"""
+        if not self.spans:
+            return {"traceEvents": [], "displayTimeUnit": "ms"}
+        origin = min(span.start_ns for span in self.spans)
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            args = dict(span.attributes)
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name,
+                "cat": "werewolf",
+                "ph": "X",
+                "ts": (span.start_ns - origin) / 1000,
+                "dur": span.duration_ns / 1000,
+                "pid": 1,
+                "tid": span.lane,
+                "args": args
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self) -> Dict:
+        """OTLP/JSON 格式（与 OpenTelemetry Collector 的 otlphttp 接收端一致）"""
+        spans = []
+        for span in self.spans:
+            record = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+            }
+            if span.parent is not None:
+                record["parentSpanId"] = span.parent.span_id
+            spans.append(record)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+        }]}
+
+    def export_chrome_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+
+    def export_otlp(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_otlp(), f, ensure_ascii=False)
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes) -> Iterator[Optional[Span]]:
+    """在当前 trace 中记录一个子 span
+
+    没有传入 parent 且当前不在任何 span 内（未开启追踪）时什么也不做，yield None，
+    所以各处可以无条件地调用。
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, parent, **attributes) as current:
+        yield current
+
+
+def traced(name: Optional[str] = None):
+    """把一个异步方法包在同名（或指定名称的）span 里"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:  # 未开启追踪时不创建上下文管理器
+                return await func(*args, **kwargs)
+            with span(name or func.__name__):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
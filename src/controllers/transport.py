@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+import json
+import time
+from .client_pool import PlayerSession
+from .rate_limit import RateLimiterRegistry
+from .response_cache import ResponseCache
+
+class Transport(ABC):
+    """LLM 传输层：把一次请求变成 {"content": 回复文本, "usage": token 用量}
+
+    实时请求还会带上 "queue_seconds"：在限流器和连接池中排队的秒数；
+    重放的响应带 "cached": True，表示没有访问服务端，usage 是录制时的用量，不计费。
+    """
+
+    remote = True  # 是否会访问网络（决定是否需要预热连接）
+
+    @abstractmethod
+    async def complete(self, session: PlayerSession, request: Dict, phase: int) -> Dict:
+        """发出一次请求（或从录制中取出响应）"""
+
+    def close(self):
+        pass
+
+
+class LiveTransport(Transport):
+    """经过模型限流器和共享连接池请求服务端"""
+
+    def __init__(self, rate_limiter: RateLimiterRegistry):
+        self.rate_limiter = rate_limiter
+
+    async def complete(self, session: PlayerSession, request: Dict, phase: int) -> Dict:
+        guard = self.rate_limiter.get(request["model"])
+        start = time.perf_counter()
+        async with guard.slot():  # 熔断器的成功/失败由 slot 在退出时记录
+            session.request_count += 1
+            async with session.endpoint.slots:
+                queue_seconds = time.perf_counter() - start
+                completion = await session.client.chat.completions.create(**request)
+        return {
+            "content": completion.choices[0].message.content or "",
+            "usage": completion.usage.model_dump(exclude_none=True) if completion.usage else {},
+            "queue_seconds": queue_seconds
+        }
+
+
+class TranscriptMismatchError(Exception):
+    """重放时遇到了录制文件中没有的请求"""
+
+
+def _preview(request: Dict) -> str:
+    """请求最后一条消息的开头，用于在不一致时定位问题"""
+    content = request["messages"][-1]["content"]
+    return " ".join(content.split())[:80]
+
+
+class RecordingTransport(Transport):
+    """把每一对请求与响应追加写入录制文件（JSONL，每行一次调用）
+
+    文件只保存请求的哈希和开头片段，不保存完整提示词，以保持紧凑。
+    """
+
+    def __init__(self, inner: Transport, path: str):
+        self.inner = inner
+        self.remote = inner.remote
+        self._file = open(path, "a", encoding="utf-8")
+
+    async def complete(self, session: PlayerSession, request: Dict, phase: int) -> Dict:
+        result = await self.inner.complete(session, request, phase)
+        entry = {
+            "phase": phase,
+            "player_id": session.player_id,
+            "key": ResponseCache.make_key(request),
+            "prompt": _preview(request),
+            "content": result["content"],
+            "usage": result.get("usage", {})
+        }
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+        return result
+
+    def close(self):
+        self.inner.close()
+        self._file.close()
+
+
+class ReplayTransport(Transport):
+    """按录制文件重放响应，没有任何网络延迟
+
+    同一阶段内的请求按内容匹配（并发决策的先后顺序可能不同），
+    遇到录制中不存在的请求时直接抛出 TranscriptMismatchError。
+    指定 live_from_phase 时，从该阶段起改为使用 live 传输层实时请求。
+    """
+
+    def __init__(self, path: str, live: Optional[Transport] = None, live_from_phase: Optional[int] = None):
+        if live_from_phase is not None and live is None:
+            raise ValueError("指定 live_from_phase 时必须提供 live 传输层")
+        self.live = live
+        self.live_from_phase = live_from_phase
+        self.remote = live is not None
+        # 阶段 -> 请求哈希 -> 按录制顺序排列的响应
+        self._entries: Dict[int, Dict[str, Deque[Dict]]] = defaultdict(lambda: defaultdict(deque))
+        self.replayed = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["phase"]][entry["key"]].append(entry)
+
+    def remaining(self) -> List[Dict]:
+        """尚未被重放的录制条目"""
+        return [entry for phase in sorted(self._entries) for queue in self._entries[phase].values()
+                for entry in queue]
+
+    async def complete(self, session: PlayerSession, request: Dict, phase: int) -> Dict:
+        if self.live_from_phase is not None and phase >= self.live_from_phase:
+            return await self.live.complete(session, request, phase)
+
+        queue = self._entries[phase].get(ResponseCache.make_key(request))
+        if not queue:
+            expected = [entry["prompt"] for q in self._entries[phase].values() for entry in q]
+            raise TranscriptMismatchError(
+                f"第{phase}阶段玩家 {session.player_id} 的请求不在录制中: {_preview(request)!r}，"
+                f"该阶段尚未重放的请求: {expected!r}"
+            )
+        entry = queue.popleft()
+        self.replayed += 1
+        return {"content": entry["content"], "usage": entry.get("usage", {}), "cached": True}
+
+    def close(self):
+        if self.live:
+            self.live.close()
@@ -1,6 +1,11 @@
+from bisect import bisect_left
 from enum import Enum
-from typing import List, Dict, Optional
+from heapq import merge
+from typing import Any, Callable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class GameEventType(Enum):
     GAME_START = "game_start"
@@ -15,6 +20,115 @@ class GameEventType(Enum):
     PLAYER_VOTE = "player_vote"
     VOTE_RESULT = "vote_result"
     PLAYER_SPEAK = "player_speak"
+    GUARD_PROTECT = "guard_protect"
+
+PHASE_NAMES = {
+    "night": "夜晚",
+    "day": "白天",
+    "vote": "投票"
+}
+
+def _render_game_start(details: Dict) -> str:
+    return f"游戏开始！共有{details['player_count']}名玩家参与。"
+
+def _render_game_end(details: Dict) -> str:
+    return f"游戏结束！{details['winning_team']}阵营获胜，共进行了{details['rounds']}个回合。"
+
+def _render_phase_change(details: Dict) -> str:
+    return f"进入{PHASE_NAMES[details['phase']]}阶段。"
+
+def _render_player_death(details: Dict) -> str:
+    if details.get("message"):  # 处理平安夜消息
+        return details["message"]
+    elif details.get("player_name"):  # 处理玩家死亡
+        if details.get("role_revealed", False):
+            return f"玩家 {details['player_name']}({details['role']}) 死亡。"
+        else:
+            return f"玩家 {details['player_name']} 死亡。"
+    return "有玩家死亡。"  # 默认消息
+
+def _render_werewolf_kill(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]
+    if details.get("target_name"):
+        return f"狼人选择击杀 {details['target_name']}。"
+    return "狼人选择了他们的目标。"
+
+def _render_witch_save(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]
+    if details.get("saved"):
+        if details.get("target_name"):
+            return f"女巫使用解药救活了 {details['target_name']}。"
+        return "女巫使用了解药。"
+    return "女巫没有使用解药。"
+
+def _render_witch_poison(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]
+    if details.get("used"):
+        if details.get("target_name"):
+            return f"女巫使用毒药毒死了 {details['target_name']}。"
+        return "女巫使用了毒药。"
+    return "女巫没有使用毒药。"
+
+def _render_seer_check(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]  # 直接返回消息
+    if details.get("target_name"):
+        if "role" in details:  # 如果包含角色信息（预言家专属）
+            return f"预言家查验了 {details['target_name']}，Ta是{details['role']}"
+        return f"预言家查验了 {details['target_name']}"  # 公开信息
+    return "预言家查验了一名玩家"
+
+def _render_guard_protect(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]
+    return f"守卫守护了 {details['target_name']}。"
+
+def _render_hunter_shot(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]
+    return f"猎人 {details['hunter_name']} 开枪带走了 {details['target_name']}。"
+
+def _render_player_vote(details: Dict) -> str:
+    if details.get("message"):
+        return details["message"]
+    return f"{details['voter_name']} 投票给了 {details['target_name']}。"
+
+def _render_vote_result(details: Dict) -> str:
+    if details.get("is_tie"):
+        return "投票结果为平票，没有玩家被放逐。"
+    return f"投票结果：{details['voted_name']} 被放逐。"
+
+def _render_player_speak(details: Dict) -> str:
+    if details.get("is_last_words", False):
+        return f"[遗言] {details['player_name']}: {details['message']}"
+    return f"{details['player_name']}: {details['message']}"
+
+# 事件类型 -> 渲染函数
+_RENDERERS: Dict[GameEventType, Callable[[Dict], str]] = {
+    GameEventType.GAME_START: _render_game_start,
+    GameEventType.GAME_END: _render_game_end,
+    GameEventType.PHASE_CHANGE: _render_phase_change,
+    GameEventType.PLAYER_DEATH: _render_player_death,
+    GameEventType.WEREWOLF_KILL: _render_werewolf_kill,
+    GameEventType.WITCH_SAVE: _render_witch_save,
+    GameEventType.WITCH_POISON: _render_witch_poison,
+    GameEventType.SEER_CHECK: _render_seer_check,
+    GameEventType.HUNTER_SHOT: _render_hunter_shot,
+    GameEventType.PLAYER_VOTE: _render_player_vote,
+    GameEventType.VOTE_RESULT: _render_vote_result,
+    GameEventType.PLAYER_SPEAK: _render_player_speak,
+    GameEventType.GUARD_PROTECT: _render_guard_protect,
+}
+
+def render_event(event_type: GameEventType, details: Dict) -> str:
+    """把事件渲染为可读文本"""
+    renderer = _RENDERERS.get(event_type)
+    if renderer is None:
+        return str(details)  # 默认返回详情的字符串形式
+    return renderer(details)
 
 class GameEvent:
     def __init__(self, event_type: GameEventType, details: Dict, public: bool = True):
@@ -22,6 +136,23 @@ class GameEvent:
         self.details = details
         self.timestamp = datetime.now()
         self.public = public  # 是否是公开信息
+        self.seq: Optional[int] = None  # 在日志中的序号，加入 GameLog 时分配
+        self.round = 0  # 事件发生的回合，加入 GameLog 时按最近一次阶段切换确定
+        self._text: Optional[str] = None  # 渲染结果缓存
+    
+    @property
+    def text(self) -> str:
+        """事件的可读文本，第一次读取时渲染，之后直接返回缓存"""
+        if self._text is None:
+            self._text = render_event(self.event_type, self.details)
+        return self._text
+    
+    @property
+    def audience(self) -> Optional[int]:
+        """私密事件的可见玩家ID；公开事件或无人可见的私密事件返回 None"""
+        if self.public:
+            return None
+        return self.details.get("player_id")
     
     def to_dict(self) -> Dict:
         return {
@@ -30,120 +161,234 @@ class GameEvent:
             "timestamp": self.timestamp.isoformat(),
             "public": self.public
         }
+    
+    @classmethod
+    def from_dict(cls, record: Dict) -> "GameEvent":
+        """由 to_dict() 的结果（可带 seq、round）还原事件，用于从事件存储恢复日志"""
+        event = cls(GameEventType(record["type"]), record["details"], record.get("public", True))
+        event.timestamp = datetime.fromisoformat(record["timestamp"])
+        event.seq = record.get("seq")
+        event.round = record.get("round", 0)
+        return event
+
+class LogCursor:
+    """某个读者在日志中的读取位置，每次 read() 只返回上次读取之后新增的可见事件"""
+
+    def __init__(self, game_log: "GameLog", player_id: Optional[int] = None, position: int = 0):
+        self.game_log = game_log
+        self.player_id = player_id  # None 表示只读公开事件
+        self.position = position  # 下一个尚未读取的事件序号
+
+    def read(self) -> List[GameEvent]:
+        events, self.position = self.game_log.events_since(self.position, self.player_id)
+        return events
+
+class _EventStream:
+    """只追加的事件序列，分支之间共用已有的事件
+
+    分支时把已有事件冻结成只读的段，两边共用这些段，之后各自只往自己的最后一段追加；
+    分支和之后的写入都不复制已有事件，开销与段数（经过的分支次数）有关，与历史长短无关。
+    """
+
+    __slots__ = ("_segments", "_frozen", "_tail")
+
+    def __init__(self):
+        self._segments: List[List[GameEvent]] = []  # 冻结的段，不再修改
+        self._frozen = 0  # 冻结的段中的事件数
+        self._tail: List[GameEvent] = []  # 本分支追加的事件
+
+    def fork(self) -> "_EventStream":
+        """冻结当前的最后一段，返回共用全部已有事件的分支"""
+        if self._tail:
+            self._segments = self._segments + [self._tail]  # 新的段列表，之前的分支仍持有旧的
+            self._frozen += len(self._tail)
+            self._tail = []
+        branch = _EventStream.__new__(_EventStream)
+        branch._segments = self._segments
+        branch._frozen = self._frozen
+        branch._tail = []
+        return branch
+
+    def append(self, event: GameEvent):
+        self._tail.append(event)
+
+    def __len__(self) -> int:
+        return self._frozen + len(self._tail)
+
+    def __iter__(self) -> Iterator[GameEvent]:
+        for segment in self._segments:
+            yield from segment
+        yield from self._tail
+
+    def bisect(self, value: Any, key: Callable[[GameEvent], Any]) -> int:
+        """第一个 key(事件) 不小于 value 的位置（事件按 key 有序）"""
+        offset = 0
+        for segment in self._segments:
+            if key(segment[-1]) >= value:
+                return offset + bisect_left(segment, value, key=key)
+            offset += len(segment)
+        return offset + bisect_left(self._tail, value, key=key)
+
+    def slice(self, start: int, end: Optional[int] = None) -> List[GameEvent]:
+        """位置在 [start, end) 的事件"""
+        if not self._segments:
+            return self._tail[start:end]
+        end = len(self) if end is None else end
+        events: List[GameEvent] = []
+        offset = 0
+        for segment in self._segments + [self._tail]:
+            if offset >= end:
+                break
+            if offset + len(segment) > start:
+                events.extend(segment[max(0, start - offset):end - offset])
+            offset += len(segment)
+        return events
+
 
 class GameLog:
+    """游戏事件日志
+
+    除了按时间顺序的全部事件，还按可见范围建立索引：一条公开事件流，
+    以及每名玩家各自的私密事件流。读取时只需定位起点并切片，不必遍历全部历史。
+    """
+
     def __init__(self):
-        self._events: List[GameEvent] = []
+        self._events = _EventStream()
+        self._public = _EventStream()
+        self._private: Dict[int, _EventStream] = {}  # 玩家ID -> 只对该玩家可见的事件
+        self._listeners: List[Callable[[GameEvent], None]] = []
+        self._round = 0  # 当前回合，随 PHASE_CHANGE 事件更新
+        self._round_summaries: Dict[int, str] = {}  # 回合 -> 该回合公开事件的摘要
+    
+    def fork(self) -> "GameLog":
+        """分支：与本日志共用已有事件和索引，开销与玩家数、回合数有关，与历史长短无关
+
+        已有事件冻结成只读的段由两边共用，之后两边都只为自己追加的事件付出开销（见 _EventStream）。
+        分支不继承监听器，分支上的事件不会写入存储或推送给订阅者。
+        """
+        branch = GameLog.__new__(GameLog)
+        branch._events = self._events.fork()
+        branch._public = self._public.fork()
+        branch._private = {player_id: events.fork() for player_id, events in self._private.items()}
+        branch._listeners = []
+        branch._round = self._round
+        branch._round_summaries = dict(self._round_summaries)
+        return branch
+    
+    def add_listener(self, listener: Callable[[GameEvent], None]):
+        """注册回调，每条新事件加入日志后调用"""
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[GameEvent], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
     
     def add_event(self, event: GameEvent):
         """添加游戏事件"""
+        if event.event_type == GameEventType.PHASE_CHANGE:
+            self._round = event.details.get("round", self._round)
+        event.seq = len(self._events)
+        event.round = self._round
         self._events.append(event)
+        if event.public:
+            self._public.append(event)
+        elif event.audience is not None:
+            self._private.setdefault(event.audience, _EventStream()).append(event)
+        for listener in self._listeners:
+            listener(event)
+    
+    def load_events(self, events: List[GameEvent]):
+        """批量载入已经发生过的事件（从事件存储恢复对局时使用）
+
+        事件保留原来的回合，按顺序接在日志末尾并建立索引，但不通知监听器：
+        它们已经被持久化和推送过，不能再写一遍。
+        """
+        for event in events:
+            event.seq = len(self._events)
+            self._events.append(event)
+            if event.public:
+                self._public.append(event)
+            elif event.audience is not None:
+                self._private.setdefault(event.audience, _EventStream()).append(event)
+            if event.event_type == GameEventType.PHASE_CHANGE:
+                self._round = event.details.get("round", self._round)
+    
+    def __len__(self) -> int:
+        return len(self._events)
+    
+    def _normalize_start(self, start_index: int) -> int:
+        """负数起点与列表切片的含义一致，表示最近若干条事件"""
+        if start_index < 0:
+            return max(0, len(self._events) + start_index)
+        return start_index
+    
+    @staticmethod
+    def _tail(stream: Optional[_EventStream], start: int) -> List[GameEvent]:
+        """取出一条事件流中序号不小于 start 的部分"""
+        if stream is None:
+            return []
+        return stream.slice(stream.bisect(start, key=lambda e: e.seq))
+    
+    def events_since(self, cursor: int, player_id: Optional[int] = None) -> Tuple[List[GameEvent], int]:
+        """返回序号不小于 cursor 的可见事件和新的游标位置
+
+        player_id 为 None 时只返回公开事件，否则返回公开事件和该玩家的私密事件（按时间顺序）。
+        """
+        start = self._normalize_start(cursor)
+        public = self._tail(self._public, start)
+        private = self._tail(self._private.get(player_id), start) if player_id is not None else []
+        if not private:
+            events = public
+        elif not public:
+            events = private
+        else:
+            events = list(merge(public, private, key=lambda e: e.seq))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("玩家 %s 从第 %d 条起可见事件数: %d，总事件数: %d",
+                         player_id, start, len(events), len(self._events))
+        return events, len(self._events)
+    
+    def all_events_since(self, cursor: int) -> Tuple[List[GameEvent], int]:
+        """返回序号不小于 cursor 的全部事件（上帝视角，含所有私密事件）和新的游标位置"""
+        return self._events.slice(self._normalize_start(cursor)), len(self._events)
+    
+    def round_events(self, round_number: int) -> List[GameEvent]:
+        """某一回合的全部公开事件"""
+        start = self._public.bisect(round_number, key=lambda e: e.round)
+        end = self._public.bisect(round_number + 1, key=lambda e: e.round)
+        return self._public.slice(start, end)
+    
+    def set_round_summary(self, round_number: int, summary: str):
+        """缓存一个回合的摘要（每回合只生成一次）"""
+        self._round_summaries[round_number] = summary
+    
+    def get_round_summary(self, round_number: int) -> Optional[str]:
+        return self._round_summaries.get(round_number)
+    
+    def get_round_summaries(self) -> Dict[int, str]:
+        """全部已生成的回合摘要"""
+        return dict(self._round_summaries)
+    
+    def cursor(self, player_id: Optional[int] = None, position: int = 0) -> LogCursor:
+        """创建一个读取游标"""
+        return LogCursor(self, player_id, position)
     
     def get_public_events(self, start_index: int = 0) -> List[Dict]:
         """获取公开事件列表"""
-        return [event.to_dict() for event in self._events[start_index:] if event.public]
+        events, _ = self.events_since(start_index)
+        return [event.to_dict() for event in events]
     
     def get_player_events(self, player_id: int, start_index: int = 0) -> List[Dict]:
         """获取指定玩家可见的事件列表"""
-        player_events = []
-        print(f"[DEBUG] 获取玩家 {player_id} 的事件，总事件数: {len(self._events)}")
-        for event in self._events[start_index:]:
-            print(f"[DEBUG] 检查事件: type={event.event_type.value}, public={event.public}, details={event.details}")
-            if event.public:
-                player_events.append(event.to_dict())
-            elif "player_id" in event.details and event.details["player_id"] == player_id:
-                print(f"[DEBUG] 添加私密事件给玩家 {player_id}")
-                player_events.append(event.to_dict())
-        print(f"[DEBUG] 玩家 {player_id} 可见事件数: {len(player_events)}")
-        return player_events
+        events, _ = self.events_since(start_index, player_id)
+        return [event.to_dict() for event in events]
     
     def get_all_events(self) -> List[Dict]:
         """获取所有事件（仅用于调试）"""
         return [event.to_dict() for event in self._events]
     
-    def format_event(self, event: Dict) -> str:
-        """格式化事件为可读文本"""
-        # 如果传入的是字典，直接使用，否则尝试获取事件的详情
-        details = event.get('details') if isinstance(event, dict) else event.details
-        event_type = GameEventType(event.get('type')) if isinstance(event, dict) else event.event_type
-        
-        if event_type == GameEventType.GAME_START:
-            return f"游戏开始！共有{details['player_count']}名玩家参与。"
-            
-        elif event_type == GameEventType.GAME_END:
-            return f"游戏结束！{details['winning_team']}阵营获胜，共进行了{details['rounds']}个回合。"
-            
-        elif event_type == GameEventType.PHASE_CHANGE:
-            phase_names = {
-                "night": "夜晚",
-                "day": "白天",
-                "vote": "投票"
-            }
-            return f"进入{phase_names[details['phase']]}阶段。"
-            
-        elif event_type == GameEventType.PLAYER_DEATH:
-            if details.get("message"):  # 处理平安夜消息
-                return details["message"]
-            elif details.get("player_name"):  # 处理玩家死亡
-                if details.get("role_revealed", False):
-                    return f"玩家 {details['player_name']}({details['role']}) 死亡。"
-                else:
-                    return f"玩家 {details['player_name']} 死亡。"
-            return "有玩家死亡。"  # 默认消息
-            
-        elif event_type == GameEventType.WEREWOLF_KILL:
-            if details.get("message"):
-                return details["message"]
-            if details.get("target_name"):
-                return f"狼人选择击杀 {details['target_name']}。"
-            return "狼人选择了他们的目标。"
-            
-        elif event_type == GameEventType.WITCH_SAVE:
-            if details.get("message"):
-                return details["message"]
-            if details.get("saved"):
-                if details.get("target_name"):
-                    return f"女巫使用解药救活了 {details['target_name']}。"
-                return "女巫使用了解药。"
-            return "女巫没有使用解药。"
-            
-        elif event_type == GameEventType.WITCH_POISON:
-            if details.get("message"):
-                return details["message"]
-            if details.get("used"):
-                if details.get("target_name"):
-                    return f"女巫使用毒药毒死了 {details['target_name']}。"
-                return "女巫使用了毒药。"
-            return "女巫没有使用毒药。"
-            
-        elif event_type == GameEventType.SEER_CHECK:
-            if details.get("message"):
-                return details["message"]  # 直接返回消息
-            if details.get("target_name"):
-                if "role" in details:  # 如果包含角色信息（预言家专属）
-                    return f"预言家查验了 {details['target_name']}，Ta是{details['role']}"
-                return f"预言家查验了 {details['target_name']}"  # 公开信息
-            return "预言家查验了一名玩家"
-            
-        elif event_type == GameEventType.HUNTER_SHOT:
-            if details.get("message"):
-                return details["message"]
-            return f"猎人 {details['hunter_name']} 开枪带走了 {details['target_name']}。"
-            
-        elif event_type == GameEventType.PLAYER_VOTE:
-            if details.get("message"):
-                return details["message"]
-            return f"{details['voter_name']} 投票给了 {details['target_name']}。"
-            
-        elif event_type == GameEventType.VOTE_RESULT:
-            if details.get("is_tie"):
-                return "投票结果为平票，没有玩家被放逐。"
-            else:
-                return f"投票结果：{details['voted_name']} 被放逐。"
-            
-        elif event_type == GameEventType.PLAYER_SPEAK:
-            if details.get("is_last_words", False):
-                return f"[遗言] {details['player_name']}: {details['message']}"
-            return f"{details['player_name']}: {details['message']}"
-            
-        return str(details)  # 默认返回详情的字符串形式 
\ No newline at end of file
+    def format_event(self, event) -> str:
+        """格式化事件为可读文本（GameEvent 会缓存渲染结果）"""
+        if isinstance(event, GameEvent):
+            return event.text
+        return render_event(GameEventType(event.get('type')), event.get('details'))
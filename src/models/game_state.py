@@ -1,7 +1,9 @@
+import copy
 from enum import Enum
 from typing import List, Dict, Optional, Set, Tuple
+from .game_log import GameLog
 from .player import Player
-from .role import RoleType
+from .role import Role, RoleType
 
 class GamePhase(Enum):
     NIGHT = "night"
@@ -26,16 +28,36 @@ class GameState:
         self._checked_players: Dict[int, Set[int]] = {}  # 预言家ID -> 已查验的玩家ID集合
         self._check_results: Dict[int, Dict] = {}  # 预言家ID -> 查验结果
         self._witch_potions: Dict[int, Dict[str, bool]] = {}  # 女巫ID -> 药水状态
+        self._guard_targets: Dict[int, Optional[int]] = {}  # 守卫ID -> 最近一晚守护的玩家ID（不能连续两晚守同一人）
         self._last_night_killed: Optional[int] = None  # 昨晚被狼人杀害的玩家ID
         self._last_night_saved: bool = False  # 昨晚是否被女巫救活
-        self._last_night_poisoned: Optional[int] = None  # 昨晚被女巫毒死的玩家ID
+        self._last_night_poisoned: Optional[int] = None  # 昨晚被女巫毒死的玩家ID（多名女巫时每晚也只有一瓶毒药生效）
+        self._last_night_guarded: Set[int] = set()  # 昨晚被守卫守护的玩家ID
         self._hunter_shot_target: Optional[int] = None  # 猎人开枪带走的玩家ID
         self._werewolves: Set[int] = set()  # 狼人玩家ID集合
         self._game_over = False  # 游戏是否结束
         self._winning_team = WinningTeam.NONE  # 获胜阵营
+        self.game_log: Optional[GameLog] = None  # 本局的事件日志，由 GameController 关联，reset 时保留
+        self._reset_indexes()
+    
+    def _reset_indexes(self):
+        """清空玩家索引
+
+        索引在 add_player 时建立，玩家存活状态变化时由 Player.is_alive 回调更新，
+        因此玩家必须通过 add_player 加入，不要直接修改 players 列表。
+        """
+        self._players_by_id: Dict[int, Player] = {}
+        self._players_by_name: Dict[str, Player] = {}
+        self._players_by_role: Dict[RoleType, List[Player]] = {}
+        self._alive_ids: Set[int] = set()
+        self._alive_cache: Optional[List[Player]] = None  # 存活玩家列表，存活状态变化时丢弃重建
+        self._alive_werewolf_count = 0
+        self._alive_villager_count = 0  # 存活的非狼人玩家数
     
     def reset(self):
         """重置游戏状态"""
+        for player in self.players:
+            player._game_state = None
         self.players = []
         self.current_phase = GamePhase.NIGHT
         self.round_number = 0
@@ -44,23 +66,154 @@ class GameState:
         self._checked_players = {}
         self._check_results = {}  # 重置查验结果
         self._witch_potions = {}
+        self._guard_targets = {}
         self._last_night_killed = None
         self._last_night_saved = False
         self._last_night_poisoned = None
+        self._last_night_guarded = set()
         self._hunter_shot_target = None
         self._werewolves = set()
         self._game_over = False
         self._winning_team = WinningTeam.NONE
+        self._reset_indexes()
+    
+    @property
+    def phase_index(self) -> int:
+        """全局阶段序号：每回合依次为夜晚、白天、投票，从 0 开始计数
+
+        每回合占 4 个序号，第 4 个留给游戏结束，结束阶段的序号不会与任何一个进行中的阶段相同。
+        """
+        order = {GamePhase.NIGHT: 0, GamePhase.DAY: 1, GamePhase.VOTE: 2, GamePhase.GAME_OVER: 3}
+        return self.round_number * 4 + order[self.current_phase]
+    
+    def snapshot(self) -> "GameState":
+        """生成当前状态的冻结快照
+
+        并发决策时所有玩家读取同一份快照，决策结果再统一写回真实状态。
+        快照只读，直接共用同一个日志（日志只追加）。
+        """
+        return self._branch(self.game_log)
+    
+    def fork(self) -> "GameState":
+        """写时复制的分支，用于前瞻搜索和反事实推演（“如果女巫毒了 X 会怎样”）
+
+        分支可以像真实状态一样推进，与原状态互不影响。开销与对局进行了多久无关：
+        日志用 GameLog.fork() 共用已有事件，角色、发言记录等不可变或写时复制的部分直接共用，
+        只复制每名玩家的存活状态和索引，以及少量按角色记录的状态（O(玩家数)）。
+        """
+        return self._branch(self.game_log.fork() if self.game_log is not None else None)
+    
+    def _branch(self, game_log: Optional[GameLog]) -> "GameState":
+        clone = GameState.__new__(GameState)
+        clone.__dict__.update(self.__dict__)
+        clone.game_log = game_log
+        clone.votes = dict(self.votes)
+        clone._night_actions = dict(self._night_actions)  # 行动记录整条替换，不原地修改
+        clone._checked_players = {seer_id: set(ids) for seer_id, ids in self._checked_players.items()}
+        clone._witch_potions = {witch_id: dict(potions) for witch_id, potions in self._witch_potions.items()}
+        clone._guard_targets = dict(self._guard_targets)
+        clone._last_night_guarded = set(self._last_night_guarded)
+        clone._werewolves = set(self._werewolves)
+        clone._alive_ids = set(self._alive_ids)
+        clone._alive_cache = None
+        
+        clone.players = []
+        clone._players_by_id = {}
+        clone._players_by_name = {}
+        clone._players_by_role = {}
+        for player in self.players:
+            branch_player = Player.__new__(Player)
+            branch_player.__dict__.update(player.__dict__)  # 共用角色和发言记录
+            player.share_chat()
+            branch_player.share_chat()
+            if player.role.role_type == RoleType.WITCH:
+                branch_player.role = copy.copy(player.role)  # 药水标记会被修改
+            branch_player._game_state = clone
+            clone.players.append(branch_player)
+            clone._players_by_id[player.id] = branch_player
+            clone._players_by_name[player.name] = branch_player
+            clone._players_by_role.setdefault(player.role.role_type, []).append(branch_player)
+        clone._check_results = {seer_id: dict(result, player=clone._players_by_id.get(result["player"].id))
+                                for seer_id, result in self._check_results.items()}
+        return clone
+    
+    def dump_state(self) -> Dict:
+        """导出可 JSON 序列化的紧凑状态，用于持久化快照（不含事件日志）"""
+        return {
+            "players": [
+                {
+                    "id": p.id,
+                    "name": p.name,
+                    "role": p.role.role_type.value,
+                    "alive": p.is_alive,
+                    "death_reason": p.death_reason,
+                    "has_antidote": p.role.has_antidote,
+                    "has_poison": p.role.has_poison,
+                    "chat_history": list(p.chat_history)
+                } for p in self.players
+            ],
+            "phase": self.current_phase.value,
+            "round": self.round_number,
+            "votes": self.votes,
+            "night_actions": self._night_actions,
+            "checked_players": {seer_id: sorted(ids) for seer_id, ids in self._checked_players.items()},
+            "check_results": {seer_id: {"player_id": result["player"].id, "role": result["role"]}
+                              for seer_id, result in self._check_results.items()},
+            "witch_potions": self._witch_potions,
+            "guard_targets": self._guard_targets,
+            "last_night_killed": self._last_night_killed,
+            "last_night_saved": self._last_night_saved,
+            "last_night_poisoned": self._last_night_poisoned,
+            "last_night_guarded": sorted(self._last_night_guarded),
+            "hunter_shot_target": self._hunter_shot_target,
+            "game_over": self._game_over,
+            "winning_team": self._winning_team.value
+        }
+    
+    def load_state(self, data: Dict):
+        """用 dump_state() 的结果（可能经过 JSON 往返，字典键变成字符串）恢复状态，保留关联的日志"""
+        self.reset()
+        for info in data["players"]:
+            player = Player(info["id"], info["name"], Role(RoleType(info["role"])))
+            self.add_player(player)
+            player.is_alive = info["alive"]
+            player.death_reason = info["death_reason"]
+            player.role.has_antidote = info["has_antidote"]
+            player.role.has_poison = info["has_poison"]
+            player.chat_history = list(info["chat_history"])
+        self.current_phase = GamePhase(data["phase"])
+        self.round_number = data["round"]
+        self.votes = {int(voter): target for voter, target in data["votes"].items()}
+        self._night_actions = copy.deepcopy(data["night_actions"])
+        self._checked_players = {int(seer_id): set(ids) for seer_id, ids in data["checked_players"].items()}
+        self._check_results = {int(seer_id): {"player": self.get_player_by_id(result["player_id"]),
+                                              "role": result["role"]}
+                               for seer_id, result in data["check_results"].items()}
+        self._witch_potions = {int(witch_id): dict(potions) for witch_id, potions in data["witch_potions"].items()}
+        self._guard_targets = {int(guard_id): target for guard_id, target in data.get("guard_targets", {}).items()}
+        self._last_night_killed = data["last_night_killed"]
+        self._last_night_saved = data["last_night_saved"]
+        self._last_night_poisoned = data["last_night_poisoned"]
+        self._last_night_guarded = set(data.get("last_night_guarded", []))
+        self._hunter_shot_target = data["hunter_shot_target"]
+        self._game_over = data["game_over"]
+        self._winning_team = WinningTeam(data["winning_team"])
     
     def add_player(self, player: Player):
         """添加玩家到游戏"""
         # 重置玩家状态
+        player._game_state = None
         player.is_alive = True
         player.death_reason = None
         player.chat_history = []
         
-        # 添加玩家
+        # 添加玩家并建立索引
         self.players.append(player)
+        player._game_state = self
+        self._players_by_id[player.id] = player
+        self._players_by_name[player.name] = player
+        self._players_by_role.setdefault(player.role.role_type, []).append(player)
+        self._on_alive_changed(player)
         
         # 初始化特殊角色的状态记录
         if player.role.role_type == RoleType.SEER:
@@ -69,16 +222,55 @@ class GameState:
             self._witch_potions[player.id] = {"save": True, "poison": True}
             player.role.has_antidote = True
             player.role.has_poison = True
+        elif player.role.role_type == RoleType.GUARD:
+            self._guard_targets[player.id] = None
         elif player.role.role_type == RoleType.WEREWOLF:
             self._werewolves.add(player.id)
     
+    def _on_alive_changed(self, player: Player):
+        """玩家加入或存活状态变化时更新存活索引和阵营计数"""
+        self._alive_cache = None
+        delta = 1 if player.is_alive else -1
+        if player.is_alive:
+            self._alive_ids.add(player.id)
+        else:
+            self._alive_ids.discard(player.id)
+        if player.role.role_type == RoleType.WEREWOLF:
+            self._alive_werewolf_count += delta
+        else:
+            self._alive_villager_count += delta
+    
     def get_alive_players(self) -> List[Player]:
-        """获取存活玩家列表"""
-        return [p for p in self.players if p.is_alive]
+        """获取存活玩家列表（按加入顺序）
+
+        返回的列表在存活状态变化前会被重复使用，调用方不要修改它。
+        """
+        if self._alive_cache is None:
+            self._alive_cache = [p for p in self.players if p.id in self._alive_ids]
+        return self._alive_cache
+    
+    def is_alive(self, player_id: int) -> bool:
+        """玩家是否存活"""
+        return player_id in self._alive_ids
     
     def get_player_by_id(self, player_id: int) -> Optional[Player]:
         """根据ID获取玩家"""
-        return next((p for p in self.players if p.id == player_id), None)
+        return self._players_by_id.get(player_id)
+    
+    def get_player_by_name(self, name: str) -> Optional[Player]:
+        """根据名字获取玩家"""
+        return self._players_by_name.get(name)
+    
+    def get_players_by_role(self, role_type: RoleType, alive_only: bool = False) -> List[Player]:
+        """获取某个角色的全部玩家（按加入顺序）"""
+        players = self._players_by_role.get(role_type, [])
+        if alive_only:
+            return [p for p in players if p.is_alive]
+        return list(players)
+    
+    def get_player_by_role(self, role_type: RoleType, alive_only: bool = False) -> Optional[Player]:
+        """获取某个角色的第一名玩家"""
+        return next((p for p in self._players_by_role.get(role_type, []) if p.is_alive or not alive_only), None)
     
     def get_checked_players(self, seer_id: int) -> List[str]:
         """获取预言家已查验的玩家名单（仅对应预言家可见）"""
@@ -87,9 +279,14 @@ class GameState:
         return [p.name for p in self.players if p.id in self._checked_players[seer_id]]
     
     def get_killed_player(self, witch_id: int) -> Optional[Player]:
-        """获取当晚被狼人杀害的玩家（仅女巫可见）"""
+        """获取当晚被狼人杀害的玩家（仅女巫可见）
+
+        多名女巫依次行动，已经有女巫救下了这名玩家时，后面的女巫看不到击杀目标。
+        """
         if self.current_phase != GamePhase.NIGHT or "werewolf_kill" not in self._night_actions:
             return None
+        if self._last_night_saved:
+            return None
         # 确保是女巫在查看
         witch = self.get_player_by_id(witch_id)
         if not witch or witch.role.role_type != RoleType.WITCH:
@@ -101,10 +298,19 @@ class GameState:
         """获取女巫药水状态（仅对应女巫可见）"""
         return self._witch_potions.get(witch_id, {"save": False, "poison": False}).copy()
     
+    def get_guard_target(self, guard_id: int) -> Optional[int]:
+        """守卫最近一晚守护的玩家ID（仅对应守卫可见），今晚不能再守这名玩家"""
+        return self._guard_targets.get(guard_id)
+    
+    def is_killed_tonight(self) -> bool:
+        """狼人的击杀目标今晚是否真的死亡：没有被女巫救下，也没有被守卫守护"""
+        return (bool(self._last_night_killed) and not self._last_night_saved
+                and self._last_night_killed not in self._last_night_guarded)
+    
     def get_last_night_dead_players(self) -> List[Player]:
         """获取昨晚死亡的玩家列表（所有人可见）"""
         dead_players = []
-        if self._last_night_killed and not self._last_night_saved:
+        if self.is_killed_tonight():
             killed_player = self.get_player_by_id(self._last_night_killed)
             if killed_player:
                 dead_players.append(killed_player)
@@ -115,13 +321,18 @@ class GameState:
         return dead_players
     
     def get_last_check_result(self, seer_id: int) -> Optional[Dict]:
-        """获取预言家的最后一次查验结果（仅对应预言家可见）"""
+        """获取预言家当晚的查验结果（仅对应预言家可见）"""
         if seer_id not in self._checked_players:
             return None
         if "seer_check" not in self._night_actions:
             return None
-            
-        target_id = self._night_actions["seer_check"]["target_id"]
+        
+        # 多名预言家时 seer_check 只是最后一次查验，各自的结果在 _check_results 里
+        action = self._night_actions["seer_check"]
+        if action.get("seer_id", seer_id) != seer_id:
+            result = self._check_results.get(seer_id)
+            return dict(result) if result else None
+        target_id = action["target_id"]
         target = self.get_player_by_id(target_id)
         if target:
             return {
@@ -134,8 +345,7 @@ class GameState:
         """获取其他狼人队友（仅对应狼人可见）"""
         if werewolf_id not in self._werewolves:
             return []
-        return [p for p in self.get_alive_players() 
-                if p.id in self._werewolves and p.id != werewolf_id]
+        return [p for p in self.get_players_by_role(RoleType.WEREWOLF, alive_only=True) if p.id != werewolf_id]
     
     def record_night_action(self, action_type: str, details: Dict):
         """记录夜晚行动"""
@@ -147,21 +357,21 @@ class GameState:
         if "werewolf_kill" in self._night_actions:
             self._last_night_killed = self._night_actions["werewolf_kill"]["target_id"]
         
-        # 记录预言家查验
+        # 记录预言家查验（行动里没有注明是哪名预言家时，归到第一名预言家）
         if "seer_check" in self._night_actions:
-            seer_id = next((p.id for p in self.players if p.role.role_type == RoleType.SEER), None)
+            seer_id = self._night_actions["seer_check"].get("seer_id") or self._first_id(RoleType.SEER)
             if seer_id:
                 self._checked_players[seer_id].add(self._night_actions["seer_check"]["target_id"])
         
         # 处理女巫行动
         if "witch_save" in self._night_actions:
-            witch_id = next((p.id for p in self.players if p.role.role_type == RoleType.WITCH), None)
+            witch_id = self._night_actions["witch_save"].get("witch_id") or self._first_id(RoleType.WITCH)
             if witch_id and self._night_actions["witch_save"]["used"]:
                 self._last_night_saved = True
                 self._witch_potions[witch_id]["save"] = False
         
         if "witch_poison" in self._night_actions:
-            witch_id = next((p.id for p in self.players if p.role.role_type == RoleType.WITCH), None)
+            witch_id = self._night_actions["witch_poison"].get("witch_id") or self._first_id(RoleType.WITCH)
             target_id = self._night_actions["witch_poison"]["target_id"]
             if witch_id and target_id is not None:
                 self._last_night_poisoned = target_id
@@ -170,6 +380,10 @@ class GameState:
         # 清空夜晚行动记录
         self._night_actions = {}
     
+    def _first_id(self, role_type: RoleType) -> Optional[int]:
+        player = self.get_player_by_role(role_type)
+        return player.id if player else None
+    
     def record_vote(self, voter_id: int, target_id: int):
         """记录投票"""
         self.votes[voter_id] = target_id
@@ -244,18 +458,14 @@ class GameState:
         if self._game_over:
             return True, self._winning_team
             
-        alive_players = self.get_alive_players()
-        werewolves = [p for p in alive_players if p.id in self._werewolves]
-        villagers = [p for p in alive_players if p.id not in self._werewolves]
-        
         # 狼人数量大于等于好人数量
-        if len(werewolves) >= len(villagers):
+        if self._alive_werewolf_count >= self._alive_villager_count:
             self._game_over = True
             self._winning_team = WinningTeam.WEREWOLVES
             return True, WinningTeam.WEREWOLVES
             
         # 狼人全部死亡
-        if len(werewolves) == 0:
+        if self._alive_werewolf_count == 0:
             self._game_over = True
             self._winning_team = WinningTeam.VILLAGERS
             return True, WinningTeam.VILLAGERS
@@ -332,6 +542,7 @@ class GameState:
             self._last_night_killed = None
             self._last_night_saved = False
             self._last_night_poisoned = None
+            self._last_night_guarded = set()
             self._hunter_shot_target = None
     
     def mark_player_as_killed(self, player_id: int):
@@ -5,12 +5,41 @@ class Player:
         self.id = player_id
         self.name = name
         self.role = role
-        self.is_alive = True
+        self._is_alive = True
+        self._game_state = None  # 所属的 GameState，存活状态变化时通知它更新索引
         self.death_reason = None  # 可能的值：werewolf, poison, voted, hunter_shot
         self.chat_history = []
     
+    @property
+    def chat_history(self) -> list:
+        return self._chat_history
+    
+    @chat_history.setter
+    def chat_history(self, value: list):
+        self._chat_history = value
+        self._owns_chat = True  # 新赋值的列表归本玩家独占
+
+    @property
+    def is_alive(self) -> bool:
+        return self._is_alive
+    
+    @is_alive.setter
+    def is_alive(self, value: bool):
+        if value == self._is_alive:
+            return
+        self._is_alive = value
+        if self._game_state is not None:
+            self._game_state._on_alive_changed(self)
+    
+    def share_chat(self):
+        """GameState.fork() 之后分支与原状态共用发言记录，双方下次写入前各自复制一份"""
+        self._owns_chat = False
+    
     def add_chat(self, message: str):
-        self.chat_history.append(message)
+        # 写时复制：只有分支后的第一次写入才复制列表，之后原地追加
+        if not self._owns_chat:
+            self.chat_history = list(self._chat_history)
+        self._chat_history.append(message)
     
     def kill(self, reason: str = None):
         self.is_alive = False
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Dict, List, Mapping, Union
 
 class RoleType(Enum):
     VILLAGER = "村民"
@@ -6,6 +7,7 @@ class RoleType(Enum):
     SEER = "预言家"
     WITCH = "女巫"
     HUNTER = "猎人"
+    GUARD = "守卫"
 
 class Role:
     def __init__(self, role_type: RoleType):
@@ -27,6 +29,66 @@ class Role:
                 "save_potion": True,
                 "poison_potion": True
             },
-            RoleType.HUNTER: {"shoot": True}
+            RoleType.HUNTER: {"shoot": True},
+            RoleType.GUARD: {"protect": True}
         }
-        return abilities.get(role_type, {}) 
\ No newline at end of file
+        return abilities.get(role_type, {}) 
+
+
+# 生成角色列表时的顺序（洗牌前），9 人局与最初写死的配置完全一致，相同的种子得到相同的对局
+DECK_ORDER = (RoleType.WEREWOLF, RoleType.VILLAGER, RoleType.SEER, RoleType.WITCH, RoleType.HUNTER, RoleType.GUARD)
+MIN_PLAYERS = 6
+
+def default_role_counts(player_count: int) -> Dict[RoleType, int]:
+    """按人数推荐的角色配置（至少 6 人）
+
+    狼人约占三分之一；预言家、女巫、猎人各一名，12 人起加一名守卫，
+    之后每多 12 人再加一名预言家和一名女巫，其余为村民。9 人局即 3 狼、3 民、预言家、女巫、猎人。
+    """
+    if player_count < MIN_PLAYERS:
+        raise ValueError(f"至少需要 {MIN_PLAYERS} 名玩家，当前 {player_count} 名")
+    extra = max(0, (player_count - 12) // 12)
+    counts = {
+        RoleType.WEREWOLF: player_count // 3,
+        RoleType.SEER: 1 + extra,
+        RoleType.WITCH: 1 + extra,
+        RoleType.HUNTER: 1,
+        RoleType.GUARD: 1 if player_count >= 12 else 0
+    }
+    counts[RoleType.VILLAGER] = player_count - sum(counts.values())
+    return {role_type: counts[role_type] for role_type in DECK_ORDER if counts[role_type]}
+
+def parse_role_counts(config: Mapping[Union[str, RoleType], int]) -> Dict[RoleType, int]:
+    """解析角色配置，键可以是 RoleType、英文名（"werewolf"）或中文名（"狼人"）"""
+    if not isinstance(config, Mapping):
+        raise TypeError("角色配置必须是 角色 -> 数量 的映射")
+    counts: Dict[RoleType, int] = {}
+    for key, count in config.items():
+        if isinstance(key, RoleType):
+            role_type = key
+        elif key.upper() in RoleType.__members__:
+            role_type = RoleType[key.upper()]
+        else:
+            try:
+                role_type = RoleType(key)
+            except ValueError:
+                raise ValueError(f"未知的角色: {key}") from None
+        if not isinstance(count, int) or count < 0:
+            raise ValueError(f"角色 {role_type.value} 的数量必须是非负整数: {count}")
+        counts[role_type] = counts.get(role_type, 0) + count
+    return {role_type: counts[role_type] for role_type in DECK_ORDER if counts.get(role_type)}
+
+def validate_role_counts(counts: Mapping[RoleType, int], player_count: int):
+    """检查角色配置能否开局：总数等于玩家数，至少一名狼人，且狼人少于好人（否则开局即结束）"""
+    total = sum(counts.values())
+    if total != player_count:
+        raise ValueError(f"角色总数 {total} 与玩家数 {player_count} 不一致")
+    wolves = counts.get(RoleType.WEREWOLF, 0)
+    if wolves == 0:
+        raise ValueError("至少需要一名狼人")
+    if wolves >= player_count - wolves:
+        raise ValueError(f"狼人（{wolves}）必须少于好人（{player_count - wolves}）")
+
+def build_roles(counts: Mapping[RoleType, int]) -> List[Role]:
+    """按 DECK_ORDER 的顺序生成角色列表（未洗牌）"""
+    return [Role(role_type) for role_type in DECK_ORDER for _ in range(counts.get(role_type, 0))]
@@ -0,0 +1,182 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Union
+import asyncio
+import json
+from ..models.game_log import GameEvent, GameLog
+
+GOD_VIEW = "god"  # 上帝视角：所有公开和私密事件
+SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest")
+
+View = Union[None, int, str]  # None 为公开视角，整数为玩家视角，GOD_VIEW 为上帝视角
+
+def event_to_dict(event: GameEvent) -> Dict:
+    record = event.to_dict()
+    record["seq"] = event.seq
+    record["round"] = event.round
+    record["text"] = event.text
+    return record
+
+
+class Subscription:
+    """一个订阅者的事件流
+
+    订阅时游标之后已有的事件作为积压先返回（不计入队列上限），之后是实时推送的新事件。
+    实时队列最多 max_queue 条；消费跟不上时按 policy 处理：
+    disconnect 丢弃队列并结束订阅（close_reason 为 "overflow"），客户端用 cursor 重新订阅即可接上；
+    drop_oldest 丢弃最早的事件并计入 dropped。
+    """
+
+    def __init__(self, hub: "EventHub", view: View, backlog, max_queue: int, policy: str):
+        self.hub = hub
+        self.view = view
+        self.max_queue = max_queue
+        self.policy = policy
+        self.cursor = backlog[0].seq if backlog else len(hub.game_log)  # 下一条要读取的事件序号
+        self.dropped = 0
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self._backlog: Deque[GameEvent] = deque(backlog)
+        self._queue: Deque[GameEvent] = deque()
+        self._wakeup = asyncio.Event()
+
+    def _push(self, event: GameEvent):
+        if self.closed:
+            return
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "drop_oldest":
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self._queue.clear()
+                self._close("overflow")
+                return
+        self._queue.append(event)
+        self._wakeup.set()
+
+    def _close(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        self._wakeup.set()
+        self.hub._remove(self)
+
+    def close(self):
+        """取消订阅"""
+        self._close("unsubscribed")
+
+    def _pop(self) -> Optional[GameEvent]:
+        if self._backlog:
+            event = self._backlog.popleft()
+        elif self._queue:
+            event = self._queue.popleft()
+        else:
+            return None
+        self.cursor = event.seq + 1
+        return event
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[GameEvent]:
+        """下一条事件；订阅已结束且没有剩余事件时返回 None，超时抛出 asyncio.TimeoutError"""
+        while True:
+            event = self._pop()
+            if event is not None or self.closed:
+                return event
+            self._wakeup.clear()
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> GameEvent:
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class EventHub:
+    """GameLog 之上的发布/订阅
+
+    挂在 GameLog 的监听器上，每条新事件只按可见范围分发给能看到它的订阅者：
+    公开事件给所有人，私密事件只给对应玩家和上帝视角。
+    每条事件的推送帧只编码一次，所有订阅者共用。
+    """
+
+    def __init__(self, game_log: GameLog):
+        self.game_log = game_log
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        self._public: Set[Subscription] = set()
+        self._players: Dict[int, Set[Subscription]] = {}
+        self._god: Set[Subscription] = set()
+        self._frames: Dict[int, bytes] = {}  # 事件序号 -> 编码好的 SSE 帧
+        game_log.add_listener(self._publish)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._public) + len(self._god) + sum(len(subs) for subs in self._players.values())
+
+    def subscribe(self, view: View = None, cursor: Optional[int] = None, max_queue: int = 256,
+                  policy: str = "disconnect") -> Subscription:
+        """订阅一个视角的事件
+
+        cursor 为 None 时只接收之后的新事件，否则先补发序号不小于 cursor 的已有事件。
+        日志已关闭（对局结束）时只返回积压事件，之后订阅即结束。
+        """
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"未知的慢消费者策略: {policy}，可选: {', '.join(SLOW_CONSUMER_POLICIES)}")
+        if view is not None and view != GOD_VIEW and not isinstance(view, int):
+            raise ValueError(f"未知的视角: {view}")
+        backlog = []
+        if cursor is not None:
+            if view == GOD_VIEW:
+                backlog, _ = self.game_log.all_events_since(cursor)
+            else:
+                backlog, _ = self.game_log.events_since(cursor, view)
+        subscription = Subscription(self, view, backlog, max_queue, policy)
+        if self.closed:
+            subscription._close(self.close_reason)
+        elif view is None:
+            self._public.add(subscription)
+        elif view == GOD_VIEW:
+            self._god.add(subscription)
+        else:
+            self._players.setdefault(view, set()).add(subscription)
+        return subscription
+
+    def _remove(self, subscription: Subscription):
+        if subscription.view is None:
+            self._public.discard(subscription)
+        elif subscription.view == GOD_VIEW:
+            self._god.discard(subscription)
+        else:
+            self._players.get(subscription.view, set()).discard(subscription)
+
+    def _publish(self, event: GameEvent):
+        if event.public:
+            targets = [self._public, self._god, *self._players.values()]
+        else:
+            targets = [self._god, self._players.get(event.audience, ())]
+        for subscriptions in targets:
+            for subscription in list(subscriptions):
+                subscription._push(event)
+
+    def encode(self, event: GameEvent) -> bytes:
+        """事件的 SSE 帧（id 为事件序号，客户端重连时通过 Last-Event-ID 续传）"""
+        frame = self._frames.get(event.seq)
+        if frame is None:
+            data = json.dumps(event_to_dict(event), ensure_ascii=False, default=str)
+            frame = f"id: {event.seq}\nevent: {event.event_type.value}\ndata: {data}\n\n".encode("utf-8")
+            self._frames[event.seq] = frame
+        return frame
+
+    def close(self, reason: str = "game_over"):
+        """不再推送新事件；订阅者读完已排队的事件后结束"""
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        self.game_log.remove_listener(self._publish)
+        for subscriptions in [self._public, self._god, *self._players.values()]:
+            for subscription in list(subscriptions):
+                subscription._close(reason)
@@ -0,0 +1,369 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import asyncio
+import hmac
+import random
+import secrets
+import uuid
+from ..controllers.agent_backend import AgentBackend
+from ..controllers.api_controller import APIController, DEFAULT_BASE_URL
+from ..controllers.client_pool import ClientPool
+from ..controllers.game_controller import WEREWOLF_MODES, GameController
+from ..controllers.game_store import GameStore
+from ..controllers.response_cache import CacheMode, ResponseCache
+from ..controllers.round_summary import RoundSummarizer
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_state import GamePhase
+from ..models.role import MIN_PLAYERS, RoleType, default_role_counts, parse_role_counts, validate_role_counts
+from ..simulation.headless import DEFAULT_PLAYER_NAMES, MAX_ROUNDS
+from .event_stream import EventHub, event_to_dict
+
+AGENTS = ("llm",) + RuleBasedAgent.POLICIES
+
+class GameQueueFullError(Exception):
+    """排队的对局已达上限，调用方应稍后重试"""
+
+
+class GameSession:
+    """服务端托管的一局游戏
+
+    状态依次为 queued -> running -> finished，出错为 failed，被取消为 cancelled。
+    每局有自己的 GameController、GameState、日志文件和决策后端（含 APIController 的玩家 session 与模型选择），
+    各局之间只共享连接池和模型限流器。
+    player_tokens 是建局时发给每名玩家的令牌（玩家 ID -> 令牌），凭它才能读取该玩家的私密事件。
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, game_id: str, controller: GameController, player_names: List[str], agent: str,
+                 model: Optional[str], seed: Optional[int], player_tokens: Dict[int, str]):
+        self.id = game_id
+        self.controller = controller
+        self.player_names = player_names
+        self.agent = agent
+        self.model = model
+        self.seed = seed
+        self.player_tokens = player_tokens
+        self.status = self.QUEUED
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self.response_cache: Optional[ResponseCache] = None  # 开启事件存储时本局的 LLM 响应缓存
+        self.events = EventHub(controller.game_log)  # 实时推送事件给订阅者
+
+    @property
+    def done(self) -> bool:
+        return self.status in (self.FINISHED, self.FAILED, self.CANCELLED)
+
+    def to_dict(self) -> Dict:
+        """对局状态；游戏结束前不公开角色"""
+        game_state = self.controller.game_state
+        info = {
+            "id": self.id,
+            "status": self.status,
+            "agent": self.agent,
+            "model": self.model,
+            "seed": self.seed,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "events": len(self.controller.game_log)
+        }
+        if self.status != self.QUEUED:
+            info["phase"] = game_state.current_phase.value
+            info["round"] = game_state.round_number
+            info["players"] = [{"id": p.id, "name": p.name, "alive": p.is_alive} for p in game_state.players]
+        if self.status == self.FINISHED:
+            info["result"] = game_state.get_game_result()
+        if self.error:
+            info["error"] = self.error
+        return info
+
+    def check_token(self, player_id: int, token: str) -> bool:
+        """令牌是否属于该玩家（常数时间比较）"""
+        expected = self.player_tokens.get(player_id)
+        return expected is not None and hmac.compare_digest(expected, token)
+
+    def credentials(self) -> List[Dict]:
+        """每名玩家的 ID、名字和令牌，只在建局的响应里返回一次"""
+        return [{"id": player_id, "name": name, "token": self.player_tokens[player_id]}
+                for player_id, name in enumerate(self.player_names, start=1)]
+
+    def events_since(self, cursor: int, player_id: Optional[int] = None) -> Dict:
+        """cursor 之后的可见事件（默认只有公开事件）和下一次读取用的游标"""
+        events, next_cursor = self.controller.game_log.events_since(cursor, player_id)
+        return {"events": [event_to_dict(event) for event in events], "cursor": next_cursor}
+
+
+class GameManager:
+    """在一个事件循环上同时运行多局游戏
+
+    同时运行的对局数不超过 max_active_games，多出的对局排队等待；
+    排队数达到 max_queued_games 时拒绝新建（GameQueueFullError），由 HTTP 层返回 503。
+    已结束的对局只保留最近 max_finished_games 局，供查询结果和事件。
+    传入 store 时每局的事件和阶段快照写入持久化存储，进程重启后用 resume_games() 接着跑没结束的对局，
+    出错中断的对局可以用 resume_game() 重试；LLM 对局的响应也缓存在同一个数据库里，恢复后不会重复付费。
+    """
+
+    def __init__(self, max_active_games: int = 100, max_queued_games: int = 1000, max_finished_games: int = 1000,
+                 model_name: str = "deepseek-chat", base_url: str = DEFAULT_BASE_URL, api_key: Optional[str] = None,
+                 log_dir: Optional[str] = None, discussion_delay: float = 0.0, client_pool: Optional[ClientPool] = None,
+                 backend_factory: Optional[Callable[[str, Optional[str], random.Random], AgentBackend]] = None,
+                 store: Optional[GameStore] = None):
+        self.max_active_games = max_active_games
+        self.max_queued_games = max_queued_games
+        self.max_finished_games = max_finished_games
+        self.model_name = model_name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.log_dir = log_dir  # None 表示不写日志文件
+        self.discussion_delay = discussion_delay
+        self.client_pool = client_pool  # 所有对局共享的连接池，默认为进程共享的 shared_pool
+        self.backend_factory = backend_factory or self._create_backend
+        self.store = store
+        self._slots = asyncio.Semaphore(max_active_games)
+        self._sessions: "OrderedDict[str, GameSession]" = OrderedDict()
+        self._finished: List[str] = []
+        self._queued = 0
+        self._active = 0
+
+    def _create_backend(self, agent: str, model: Optional[str], rng: random.Random) -> AgentBackend:
+        if agent == "llm":
+            return APIController(model_name=model or self.model_name, base_url=self.base_url,
+                                 api_key=self.api_key, client_pool=self.client_pool, show_progress=False)
+        return RuleBasedAgent(agent, rng)
+
+    @property
+    def active_games(self) -> int:
+        return self._active
+
+    @property
+    def queued_games(self) -> int:
+        return self._queued
+
+    def create_game(self, player_names: Optional[List[str]] = None, agent: str = "llm",
+                    model: Optional[str] = None, seed: Optional[int] = None,
+                    roles: Optional[Dict[str, int]] = None, werewolf_mode: str = "individual") -> GameSession:
+        """新建一局并安排运行，立即返回（对局在后台进行）
+
+        roles 是角色配置，如 {"werewolf": 4, "seer": 2, ...}（键也可以是中文角色名），不给时按人数使用默认配置。
+        werewolf_mode 为 joint 时狼人队伍每晚一次决策（见 GameController）。
+        """
+        if agent not in AGENTS:
+            raise ValueError(f"未知的决策后端: {agent}，可选: {', '.join(AGENTS)}")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            raise ValueError("seed 必须是整数")
+        if model is not None and not isinstance(model, str):
+            raise ValueError("model 必须是字符串")
+        if player_names is not None and (not isinstance(player_names, list)
+                                         or not all(isinstance(name, str) and name for name in player_names)):
+            raise ValueError("players 必须是玩家名字（非空字符串）的列表")
+        if werewolf_mode not in WEREWOLF_MODES:
+            raise ValueError(f"未知的狼人决策方式: {werewolf_mode}，可选: {', '.join(WEREWOLF_MODES)}")
+        player_names = list(player_names or DEFAULT_PLAYER_NAMES)
+        if len(player_names) < MIN_PLAYERS or len(set(player_names)) != len(player_names):
+            raise ValueError(f"需要至少 {MIN_PLAYERS} 个互不相同的玩家名字")
+        role_counts = parse_role_counts(roles) if roles else default_role_counts(len(player_names))
+        validate_role_counts(role_counts, len(player_names))
+        if self._queued >= self.max_queued_games:
+            raise GameQueueFullError(f"排队的对局已达上限 {self.max_queued_games}")
+
+        game_id = uuid.uuid4().hex[:12]
+        model = (model or self.model_name) if agent == "llm" else None
+        # 玩家 ID 按名字顺序从 1 开始编号（见 GameController.initialize_game）
+        player_tokens = {player_id: secrets.token_urlsafe(16) for player_id in range(1, len(player_names) + 1)}
+        # 先建好对局再登记到事件存储，建局失败时存储里不会留下一局无法恢复的 running 对局
+        session = self._create_session(game_id, player_names, agent, model, seed, role_counts, werewolf_mode,
+                                       player_tokens, resume=False)
+        if self.store:
+            self.store.create_game(game_id, {"players": player_names, "agent": agent, "model": model, "seed": seed,
+                                             "roles": {role_type.name.lower(): count
+                                                       for role_type, count in role_counts.items()},
+                                             "werewolf_mode": werewolf_mode,
+                                             "player_tokens": {str(k): v for k, v in player_tokens.items()}})
+        return self._start(session, resume=False)
+
+    def resume_game(self, game_id: str) -> GameSession:
+        """从事件存储恢复一局没结束的对局（进程重启前在跑的，或者出错中断的），立即返回"""
+        if self.store is None:
+            raise ValueError("没有配置事件存储，无法恢复对局")
+        session = self._sessions.get(game_id)
+        if session is not None and session.status != GameSession.FAILED:
+            raise ValueError(f"对局 {game_id} 状态为 {session.status}，只能恢复出错中断的对局")
+        if game_id not in self.store.unfinished_games():
+            raise ValueError(f"事件存储中没有可恢复的对局: {game_id}")
+        return self._resume(game_id, session)
+
+    def _resume(self, game_id: str, session: Optional[GameSession]) -> GameSession:
+        """按事件存储中的元数据重新开始一局；session 是本进程中出错中断的同一局（如果有）
+
+        元数据无法重建对局时抛出异常，不影响原来的 session。
+        """
+        metadata = self.store.game_metadata(game_id)
+        # 早期的对局没有记录角色配置，它们都是默认配置
+        role_counts = (parse_role_counts(metadata["roles"]) if metadata.get("roles")
+                       else default_role_counts(len(metadata["players"])))
+        # 恢复后沿用建局时发出的令牌；早期的对局没有令牌，只能在结束后查看私密事件
+        player_tokens = {int(k): v for k, v in metadata.get("player_tokens", {}).items()}
+        resumed = self._create_session(game_id, metadata["players"], metadata["agent"], metadata["model"],
+                                       metadata["seed"], role_counts, metadata.get("werewolf_mode", "individual"),
+                                       player_tokens, resume=True)
+        if session is not None:
+            self._sessions.pop(game_id)
+            self._finished.remove(game_id)
+        return self._start(resumed, resume=True)
+
+    def resume_games(self) -> List[GameSession]:
+        """恢复事件存储中所有没结束、也不在本进程中运行的对局（服务启动时调用）
+
+        元数据损坏、无法恢复的对局在存储中标记为 failed 并跳过，不影响其他对局和服务启动。
+        """
+        unfinished = self.store.unfinished_games() if self.store else []
+        sessions = []
+        for game_id in unfinished:
+            if game_id in self._sessions:
+                continue
+            try:
+                sessions.append(self._resume(game_id, None))
+            except Exception as e:
+                print(f"[SERVER] 对局 {game_id} 无法恢复，标记为失败: {type(e).__name__}: {e}")
+                self.store.mark_finished(game_id, status=GameStore.FAILED)
+        return sessions
+
+    def _create_session(self, game_id: str, player_names: List[str], agent: str, model: Optional[str],
+                        seed: Optional[int], role_counts: Dict[RoleType, int], werewolf_mode: str,
+                        player_tokens: Dict[int, str], resume: bool) -> GameSession:
+        """建好一局的决策后端和 GameController，还不登记、不开始运行"""
+        rng = random.Random(seed)
+        backend = self.backend_factory(agent, model, rng)
+        controller = GameController(
+            api_controller=backend,
+            discussion_delay=self.discussion_delay,
+            headless=self.log_dir is None,
+            rng=rng,
+            round_summarizer=RoundSummarizer() if agent == "llm" else None,
+            log_dir=self.log_dir,
+            game_id=game_id,
+            store=self.store,
+            role_counts=role_counts,
+            werewolf_mode=werewolf_mode
+        )
+        session = GameSession(game_id, controller, player_names, agent, model, seed, player_tokens)
+        if self.store and isinstance(backend, APIController) and backend.response_cache is None:
+            # 正常进行时只录制不读取（同一局里内容相同的两次请求仍各自请求）；恢复时先读缓存重跑中断的阶段
+            mode = CacheMode.READ_THROUGH if resume else CacheMode.RECORD_ONLY
+            session.response_cache = backend.response_cache = self.store.response_cache(mode=mode, namespace=game_id)
+        return session
+
+    def _start(self, session: GameSession, resume: bool) -> GameSession:
+        """登记一局并在后台开始运行"""
+        self._sessions[session.id] = session
+        self._queued += 1
+        session.task = asyncio.create_task(self._run(session, resume), name=f"game-{session.id}")
+        return session
+
+    async def _run(self, session: GameSession, resume: bool = False):
+        try:
+            async with self._slots:
+                self._queued -= 1
+                self._active += 1
+                session.status = GameSession.RUNNING
+                session.started_at = datetime.now()
+                try:
+                    await self._play(session.controller, session.player_names, resume, session.response_cache)
+                finally:
+                    self._active -= 1
+                session.status = GameSession.FINISHED
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[SERVER] 对局 {session.id} 出错: {str(e)}")
+            session.status = GameSession.FAILED
+            session.error = f"{type(e).__name__}: {e}"
+        finally:
+            self._retire(session)
+
+    @staticmethod
+    async def _play(game: GameController, player_names: List[str], resume: bool = False,
+                    response_cache: Optional[ResponseCache] = None):
+        if not (resume and await game.resume()):
+            await game.initialize_game(player_names)
+        while game.game_state.current_phase != GamePhase.GAME_OVER:
+            if game.game_state.round_number >= MAX_ROUNDS:
+                raise RuntimeError(f"超过 {MAX_ROUNDS} 回合仍未结束")
+            await game.next_phase()
+            if response_cache:
+                await response_cache.flush_async()  # 与阶段快照一起落盘
+                response_cache.mode = CacheMode.RECORD_ONLY  # 中断的阶段已经重跑完
+
+    def _retire(self, session: GameSession):
+        """结束一局的记账：关闭日志，超过保留上限时丢弃最早结束的对局
+
+        任务在第一次运行前就被取消时 _run 的函数体不会执行，由 cancel() 补做，因此要能重复调用。
+        """
+        if session.finished_at is not None:
+            return
+        if session.status == GameSession.QUEUED:
+            self._queued -= 1
+        if not session.done:
+            session.status = GameSession.CANCELLED
+        session.controller.close()
+        if session.response_cache:
+            session.response_cache.close()
+        session.events.close(session.status)
+        session.finished_at = datetime.now()
+        self._finished.append(session.id)
+        while len(self._finished) > self.max_finished_games:
+            self._sessions.pop(self._finished.pop(0), None)
+
+    def get(self, game_id: str) -> Optional[GameSession]:
+        return self._sessions.get(game_id)
+
+    def list(self) -> List[GameSession]:
+        return list(self._sessions.values())
+
+    async def cancel(self, game_id: str) -> bool:
+        """取消一局未结束的游戏，返回是否确实取消了"""
+        session = self._sessions.get(game_id)
+        if session is None or session.done:
+            return False
+        session.task.cancel()
+        await asyncio.gather(session.task, return_exceptions=True)
+        self._retire(session)
+        if self.store:
+            self.store.mark_finished(game_id, status=GameStore.CANCELLED)
+        return True
+
+    async def wait(self, game_id: str) -> GameSession:
+        """等待一局游戏结束"""
+        session = self._sessions[game_id]
+        await asyncio.gather(session.task, return_exceptions=True)
+        return session
+
+    async def shutdown(self):
+        """取消所有未结束的对局（事件存储中它们仍是未结束状态，重启后可以恢复）"""
+        running = [s for s in self._sessions.values() if not s.done]
+        for session in running:
+            session.task.cancel()
+        await asyncio.gather(*(s.task for s in running), return_exceptions=True)
+        for session in running:
+            self._retire(session)
+
+    def stats(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for session in self._sessions.values():
+            counts[session.status] = counts.get(session.status, 0) + 1
+        return {
+            "active": self.active_games,
+            "queued": self.queued_games,
+            "max_active": self.max_active_games,
+            "max_queued": self.max_queued_games,
+            "by_status": counts
+        }
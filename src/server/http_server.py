@@ -0,0 +1,340 @@
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import hmac
+import json
+from ..controllers.api_controller import DEFAULT_BASE_URL
+from ..controllers.client_pool import ClientPool
+from ..controllers.game_store import GameStore
+from ..controllers.metrics import MetricsRegistry, shared_metrics
+from .event_stream import GOD_VIEW, Subscription
+from .game_manager import GameManager, GameQueueFullError
+
+MAX_BODY_BYTES = 64 * 1024
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class GameServer:
+    """多局游戏的 HTTP 接口（基于 asyncio，无额外依赖，支持 keep-alive）
+
+    POST   /games                 新建对局，请求体 {"players": [...], "agent": "llm", "model": ..., "seed": ...,
+                                  "roles": {"werewolf": 3, ...}, "werewolf_mode": "individual|joint"}
+                                  （roles 可省略，按人数使用默认角色配置）；响应的 player_tokens 是每名玩家的令牌
+    GET    /games                 所有对局的状态
+    GET    /games/{id}            一局的状态（结束后包含结果）
+    GET    /games/{id}/events     ?cursor=N[&player_id=M&token=T] 游标之后的事件和新的游标
+    GET    /games/{id}/stream     SSE 实时事件流，?view=public|player|god[&player_id=M][&token=T][&cursor=N]，
+                                  重连时带上 Last-Event-ID 从断点续传
+    DELETE /games/{id}            取消对局
+    POST   /games/{id}/resume     从事件存储恢复出错中断的对局（需要 GameManager 配置了 store）
+    GET    /metrics               Prometheus 格式的指标
+    GET    /healthz               运行和排队的对局数
+
+    对局进行中，玩家视角需要建局时发给该玩家的令牌；对局结束后所有视角公开。
+    配置了 admin_token 时，凭它可以随时查看任意视角。令牌放在 ?token= 或 Authorization: Bearer 头里。
+    """
+
+    def __init__(self, manager: GameManager, host: str = "127.0.0.1", port: int = 8000,
+                 metrics: Optional[MetricsRegistry] = None, stream_queue_size: int = 256,
+                 slow_consumer_policy: str = "disconnect", heartbeat_interval: float = 15.0,
+                 admin_token: Optional[str] = None):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.metrics = metrics or shared_metrics
+        # 每个 SSE 订阅者的实时队列上限和消费跟不上时的处理方式，见 Subscription
+        self.stream_queue_size = stream_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.heartbeat_interval = heartbeat_interval  # 没有新事件时发送注释行保持连接
+        self.admin_token = admin_token  # None 表示对局进行中不开放上帝视角
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = set()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> "GameServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self
+
+    async def stop(self):
+        """停止接受请求，断开现有连接并取消所有未结束的对局"""
+        if self._server:
+            self._server.close()
+            for task in self._handlers:
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+        await self.manager.shutdown()
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def __aenter__(self) -> "GameServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self._send(writer, 400, {"error": "请求行格式错误"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                try:
+                    length = _content_length(headers)
+                except HTTPError as e:
+                    # 请求体长度不可信，无法继续在这个连接上读下一个请求
+                    await self._send(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload, extra_headers = await self._dispatch(method.upper(), target, headers, body)
+                except HTTPError as e:
+                    status, payload, extra_headers = e.status, {"error": e.message}, e.headers
+                except Exception as e:
+                    print(f"[SERVER] 处理 {method} {target} 出错: {str(e)}")
+                    status, payload, extra_headers = 500, {"error": "服务器内部错误"}, {}
+                if isinstance(payload, Subscription):
+                    await self._stream(writer, payload)
+                    break
+                await self._send(writer, status, payload, extra_headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, payload, extra_headers: Optional[Dict] = None,
+                    keep_alive: bool = True):
+        if isinstance(payload, str):
+            data = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        for key, value in (extra_headers or {}).items():
+            head += f"{key}: {value}\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + data)
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, subscription: Subscription):
+        """以 SSE 推送订阅的事件，直到订阅结束或客户端断开；结束时发送 end 事件并关闭连接"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        try:
+            await writer.drain()
+            while True:
+                try:
+                    event = await subscription.get(self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+                    continue
+                if event is None:
+                    break
+                writer.write(subscription.hub.encode(event))
+                await writer.drain()
+            end = {"reason": subscription.close_reason, "cursor": subscription.cursor, "dropped": subscription.dropped}
+            writer.write(f"event: end\ndata: {json.dumps(end)}\n\n".encode("utf-8"))
+            await writer.drain()
+        finally:
+            subscription.close()
+
+    async def _dispatch(self, method: str, target: str, headers: Dict[str, str],
+                        body: bytes) -> Tuple[int, object, Dict[str, str]]:
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == ["healthz"] and method == "GET":
+            return 200, dict(self.manager.stats(), status="ok"), {}
+        if parts == ["metrics"] and method == "GET":
+            return 200, self.metrics.to_prometheus(), {}
+        if parts == ["games"]:
+            if method == "GET":
+                return 200, {"games": [s.to_dict() for s in self.manager.list()], **self.manager.stats()}, {}
+            if method == "POST":
+                return self._create_game(body)
+            raise HTTPError(405, "不支持的方法")
+        if len(parts) >= 2 and parts[0] == "games":
+            session = self.manager.get(parts[1])
+            if session is None:
+                raise HTTPError(404, f"对局不存在: {parts[1]}")
+            if len(parts) == 2 and method == "GET":
+                return 200, session.to_dict(), {}
+            if len(parts) == 2 and method == "DELETE":
+                cancelled = await self.manager.cancel(session.id)
+                return 200, dict(session.to_dict(), cancelled=cancelled), {}
+            if parts[2:] == ["events"] and method == "GET":
+                cursor = _int_param(query, "cursor", 0)
+                player_id = _int_param(query, "player_id", None)
+                self._authorize(session, player_id, query, headers)
+                return 200, session.events_since(cursor, player_id), {}
+            if parts[2:] == ["stream"] and method == "GET":
+                return 200, self._subscribe(session, query, headers), {}
+            if parts[2:] == ["resume"] and method == "POST":
+                try:
+                    session = self.manager.resume_game(session.id)
+                except ValueError as e:
+                    raise HTTPError(409, str(e))
+                return 200, session.to_dict(), {}
+        raise HTTPError(404, f"未知的路径: {url.path}")
+
+    def _authorize(self, session, view, query: Dict[str, str], headers: Dict[str, str]):
+        """检查读取 view 视角事件的权限，没有权限时抛出 401/403"""
+        if view is None or session.done:
+            return
+        token = query.get("token")
+        authorization = headers.get("authorization", "")
+        if token is None and authorization.lower().startswith("bearer "):
+            token = authorization[7:].strip()
+        if token is not None and self.admin_token and hmac.compare_digest(token, self.admin_token):
+            return
+        if view == GOD_VIEW:
+            raise HTTPError(403, "对局进行中只有管理员可以查看上帝视角")
+        if token is None:
+            raise HTTPError(401, "查看玩家视角需要该玩家的令牌")
+        if not session.check_token(view, token):
+            raise HTTPError(403, "令牌与玩家不符")
+
+    def _subscribe(self, session, query: Dict[str, str], headers: Dict[str, str]) -> Subscription:
+        view_name = query.get("view", "player" if "player_id" in query else "public")
+        if view_name == "public":
+            view = None
+        elif view_name == "god":
+            view = GOD_VIEW
+        elif view_name == "player":
+            view = _int_param(query, "player_id", None)
+            if view is None:
+                raise HTTPError(400, "玩家视角需要 player_id")
+        else:
+            raise HTTPError(400, f"未知的视角: {view_name}")
+        self._authorize(session, view, query, headers)
+        cursor = _int_param(query, "cursor", 0)
+        if "last-event-id" in headers:
+            try:
+                cursor = int(headers["last-event-id"]) + 1
+            except ValueError:
+                raise HTTPError(400, "Last-Event-ID 必须是整数")
+        return session.events.subscribe(view, cursor, self.stream_queue_size, self.slow_consumer_policy)
+
+    def _create_game(self, body: bytes) -> Tuple[int, Dict, Dict[str, str]]:
+        try:
+            options = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            raise HTTPError(400, "请求体不是合法的 JSON")
+        if not isinstance(options, dict):
+            raise HTTPError(400, "请求体必须是 JSON 对象")
+        try:
+            session = self.manager.create_game(
+                player_names=options.get("players"),
+                agent=options.get("agent", "llm"),
+                model=options.get("model"),
+                seed=options.get("seed"),
+                roles=options.get("roles"),
+                werewolf_mode=options.get("werewolf_mode", "individual")
+            )
+        except GameQueueFullError as e:
+            raise HTTPError(503, str(e), {"Retry-After": "5"})
+        except (ValueError, TypeError) as e:
+            raise HTTPError(400, str(e))
+        return 201, dict(session.to_dict(), player_tokens=session.credentials()), {"Location": f"/games/{session.id}"}
+
+
+def _content_length(headers: Dict[str, str]) -> int:
+    """读取 Content-Length：不是非负整数时 400，超过 MAX_BODY_BYTES 时 413"""
+    value = headers.get("content-length", "").strip()
+    if not value:
+        return 0
+    if not value.isdigit():
+        raise HTTPError(400, "Content-Length 必须是非负整数")
+    length = int(value)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "请求体过大")
+    return length
+
+
+def _int_param(query: Dict[str, str], name: str, default: Optional[int]) -> Optional[int]:
+    if name not in query:
+        return default
+    try:
+        return int(query[name])
+    except ValueError:
+        raise HTTPError(400, f"参数 {name} 必须是整数")
+
+
+async def serve(args: argparse.Namespace):
+    store = GameStore(args.store) if args.store else None
+    manager = GameManager(max_active_games=args.max_active, max_queued_games=args.max_queued,
+                          model_name=args.model, base_url=args.base_url, log_dir=args.log_dir,
+                          client_pool=ClientPool(max_connections=args.max_connections), store=store)
+    server = await GameServer(manager, args.host, args.port, admin_token=args.admin_token).start()
+    print(f"[SERVER] 监听 {server.base_url}，最多同时进行 {args.max_active} 局")
+    resumed = manager.resume_games()
+    if resumed:
+        print(f"[SERVER] 从 {args.store} 恢复了 {len(resumed)} 局未结束的对局")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.stop()
+        if store:
+            store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="多局狼人杀游戏服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-active", type=int, default=100, help="同时进行的对局上限")
+    parser.add_argument("--max-queued", type=int, default=1000, help="排队的对局上限，超过后新建请求返回 503")
+    parser.add_argument("--max-connections", type=int, default=64, help="到 LLM 服务的连接数上限（所有对局共享）")
+    parser.add_argument("--model", default="deepseek-chat", help="LLM 对局的默认模型")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--log-dir", default=None, help="对局日志目录，不指定则不写日志文件")
+    parser.add_argument("--store", default=None,
+                        help="SQLite 事件存储路径；指定后对局可以在进程重启或出错后恢复，启动时自动恢复未结束的对局")
+    parser.add_argument("--admin-token", default=None,
+                        help="管理员令牌，凭它可以在对局进行中查看任意玩家和上帝视角；不指定则只在对局结束后开放")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
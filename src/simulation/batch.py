@@ -0,0 +1,128 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+import argparse
+import asyncio
+import os
+import time
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_log import GameEventType
+from ..models.role import RoleType
+from .headless import play_headless_game
+
+CHUNK_SIZE = 250  # 每个子任务连续跑的对局数，摊薄进程间通信的开销
+
+def summarize_game(game, seed: int) -> Dict:
+    """把一局的结果压缩成便于跨进程传输的小字典"""
+    state = game.game_state
+    roles = {p.id: p.role.role_type for p in state.players}
+    good_votes = correct_votes = 0
+    events, _ = game.game_log.all_events_since(0)
+    for event in events:
+        if event.event_type == GameEventType.PLAYER_VOTE and roles[event.details["voter_id"]] != RoleType.WEREWOLF:
+            good_votes += 1
+            if roles[event.details["target_id"]] == RoleType.WEREWOLF:
+                correct_votes += 1
+    result = state.get_game_result()
+    return {
+        "seed": seed,
+        "winning_team": result["winning_team"],
+        "rounds": result["rounds"],
+        "roles": [p.role.role_type.value for p in state.players],
+        "good_votes": good_votes,
+        "correct_votes": correct_votes
+    }
+
+def _run_chunk(seeds: List[int], policy: str) -> List[Dict]:
+    """子进程入口：依次跑完一组种子对应的对局"""
+    async def run():
+        return [summarize_game(await play_headless_game(policy=policy, seed=seed), seed) for seed in seeds]
+    return asyncio.run(run())
+
+def iter_results(games: int, policy: str = "heuristic", seed: int = 0,
+                 workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """把 games 局分给进程池，按完成顺序逐批产出每局的压缩结果
+
+    第 i 局的种子固定为 seed + i，结果与进程数和完成顺序无关。
+    """
+    seeds = list(range(seed, seed + games))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, games, chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            yield _run_chunk(chunk, policy)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_chunk, chunk, policy) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
+
+class BatchStats:
+    """汇总多局结果：阵营与角色胜率、平均回合数、好人投票准确率"""
+
+    def __init__(self):
+        self.games = 0
+        self.rounds = 0
+        self.team_wins: Dict[str, int] = {}
+        self.role_games: Dict[str, int] = {}  # 角色 -> 出场人次
+        self.role_wins: Dict[str, int] = {}  # 角色 -> 所在阵营获胜的人次
+        self.good_votes = 0
+        self.correct_votes = 0
+
+    def add(self, summary: Dict):
+        self.games += 1
+        self.rounds += summary["rounds"]
+        team = summary["winning_team"] or "unfinished"
+        self.team_wins[team] = self.team_wins.get(team, 0) + 1
+        for role in summary["roles"]:
+            role_team = "werewolves" if role == RoleType.WEREWOLF.value else "villagers"
+            self.role_games[role] = self.role_games.get(role, 0) + 1
+            if role_team == team:
+                self.role_wins[role] = self.role_wins.get(role, 0) + 1
+        self.good_votes += summary["good_votes"]
+        self.correct_votes += summary["correct_votes"]
+
+    def to_dict(self) -> Dict:
+        games = self.games or 1
+        return {
+            "games": self.games,
+            "team_win_rate": {team: wins / games for team, wins in sorted(self.team_wins.items())},
+            "role_win_rate": {role: self.role_wins.get(role, 0) / count
+                              for role, count in sorted(self.role_games.items())},
+            "average_rounds": self.rounds / games,
+            "vote_accuracy": self.correct_votes / self.good_votes if self.good_votes else 0.0
+        }
+
+def run_batch(games: int, policy: str = "heuristic", seed: int = 0, workers: Optional[int] = None) -> Dict:
+    """跑完 games 局并返回汇总统计（含每秒局数）"""
+    stats = BatchStats()
+    start = time.perf_counter()
+    for chunk in iter_results(games, policy, seed, workers):
+        for summary in chunk:
+            stats.add(summary)
+    elapsed = time.perf_counter() - start
+    report = stats.to_dict()
+    report["elapsed"] = elapsed
+    report["games_per_second"] = games / elapsed if elapsed > 0 else 0.0
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程批量狼人杀模拟")
+    parser.add_argument("--games", type=int, default=10000, help="对局数量")
+    parser.add_argument("--policy", choices=RuleBasedAgent.POLICIES, default="heuristic", help="决策策略")
+    parser.add_argument("--seed", type=int, default=0, help="起始随机种子，第 i 局使用 seed + i")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用全部核心")
+    args = parser.parse_args()
+
+    report = run_batch(args.games, args.policy, args.seed, args.workers)
+    print(f"完成 {report['games']} 局，用时 {report['elapsed']:.2f} 秒，{report['games_per_second']:.0f} 局/秒")
+    print(f"平均回合数: {report['average_rounds']:.2f}")
+    print(f"好人投票准确率: {report['vote_accuracy']:.1%}")
+    print("\n阵营胜率：")
+    for team, rate in report["team_win_rate"].items():
+        print(f"{team}: {rate:.1%}")
+    print("\n角色胜率：")
+    for role, rate in report["role_win_rate"].items():
+        print(f"{role}: {rate:.1%}")
+
+if __name__ == "__main__":
+    main()
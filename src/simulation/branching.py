@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+import asyncio
+import random
+from ..controllers.game_controller import GameController
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_state import GamePhase, GameState
+from .headless import MAX_ROUNDS
+
+Intervention = Callable[[GameController], None]
+
+async def play_to_end(game: GameController) -> Dict:
+    """把一局（通常是分支）推进到结束，返回 GameState.get_game_result() 的结果"""
+    while game.game_state.current_phase != GamePhase.GAME_OVER and game.game_state.round_number < MAX_ROUNDS:
+        await game.next_phase()
+    return game.game_state.get_game_result()
+
+def fork_branch(game: GameController, seed: Optional[int] = None,
+                intervention: Optional[Intervention] = None) -> GameController:
+    """分出一个分支；seed 为 None 时沿用本局的随机数状态，intervention 在推演前修改分支"""
+    branch = game.fork(rng=random.Random(seed) if seed is not None else None)
+    if intervention:
+        intervention(branch)
+    return branch
+
+async def run_branches(game: GameController, count: int, seed: Optional[int] = None,
+                       intervention: Optional[Intervention] = None, workers: int = 1) -> List[Dict]:
+    """从 game 当前的阶段边界分出 count 个分支，并行推演到结束，按分支顺序返回每个分支的结果
+
+    seed 为 None 时所有分支沿用本局的随机数状态，只有 intervention 造成差异；否则第 i 个分支使用种子 seed + i。
+    workers 为 1 时所有分支在当前事件循环上交替推进；大于 1 时（仅限规则策略）把分支状态发给多个进程，
+    intervention 在发出之前对分支状态执行一次。
+    """
+    seeds = [None if seed is None else seed + i for i in range(count)]
+    if workers <= 1:
+        branches = [fork_branch(game, branch_seed, intervention) for branch_seed in seeds]
+        return list(await asyncio.gather(*(play_to_end(branch) for branch in branches)))
+
+    if not isinstance(game.api_controller, RuleBasedAgent):
+        raise ValueError("多进程推演只支持规则策略（RuleBasedAgent）")
+    template = fork_branch(game, intervention=intervention)
+    rng_state = template.rng.getstate()
+    chunks = [seeds[i::workers] for i in range(workers)]
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # 在事件循环上等待子进程，不阻塞同一循环上的其他对局
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, _run_branch_chunk, template.game_state, template.api_controller,
+                                 template.branch_settings(), rng_state, chunk)
+            for chunk in chunks if chunk))
+    # 还原成分支顺序：第 i 个进程拿到的是第 i, i + workers, ... 个分支
+    ordered: List[Dict] = [None] * count
+    for worker, chunk_results in enumerate(results):
+        ordered[worker::workers] = chunk_results
+    return ordered
+
+def _run_branch_chunk(game_state: GameState, agent: RuleBasedAgent, settings: Dict, rng_state: tuple,
+                      seeds: List[Optional[int]]) -> List[Dict]:
+    """子进程入口：从收到的分支状态（已经是一份独立的副本）和对局设置再分出各个分支，依次推演"""
+    rng = random.Random()
+    rng.setstate(rng_state)
+    root = GameController(game_state=game_state, api_controller=agent.fork(rng), discussion_delay=0,
+                          headless=True, rng=rng, **settings)
+
+    async def run():
+        return [await play_to_end(fork_branch(root, seed)) for seed in seeds]
+    return asyncio.run(run())
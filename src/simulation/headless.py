@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import random
+import time
+from ..controllers.game_controller import GameController
+from ..controllers.rule_based_agent import RuleBasedAgent
+from ..models.game_state import GamePhase
+from ..models.role import RoleType
+
+DEFAULT_PLAYER_NAMES = [f"玩家{i}" for i in range(1, 10)]
+MAX_ROUNDS = 50  # 防御性上限，正常对局远远到不了
+
+async def play_headless_game(player_names: Optional[List[str]] = None, policy: str = "heuristic",
+                             seed: Optional[int] = None,
+                             role_counts: Optional[Dict[RoleType, int]] = None) -> GameController:
+    """不经网络、不写日志地跑完一整局，返回对局结束后的 GameController
+
+    角色分配和所有决策共用一个由 seed 初始化的随机数，相同的种子得到完全相同的对局。
+    role_counts 为 None 时按人数使用默认角色配置。
+    """
+    rng = random.Random(seed)
+    game = GameController(api_controller=RuleBasedAgent(policy, rng), discussion_delay=0, headless=True, rng=rng,
+                          role_counts=role_counts)
+    await game.initialize_game(player_names or DEFAULT_PLAYER_NAMES)
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        if game.game_state.round_number >= MAX_ROUNDS:
+            break
+        await game.next_phase()
+    return game
+
+async def run_headless_game(player_names: Optional[List[str]] = None, policy: str = "heuristic",
+                            seed: Optional[int] = None) -> Dict:
+    """跑完一整局，返回 GameState.get_game_result() 的结果"""
+    game = await play_headless_game(player_names, policy, seed)
+    return game.game_state.get_game_result()
+
+async def run_headless_games(count: int, policy: str = "heuristic", seed: Optional[int] = None) -> List[Dict]:
+    """在当前进程中依次跑完 count 局，第 i 局使用种子 seed + i"""
+    return [await run_headless_game(policy=policy, seed=None if seed is None else seed + i) for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面狼人杀模拟")
+    parser.add_argument("--games", type=int, default=1000, help="对局数量")
+    parser.add_argument("--policy", choices=RuleBasedAgent.POLICIES, default="heuristic", help="决策策略")
+    parser.add_argument("--seed", type=int, default=None, help="起始随机种子")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = asyncio.run(run_headless_games(args.games, args.policy, args.seed))
+    elapsed = time.perf_counter() - start
+
+    wins: Dict[str, int] = {}
+    for result in results:
+        team = result["winning_team"] or "unfinished"
+        wins[team] = wins.get(team, 0) + 1
+    print(f"完成 {len(results)} 局，用时 {elapsed:.2f} 秒，{len(results) / elapsed:.0f} 局/秒")
+    for team, count in sorted(wins.items()):
+        print(f"{team}: {count} 局 ({count / len(results):.1%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,584 @@
+"""向量化的蒙特卡洛引擎：用 NumPy 数组一次推进成千上万局规则对局
+
+需要 numpy（见 requirements.txt），其他模块都不依赖它；未安装时只有本模块不可用。
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import asyncio
+import random
+import time
+import numpy as np
+from ..controllers.agent_backend import AgentBackend
+from ..controllers.game_controller import GameController
+from ..models.game_state import GamePhase
+from ..models.role import DECK_ORDER, Role, RoleType, default_role_counts, validate_role_counts
+from .headless import MAX_ROUNDS
+
+# 数组中的角色编码
+VILLAGER, WEREWOLF, SEER, WITCH, HUNTER, GUARD = range(6)
+ROLE_TYPES = {VILLAGER: RoleType.VILLAGER, WEREWOLF: RoleType.WEREWOLF, SEER: RoleType.SEER,
+              WITCH: RoleType.WITCH, HUNTER: RoleType.HUNTER, GUARD: RoleType.GUARD}
+ROLE_CODES = {role_type: code for code, role_type in ROLE_TYPES.items()}
+DEFAULT_DECK = (WEREWOLF,) * 3 + (VILLAGER,) * 3 + (SEER, WITCH, HUNTER)
+
+def deck_from_counts(role_counts: Dict[RoleType, int]) -> Tuple[int, ...]:
+    """角色配置（角色 -> 数量）转成角色编码的牌组"""
+    validate_role_counts(role_counts, sum(role_counts.values()))
+    return tuple(ROLE_CODES[role_type] for role_type in DECK_ORDER for _ in range(role_counts.get(role_type, 0)))
+
+# 死亡原因编码（只有“被毒死”会影响规则：被毒死的猎人不能开枪）
+ALIVE, KILLED, POISONED, VOTED, SHOT = range(5)
+
+# 获胜阵营编码
+NONE, VILLAGERS, WEREWOLVES = range(3)
+WINNER_NAMES = {NONE: None, VILLAGERS: "villagers", WEREWOLVES: "werewolves"}
+
+
+def choose(mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """在最后一维为 True 的位置中均匀随机选一个，返回下标；整行都是 False 时返回 -1
+
+    先数出候选数 c，抽一个 0..c-1 的序号 k，再数前缀计数不超过 k 的位置个数，就是第 k 个候选的下标。
+    """
+    flags = mask.view(np.uint8)
+    ones = np.ones(mask.shape[-1], dtype=np.uint8)
+    counts = flags @ ones
+    k = (rng.random(counts.shape, dtype=np.float32) * counts).astype(np.uint8)
+    before = flags.cumsum(-1, dtype=np.uint8) <= k[..., None]
+    return np.where(counts > 0, (before.view(np.uint8) @ ones).astype(np.intp), -1)
+
+def nonempty(mask: np.ndarray, keepdims: bool = False) -> np.ndarray:
+    """最后一维是否有 True；用矩阵乘法计数，在很短的最后一维上比 any() 快得多"""
+    counts = mask.view(np.uint8) @ np.ones(mask.shape[-1], dtype=np.uint8)
+    return counts[..., None] > 0 if keepdims else counts > 0
+
+def first(mask: np.ndarray) -> np.ndarray:
+    """每一行第一个为 True 的下标，没有时为 -1"""
+    return np.where(nonempty(mask), mask.argmax(-1), -1)
+
+def one_hot(index: np.ndarray, size: int) -> np.ndarray:
+    """下标数组转成布尔掩码，-1 对应全 False"""
+    return index[..., None] == np.arange(size)
+
+def tally(targets: np.ndarray, voters: np.ndarray) -> np.ndarray:
+    """统计每局每名玩家得到的票数 [G, N]，只计 voters 中目标有效的票"""
+    games, players = targets.shape
+    valid = voters & (targets >= 0)
+    slots = (np.arange(games)[:, None] * players + targets)[valid]
+    return np.bincount(slots, minlength=games * players).reshape(games, players)
+
+
+class VectorGames:
+    """G 局同时进行的对局，每个字段是一个数组（第一维是对局，第二维是玩家）
+
+    只保存规则需要的状态，对应 GameState 的存活、死亡原因、药水、预言家查验和胜负，
+    策略自己的记忆放在策略对象里（和 RuleBasedAgent 一样）。
+    """
+
+    FIELDS = ("roles", "wolf", "alive", "death_reason", "save_potion", "poison_potion", "checked", "guard_target",
+              "round", "winner", "ids")
+
+    def __init__(self, roles: np.ndarray):
+        self.roles = roles  # [G, N] 角色编码
+        self.games, self.players = roles.shape
+        self.wolf = roles == WEREWOLF
+        self.alive = np.ones(roles.shape, dtype=bool)
+        self.death_reason = np.zeros(roles.shape, dtype=np.int8)
+        self.save_potion = roles == WITCH
+        self.poison_potion = roles == WITCH
+        self.checked = np.zeros((self.games, self.players, self.players), dtype=bool)  # [对局, 预言家, 被查验者]
+        self.guard_target = np.full(roles.shape, -1, dtype=np.int16)  # 每名守卫上一晚守护的玩家，-1 表示没有
+        self.round = np.zeros(self.games, dtype=np.int16)
+        self.winner = np.zeros(self.games, dtype=np.int8)
+        self.ids = np.arange(self.games)  # 在整批对局中的编号（take 之后与下标不再相同）
+        self.rows = np.arange(self.games)
+
+    def take(self, keep: np.ndarray) -> "VectorGames":
+        """只保留 keep 指定的对局，返回新的 VectorGames；已结束的对局不再参与之后的运算"""
+        subset = VectorGames.__new__(VectorGames)
+        for name in self.FIELDS:
+            setattr(subset, name, getattr(self, name)[keep])
+        subset.games, subset.players = subset.roles.shape
+        subset.rows = np.arange(subset.games)
+        return subset
+
+    def update(self, subset: "VectorGames"):
+        """把 take 出去的对局的最新状态写回整批对局"""
+        for name in self.FIELDS:
+            getattr(self, name)[subset.ids] = getattr(subset, name)
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.winner == NONE
+
+    def kill(self, target: np.ndarray, reason: int, where: np.ndarray) -> np.ndarray:
+        """让每局的 target（-1 表示无）死亡，返回实际死亡的掩码 [G]"""
+        valid = where & (target >= 0)
+        index = np.where(valid, target, 0)
+        dies = valid & self.alive[self.rows, index]
+        self.alive[self.rows[dies], index[dies]] = False
+        self.death_reason[self.rows[dies], index[dies]] = reason
+        return dies
+
+    def check_game_over(self):
+        """与 GameState.check_game_over 相同：狼人数不少于好人数时狼人胜，狼人全部死亡时好人胜"""
+        wolves = (self.alive & self.wolf).sum(1)
+        good = (self.alive & ~self.wolf).sum(1)
+        active = self.active
+        self.winner[active & (wolves >= good)] = WEREWOLVES
+        self.winner[self.active & (wolves == 0)] = VILLAGERS
+
+    def results(self) -> Dict:
+        """各阵营获胜局数和平均回合数"""
+        finished = self.winner != NONE
+        return {
+            "games": self.games,
+            "wins": {WINNER_NAMES[code]: int((self.winner == code).sum()) for code in (VILLAGERS, WEREWOLVES)},
+            "unfinished": int((~finished).sum()),
+            "average_rounds": float(self.round[finished].mean()) if finished.any() else 0.0
+        }
+
+
+class VectorPolicy(ABC):
+    """批量决策策略：每个方法一次为所有对局做出决定
+
+    参数中的 actor 是 [G] 的玩家下标（-1 表示这一局没有该角色在行动），mask 是 [G, N] 的行动者掩码，
+    返回的目标也是玩家下标，-1 表示不行动。对应 AgentBackend 的同名决策，RuleBasedAgent 的两种策略各有一个实现。
+    """
+
+    def reset(self, games: VectorGames, rng: np.random.Generator):
+        """新的一批对局开始前调用，在这里分配策略自己的记忆（第一维为对局的数组）"""
+        self.rng = rng
+
+    def take(self, keep: np.ndarray):
+        """与 VectorGames.take 同步，只保留 keep 指定对局的记忆"""
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                setattr(self, name, value[keep])
+
+    def others(self, games: VectorGames) -> np.ndarray:
+        """[G, N, N]：每名玩家眼中除自己以外的存活玩家"""
+        return games.alive[:, None, :] & ~np.eye(games.players, dtype=bool)
+
+    @abstractmethod
+    def kill_targets(self, games: VectorGames, wolves: np.ndarray) -> np.ndarray:
+        """每匹存活的狼各自选择击杀目标 [G, N]"""
+
+    @abstractmethod
+    def seer_check(self, games: VectorGames, seer: np.ndarray) -> np.ndarray:
+        """预言家的查验目标 [G]"""
+
+    def observe_check(self, games: VectorGames, seer: np.ndarray, target: np.ndarray):
+        """预言家得知查验结果（目标是否为狼人可从 games.wolf 读取）"""
+
+    @abstractmethod
+    def witch_action(self, games: VectorGames, witch: np.ndarray, killed: np.ndarray,
+                     can_save: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (是否用解药 [G], 毒药目标 [G])"""
+
+    @abstractmethod
+    def hunter_shot(self, games: VectorGames, hunter: np.ndarray) -> np.ndarray:
+        """猎人开枪带走的玩家 [G]"""
+
+    @abstractmethod
+    def guard_protect(self, games: VectorGames, guard: np.ndarray) -> np.ndarray:
+        """守卫守护的玩家 [G]"""
+
+    def guard_candidates(self, games: VectorGames, guard: np.ndarray) -> np.ndarray:
+        """[G, N]：守卫可以守护的玩家（存活且不是上一晚守护过的人，可以守护自己）"""
+        last = games.guard_target[games.rows, np.maximum(guard, 0)]
+        return games.alive & ~one_hot(np.where(guard >= 0, last, -1), games.players)
+
+    def discuss(self, games: VectorGames, speakers: np.ndarray):
+        """白天发言（speakers 为 [G, N] 掩码，遗言时只有被放逐的玩家），只更新公开信息"""
+
+    @abstractmethod
+    def votes(self, games: VectorGames, voters: np.ndarray) -> np.ndarray:
+        """每名存活玩家的投票目标 [G, N]"""
+
+
+class RandomPolicy(VectorPolicy):
+    """对应 RuleBasedAgent("random")：所有决策都在合法目标中均匀随机"""
+
+    def kill_targets(self, games, wolves):
+        targets = games.alive & ~games.wolf
+        return choose(np.broadcast_to(targets[:, None, :], games.alive.shape + (games.players,)), self.rng)
+
+    def seer_check(self, games, seer):
+        return choose(self.others(games)[games.rows, np.maximum(seer, 0)], self.rng)
+
+    def witch_action(self, games, witch, killed, can_save):
+        others = self.others(games)[games.rows, np.maximum(witch, 0)]
+        save = can_save & (self.rng.random(games.games) < 0.5)
+        has_poison = games.poison_potion[games.rows, np.maximum(witch, 0)]
+        poison = np.where(has_poison & ~save & (self.rng.random(games.games) < 0.2), choose(others, self.rng), -1)
+        return save, poison
+
+    def hunter_shot(self, games, hunter):
+        return choose(self.others(games)[games.rows, np.maximum(hunter, 0)], self.rng)
+
+    def guard_protect(self, games, guard):
+        return choose(self.guard_candidates(games, guard), self.rng)
+
+    def votes(self, games, voters):
+        return choose(self.others(games), self.rng)
+
+
+class HeuristicPolicy(VectorPolicy):
+    """对应 RuleBasedAgent("heuristic")：预言家查到狼人后公开指认，好人跟票，狼人和守卫优先针对跳出来的预言家"""
+
+    def reset(self, games, rng):
+        super().reset(games, rng)
+        shape = (games.games, games.players)
+        self.known = np.zeros(shape + (games.players,), dtype=bool)  # [对局, 预言家, 玩家] 已查验
+        self.known_wolf = np.zeros(shape + (games.players,), dtype=bool)  # 查验结果为狼人
+        self.accused = np.zeros(shape, dtype=bool)  # 被公开指认为狼人
+        self.claimed = np.zeros(shape, dtype=bool)  # 公开跳出来的预言家
+
+    def kill_targets(self, games, wolves):
+        targets = games.alive & ~games.wolf
+        seers = targets & self.claimed
+        targets = np.where(nonempty(seers, keepdims=True), seers, targets)
+        return choose(np.broadcast_to(targets[:, None, :], games.alive.shape + (games.players,)), self.rng)
+
+    def seer_check(self, games, seer):
+        index = np.maximum(seer, 0)
+        others = self.others(games)[games.rows, index]
+        unchecked = others & ~self.known[games.rows, index]
+        return choose(np.where(nonempty(unchecked, keepdims=True), unchecked, others), self.rng)
+
+    def observe_check(self, games, seer, target):
+        valid = (seer >= 0) & (target >= 0)
+        rows, seers, targets = games.rows[valid], seer[valid], target[valid]
+        self.known[rows, seers, targets] = True
+        self.known_wolf[rows, seers, targets] = games.wolf[rows, targets]
+
+    def witch_action(self, games, witch, killed, can_save):
+        index = np.maximum(witch, 0)
+        others = self.others(games)[games.rows, index]
+        has_poison = games.poison_potion[games.rows, index]
+        poison = np.where(has_poison & ~can_save, choose(others & self.accused, self.rng), -1)
+        return can_save, poison
+
+    def hunter_shot(self, games, hunter):
+        others = self.others(games)[games.rows, np.maximum(hunter, 0)]
+        accused = others & self.accused
+        return choose(np.where(nonempty(accused, keepdims=True), accused, others), self.rng)
+
+    def guard_protect(self, games, guard):
+        targets = self.guard_candidates(games, guard)
+        seers = targets & self.claimed
+        return choose(np.where(nonempty(seers, keepdims=True), seers, targets), self.rng)
+
+    def discuss(self, games, speakers):
+        wolves = self.known_wolf & games.alive[:, None, :]  # [对局, 预言家, 存活的已知狼人]
+        claims = speakers & (games.roles == SEER) & nonempty(wolves)
+        self.claimed |= claims
+        self.accused |= (claims.view(np.uint8)[:, None, :] @ wolves.view(np.uint8))[:, 0, :] > 0
+
+    def votes(self, games, voters):
+        others = self.others(games)
+        alive, roles = games.alive, games.roles[:, :, None]
+        # 狼人：优先投跳出来的预言家，其次任意好人
+        good = alive & ~games.wolf
+        seers = good & self.claimed
+        wolf_choice = np.where(nonempty(seers, keepdims=True), seers, good)[:, None, :]
+        # 预言家：投查到的存活狼人，其次还没查验过的人
+        known_wolves = self.known_wolf & alive[:, None, :]
+        seer_choice = np.where(nonempty(known_wolves, keepdims=True), known_wolves, ~self.known)
+        # 其他好人：投被指认的狼人
+        villager_choice = (alive & self.accused)[:, None, :]
+        candidates = others & np.where(roles == WEREWOLF, wolf_choice,
+                                       np.where(roles == SEER, seer_choice, villager_choice))
+        return choose(np.where(nonempty(candidates, keepdims=True), candidates, others), self.rng)
+
+
+POLICIES = {"heuristic": HeuristicPolicy, "random": RandomPolicy}
+
+
+class VectorizedEngine:
+    """按 GameController / GameState 的规则同时推进大量对局，每一步都是对整批对局的数组运算
+
+    所有对局的阶段顺序相同（夜晚、白天、投票），因此整批对局同步推进；已结束的对局在阶段内只是不再变化，
+    到下一回合开始时被移出数组。
+    只模拟规则和决策，没有发言文本和事件日志，用于平衡性分析等需要海量对局的统计。
+    trace 给出需要记录决策的对局下标，记录下来的决策可以交给 cross_check 在 GameController 上重放核对。
+    """
+
+    def __init__(self, policy: VectorPolicy, deck: Sequence[int] = DEFAULT_DECK, seed: Optional[int] = None,
+                 max_rounds: int = MAX_ROUNDS):
+        if len(deck) > 255:
+            raise ValueError("向量化引擎用 uint8 计数，每局最多 255 名玩家")
+        self.policy = policy
+        self.deck = np.asarray(deck, dtype=np.int8)
+        self.rng = np.random.default_rng(seed)
+        self.max_rounds = max_rounds
+        self._trace: Dict[int, Dict] = {}
+        self._positions: Dict[int, int] = {}  # 被记录的对局 -> 在当前数组中的下标
+        self._games: Optional[VectorGames] = None
+
+    def deal(self, count: int) -> np.ndarray:
+        """为 count 局随机分配角色（每局独立洗牌）"""
+        order = self.rng.random((count, len(self.deck))).argsort(1)
+        return self.deck[order]
+
+    def run(self, count: int, trace: Sequence[int] = ()) -> VectorGames:
+        """跑完 count 局并返回最终状态"""
+        games = self._games = VectorGames(self.deal(count))
+        self.policy.reset(games, self.rng)
+        self._trace = {int(g): {"roles": games.roles[g].tolist(), "decisions": {}, "alive": []} for g in trace}
+        self._positions = {g: g for g in self._trace}
+        while True:
+            playing = games.active & (games.round < self.max_rounds)
+            if not playing.any():
+                break
+            if playing.mean() < 0.9:
+                # 每回合开始时把已经结束的对局移出数组，之后的运算只针对还在进行的对局
+                if games is not self._games:
+                    self._games.update(games)
+                keep = np.flatnonzero(playing)
+                games = games.take(keep)
+                self.policy.take(keep)
+                playing = playing[keep]
+                traced = np.array(sorted(self._positions), dtype=games.ids.dtype)
+                found = np.searchsorted(games.ids, traced)
+                self._positions = {int(g): int(i) for g, i in zip(traced, found)
+                                   if i < games.games and games.ids[i] == g}
+            for phase in (self.night, self.day, self.vote):
+                phase(games, playing)
+                games.check_game_over()
+                self._record_alive(games, playing)
+                playing &= games.active
+                if not playing.any():
+                    break
+        if games is not self._games:
+            self._games.update(games)
+        return self._games
+
+    @property
+    def traces(self) -> Dict[int, Dict]:
+        """最近一次 run 中被记录对局的角色、逐阶段存活情况、每个决策和结果"""
+        for g, trace in self._trace.items():
+            trace["winning_team"] = WINNER_NAMES[int(self._games.winner[g])]
+            trace["rounds"] = int(self._games.round[g])
+        return self._trace
+
+    def _record(self, games: VectorGames, kind: str, actor: np.ndarray, decision, where: np.ndarray):
+        for g, i in self._positions.items():
+            if where[i] and actor[i] >= 0:
+                self._trace[g]["decisions"][(int(games.round[i]), kind, int(actor[i]) + 1)] = decision(i)
+
+    def _record_alive(self, games: VectorGames, playing: np.ndarray):
+        for g, i in self._positions.items():
+            if playing[i]:
+                self._trace[g]["alive"].append(games.alive[i].tolist())
+
+    @staticmethod
+    def _target_id(target: np.ndarray, g: int) -> Optional[int]:
+        return int(target[g]) + 1 if target[g] >= 0 else None
+
+    def night(self, games: VectorGames, playing: np.ndarray):
+        policy, rows, size = self.policy, games.rows, games.players
+        alive_before = games.alive.copy()
+
+        # 狼人：每匹狼投一个目标，得票最多者被杀，平票随机
+        wolves = games.alive & games.wolf & playing[:, None]
+        votes = policy.kill_targets(games, wolves)
+        counts = tally(votes, wolves)
+        top = counts.max(1, keepdims=True)
+        killed = np.where(playing, choose((counts == top) & (top > 0), self.rng), -1)
+        if self._positions:
+            for wolf in range(size):
+                self._record(games, "night", np.where(wolves[:, wolf], wolf, -1),
+                             lambda g: {"werewolf_kill": {"target_id": self._target_id(killed, g)}}, playing)
+
+        # 预言家：每名存活的预言家各自查验一名玩家
+        seers = games.alive & (games.roles == SEER) & playing[:, None]
+        while seers.any():
+            seer = first(seers)
+            check = np.where(seer >= 0, policy.seer_check(games, seer), -1)
+            valid = check >= 0
+            games.checked[rows[valid], seer[valid], check[valid]] = True
+            policy.observe_check(games, seer, check)
+            self._record(games, "night", seer, lambda g: {"seer_check": {"target_id": self._target_id(check, g)}},
+                         playing)
+            seers &= ~one_hot(seer, size)
+
+        # 守卫：每名存活的守卫守护一名玩家，不能连续两晚守护同一人
+        guarded = np.zeros(games.alive.shape, dtype=bool)
+        guards = games.alive & (games.roles == GUARD) & playing[:, None]
+        while guards.any():
+            guard = first(guards)
+            has_guard = guard >= 0
+            target = policy.guard_protect(games, guard)
+            target = np.where(has_guard & policy.guard_candidates(games, guard)[rows, np.maximum(target, 0)]
+                              & (target >= 0), target, -1)
+            guarded |= one_hot(target, size)
+            games.guard_target[rows[has_guard], guard[has_guard]] = target[has_guard]
+            self._record(games, "night", guard, lambda g: {"guard_protect": {"target_id": self._target_id(target, g)}},
+                         playing)
+            guards &= ~one_hot(guard, size)
+
+        # 女巫：知道狼人的目标后依次决定用药，第一夜之后不能自救；每晚最多一瓶解药、一瓶毒药生效，
+        # 已经有女巫救人后，后面的女巫看不到击杀目标
+        saved = np.zeros(games.games, dtype=bool)
+        poisoned = np.full(games.games, -1, dtype=np.intp)
+        witches = games.alive & (games.roles == WITCH) & playing[:, None]
+        while witches.any():
+            witch = first(witches)
+            has_witch = witch >= 0
+            witch_index = np.maximum(witch, 0)
+            can_save = (has_witch & (killed >= 0) & ~saved & games.save_potion[rows, witch_index]
+                        & ((killed != witch) | (games.round == 0)))
+            save, poison = policy.witch_action(games, witch, np.where(saved, -1, killed), can_save)
+            save = save & can_save
+            poison_index = np.maximum(poison, 0)
+            poison = np.where(has_witch & (poison >= 0) & (poisoned < 0) & games.poison_potion[rows, witch_index]
+                              & games.alive[rows, poison_index], poison, -1)
+            games.save_potion[rows[save], witch[save]] = False
+            used_poison = poison >= 0
+            games.poison_potion[rows[used_poison], witch[used_poison]] = False
+            self._record(games, "night", witch, lambda g: {"witch_save": {"used": bool(save[g])},
+                                                           "witch_poison": {"target_id": self._target_id(poison, g)}},
+                         playing)
+            saved |= save
+            poisoned = np.where(used_poison, poison, poisoned)
+            witches &= ~one_hot(witch, size)
+
+        # 结算：没被救也没被守护的被杀，然后是被毒的，死亡的猎人（被毒死的除外）开枪
+        protected = saved | guarded[rows, np.maximum(killed, 0)]
+        games.kill(np.where(protected, -1, killed), KILLED, playing)
+        games.kill(poisoned, POISONED, playing)
+        self._hunters_shoot(games, alive_before & ~games.alive)
+
+    def _hunters_shoot(self, games: VectorGames, died: np.ndarray):
+        """刚死亡的猎人依次开枪，被带走的玩家即使是猎人也不再开枪（与 GameController 相同）"""
+        shooters = died & (games.roles == HUNTER) & (games.death_reason != POISONED)
+        while shooters.any():
+            hunter = first(shooters)
+            target = np.where(hunter >= 0, self.policy.hunter_shot(games, hunter), -1)
+            self._record(games, "night", hunter, lambda g: {"hunter_shot": {"target_id": self._target_id(target, g)}},
+                         hunter >= 0)
+            games.kill(target, SHOT, hunter >= 0)
+            shooters &= ~one_hot(hunter, games.players)
+
+    def day(self, games: VectorGames, playing: np.ndarray):
+        self.policy.discuss(games, games.alive & playing[:, None])
+
+    def vote(self, games: VectorGames, playing: np.ndarray):
+        policy, size = self.policy, games.players
+        voters = games.alive & playing[:, None]
+        targets = np.where(voters, policy.votes(games, voters), -1)
+        if self._positions:
+            for voter in range(size):
+                self._record(games, "vote", np.where(voters[:, voter], voter, -1),
+                             lambda g, voter=voter: int(targets[g, voter]) + 1 if targets[g, voter] >= 0 else -1,
+                             playing)
+        counts = tally(targets, voters)
+        top = counts.max(1, keepdims=True)
+        leaders = (counts == top) & (top > 0)
+        voted = np.where(playing & (leaders.sum(1) == 1), leaders.argmax(1), -1)  # 平票或无人投票时没人出局
+
+        died = games.kill(voted, VOTED, playing)
+        policy.discuss(games, one_hot(np.where(died, voted, -1), size))  # 遗言
+        self._hunters_shoot(games, one_hot(np.where(died, voted, -1), size))
+        games.check_game_over()
+        games.round[playing & games.active] += 1
+
+
+def simulate(games: int, policy: str = "heuristic", seed: Optional[int] = None, batch_size: int = 100_000,
+             deck: Sequence[int] = DEFAULT_DECK) -> Dict:
+    """分批跑完 games 局，返回汇总结果"""
+    # 预言家查验等 [G, N, N] 的数组随人数平方增长，大局按人数缩小每批的对局数
+    batch_size = min(batch_size, max(1, 20_000_000 // len(deck) ** 2))
+    engine = VectorizedEngine(POLICIES[policy](), deck, seed)
+    totals = {"games": 0, "wins": {"villagers": 0, "werewolves": 0}, "unfinished": 0, "rounds": 0.0}
+    remaining = games
+    while remaining > 0:
+        batch = engine.run(min(batch_size, remaining))
+        result = batch.results()
+        finished = batch.games - result["unfinished"]
+        totals["games"] += batch.games
+        totals["unfinished"] += result["unfinished"]
+        totals["rounds"] += result["average_rounds"] * finished
+        for team, count in result["wins"].items():
+            totals["wins"][team] += count
+        remaining -= batch.games
+    finished = totals["games"] - totals["unfinished"]
+    totals["average_rounds"] = totals.pop("rounds") / finished if finished else 0.0
+    return totals
+
+class ReplayAgent(AgentBackend):
+    """按向量化引擎记录下来的决策行动，用来在 GameController 上重放同一局"""
+
+    def __init__(self, decisions: Dict[Tuple[int, str, int], object]):
+        self.decisions = decisions
+
+    async def generate_night_action(self, player, game_state):
+        return self.decisions.get((game_state.round_number, "night", player.id), {})
+
+    async def generate_discussion(self, player, game_state):
+        return "过。"
+
+    async def generate_vote(self, player, game_state):
+        return self.decisions.get((game_state.round_number, "vote", player.id), -1)
+
+
+async def replay(trace: Dict) -> Dict:
+    """用 GameController 和 GameState 按记录的角色和决策重新跑一局，返回逐阶段存活情况和结果"""
+    roles = trace["roles"]
+    counts: Dict[RoleType, int] = {}
+    for code in roles:
+        counts[ROLE_TYPES[code]] = counts.get(ROLE_TYPES[code], 0) + 1
+    game = GameController(api_controller=ReplayAgent(trace["decisions"]), discussion_delay=0, headless=True,
+                          rng=random.Random(0), role_counts=counts)
+    game._generate_roles = lambda role_counts: [Role(ROLE_TYPES[code]) for code in roles]
+    await game.initialize_game([f"玩家{i}" for i in range(1, len(roles) + 1)])
+    alive = []
+    while game.game_state.current_phase != GamePhase.GAME_OVER and game.game_state.round_number < MAX_ROUNDS:
+        await game.next_phase()
+        alive.append([p.is_alive for p in game.game_state.players])
+    result = game.game_state.get_game_result()
+    return {"alive": alive, "winning_team": result["winning_team"], "rounds": game.game_state.round_number}
+
+async def cross_check(count: int, policy: str = "heuristic", seed: Optional[int] = None,
+                      deck: Sequence[int] = DEFAULT_DECK) -> List[Dict]:
+    """向量化引擎跑 count 局并记录全部决策，再逐局交给 GameController 重放
+
+    重放时击杀目标直接使用引擎的最终结果（不再重新平票抽签），其余决策原样照搬，
+    因此两边逐阶段的存活情况、胜负和回合数都应完全相同。返回不一致的对局列表。
+    """
+    engine = VectorizedEngine(POLICIES[policy](), deck, seed)
+    engine.run(count, trace=range(count))
+    mismatches = []
+    for g, trace in engine.traces.items():
+        expected = {key: trace[key] for key in ("alive", "winning_team", "rounds")}
+        actual = await replay(trace)
+        if actual != expected:
+            mismatches.append({"game": g, "roles": trace["roles"], "engine": expected, "game_state": actual})
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="向量化的狼人杀规则模拟（整批对局同时推进）")
+    parser.add_argument("--games", type=int, default=1_000_000, help="对局数量")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="heuristic", help="决策策略")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--players", type=int, default=9, help="每局玩家人数（使用默认角色配置）")
+    parser.add_argument("--batch-size", type=int, default=100_000, help="每批同时推进的对局数")
+    parser.add_argument("--cross-check", type=int, default=0, help="额外抽取多少局在 GameController 上重放核对")
+    args = parser.parse_args()
+
+    deck = deck_from_counts(default_role_counts(args.players))
+    start = time.perf_counter()
+    totals = simulate(args.games, args.policy, args.seed, args.batch_size, deck)
+    elapsed = time.perf_counter() - start
+    print(f"完成 {totals['games']} 局，用时 {elapsed:.2f} 秒，{totals['games'] / elapsed * 60:,.0f} 局/分钟")
+    for team, count in totals["wins"].items():
+        print(f"{team}: {count} 局 ({count / totals['games']:.1%})")
+    print(f"平均回合数: {totals['average_rounds']:.2f}，未结束: {totals['unfinished']}")
+    if args.cross_check:
+        mismatches = asyncio.run(cross_check(args.cross_check, args.policy, args.seed, deck))
+        print(f"重放核对 {args.cross_check} 局，不一致: {len(mismatches)}")
+
+if __name__ == "__main__":
+    main()
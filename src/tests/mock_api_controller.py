@@ -1,6 +1,7 @@
 from src.models.role import RoleType
+from src.controllers.agent_backend import AgentBackend
 
-class MockAPIController:
+class MockAPIController(AgentBackend):
     """简化版的Mock API控制器，用于单元测试"""
     async def generate_night_action(self, player, game_state):
         if player.role.role_type == RoleType.WEREWOLF:
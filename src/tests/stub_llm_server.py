@@ -0,0 +1,132 @@
+import asyncio
+import json
+import re
+from typing import Callable, Dict, List, Optional
+
+
+def default_responder(request: Dict) -> str:
+    """根据提示词返回一个合法的决策JSON，目标总是候选列表中的第一名玩家"""
+    prompt = request["messages"][-1]["content"]
+    if '"type": "team_kill"' in prompt:
+        wolves, targets = prompt.split("可选择的目标", 1)
+        match = re.search(r"^\s*(\d+)\. ", targets, re.MULTILINE)
+        discussion = [{"wolf_id": int(wolf_id), "argument": "刀他"}
+                      for wolf_id in re.findall(r"^\s*(\d+)\. ", wolves, re.MULTILINE)]
+        return json.dumps({"type": "team_kill", "discussion": discussion,
+                           "target_id": int(match.group(1)) if match else 1}, ensure_ascii=False)
+    if '"type": "kill"' in prompt:
+        match = re.search(r"^\s*(\d+)\. ", prompt, re.MULTILINE)
+        return json.dumps({"type": "kill", "target_id": int(match.group(1)) if match else 1})
+    if '"type": "check"' in prompt:
+        match = re.search(r"^\s*- (\S+)$", prompt, re.MULTILINE)
+        return json.dumps({"type": "check", "target_id": match.group(1) if match else ""}, ensure_ascii=False)
+    if '"type": "potion"' in prompt:
+        return '{"type": "potion", "save": false, "poison_target": null}'
+    if '"type": "discussion"' in prompt:
+        return '{"type": "discussion", "message": "我是好人"}'
+    match = re.search(r"\(ID: (\d+)\)", prompt)
+    return json.dumps({"type": "vote", "target_id": int(match.group(1)) if match else 1})
+
+
+class StubLLMServer:
+    """本地慢速 OpenAI 兼容服务器，用于测试并发与网络行为
+
+    每个 chat/completions 请求都会等待 delay 秒后才返回，
+    并记录同时在处理中的请求数量。
+    """
+
+    def __init__(self, delay: float = 0.2, responder: Callable[[Dict], str] = default_responder):
+        self.delay = delay
+        self.responder = responder
+        self.requests: List[Dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = 0
+        # 预设的错误响应队列：(状态码, 额外响应头)
+        self.failures: List[tuple] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = set()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for task in self._handlers:
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode().split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, extra_headers, payload = await self._respond(method, path, body)
+                data = json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                for key, value in extra_headers.items():
+                    head += f"{key}: {value}\r\n"
+                writer.write(head.encode() + b"\r\n" + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _respond(self, method: str, path: str, body: bytes):
+        if not path.endswith("/chat/completions"):
+            return 200, {}, {"object": "list", "data": []}
+
+        request = json.loads(body)
+        self.requests.append(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        if self.failures:
+            status, extra_headers = self.failures.pop(0)
+            return status, extra_headers, {"error": {"message": "stub failure", "type": "stub"}}
+
+        return 200, {}, {
+            "id": f"stub-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.responder(request)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import time
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.models.game_state import GameState
+from src.models.player import Player
+from src.models.role import Role, RoleType
+from src.controllers.game_controller import GameController
+from src.tests.stub_llm_server import StubLLMServer
+
+PLAYER_NAMES = ["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"]
+
+@pytest.mark.asyncio
+async def test_two_games_make_overlapping_progress(tmp_path, monkeypatch):
+    """两局游戏在同一个事件循环上调用慢速服务器时应当交替推进，而不是互相阻塞"""
+    monkeypatch.chdir(tmp_path)
+    async with StubLLMServer(delay=0.1) as server:
+        games = []
+        for _ in range(2):
+            api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test")
+            game = GameController(api_controller=api)
+            await game.initialize_game(PLAYER_NAMES)
+            games.append(game)
+
+        # 在游戏运行期间持续计数，事件循环被阻塞时计数会停滞
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        ticker_task = asyncio.create_task(ticker())
+
+        start = time.perf_counter()
+        await asyncio.gather(*(game.run_vote_phase() for game in games))
+        elapsed = time.perf_counter() - start
+        ticker_task.cancel()
+
+        # 单局投票阶段内部是顺序请求，同时在途的请求只可能来自两局不同的游戏
+        assert server.max_in_flight >= 2
+        assert ticks >= elapsed / 0.01 * 0.3  # 等待期间事件循环仍在运转
+        for game in games:
+            assert game.game_state.votes
+            if game.game_output_file:
+                game.game_output_file.close()
+
+@pytest.mark.asyncio
+async def test_games_share_warm_connection_pool(tmp_path, monkeypatch):
+    """多局游戏、多个玩家共享同一端点的连接池，并在初始化时完成预热"""
+    monkeypatch.chdir(tmp_path)
+    pool = ClientPool(max_connections=4)
+    async with StubLLMServer(delay=0.05) as server:
+        games = []
+        for _ in range(2):
+            api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test", client_pool=pool)
+            game = GameController(api_controller=api)
+            await game.initialize_game(PLAYER_NAMES)
+            games.append(game)
+        
+        # 预热已经建立连接，且不超过连接池上限
+        assert 0 < server.connections <= 4
+        
+        await asyncio.gather(*(game.run_vote_phase() for game in games))
+        
+        # 两局共 18 名玩家的请求全部复用这几条连接
+        assert server.connections <= 4
+        assert server.max_in_flight <= 4
+        endpoints = {session.endpoint for game in games
+                     for session in game.api_controller._player_sessions.values()}
+        assert len(endpoints) == 1
+        for game in games:
+            if game.game_output_file:
+                game.game_output_file.close()
+        await pool.close()
+
+def test_per_loop_entries_are_evicted_after_asyncio_run():
+    """每次 asyncio.run 都会新建事件循环，已关闭的循环的客户端和限流器不会一直留在共享实例中"""
+    pool = ClientPool()
+    registry = RateLimiterRegistry()
+
+    async def use():
+        await pool.get_endpoint("http://127.0.0.1:1/v1", "test")
+        return registry.get("deepseek-chat")
+
+    guards = [asyncio.run(use()) for _ in range(3)]
+    assert len(set(map(id, guards))) == 3  # 信号量与事件循环绑定，每个循环各有一份
+    assert len(pool._endpoints) == 1
+    assert len(registry._guards) == 1
+
+def make_state() -> GameState:
+    state = GameState()
+    for i, name in enumerate(PLAYER_NAMES):
+        state.add_player(Player(i + 1, name, Role(RoleType.VILLAGER)))
+    return state
+
+@pytest.mark.asyncio
+async def test_retry_honours_retry_after():
+    """限流和服务端错误会退避重试，并遵守 Retry-After"""
+    limits = {"deepseek-chat": RateLimit(requests_per_second=100, burst=10, max_concurrency=4, backoff_base=0.01)}
+    async with StubLLMServer(delay=0) as server:
+        server.failures = [(429, {"Retry-After": "0.2"}), (503, {})]
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), rate_limiter=RateLimiterRegistry(limits))
+        state = make_state()
+        
+        start = time.perf_counter()
+        target_id = await api.generate_vote(state.players[0], state)
+        
+        assert target_id == 1
+        assert len(server.requests) == 3
+        assert time.perf_counter() - start >= 0.2
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast():
+    """连续失败后熔断，后续调用不再请求服务端而是直接返回默认决策"""
+    limits = {"deepseek-chat": RateLimit(requests_per_second=100, burst=10, max_concurrency=4, backoff_base=0.01,
+                                         failure_threshold=2, reset_timeout=60)}
+    async with StubLLMServer(delay=0) as server:
+        server.failures = [(500, {})] * 10
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), rate_limiter=RateLimiterRegistry(limits))
+        state = make_state()
+        
+        assert await api.generate_vote(state.players[0], state) == -1
+        assert await api.generate_vote(state.players[1], state) == -1
+        assert await api.generate_discussion(state.players[2], state) == "过。"
+        assert len(server.requests) == 2
+
+@pytest.mark.asyncio
+async def test_half_open_probe_always_records_an_outcome():
+    """半开状态的试探请求无论以 4xx、解析错误还是取消结束，都不会一直占着试探名额"""
+    limits = RateLimiterRegistry({"deepseek-chat": RateLimit(requests_per_second=1000, burst=100, max_concurrency=4,
+                                                             failure_threshold=1, reset_timeout=0)})
+    guard = limits.get("deepseek-chat")
+
+    for error in (ValueError("解析失败"), asyncio.CancelledError()):
+        guard.breaker.record_failure()
+        assert guard.breaker.state == guard.breaker.OPEN
+        with pytest.raises(type(error)):
+            async with guard.slot():
+                assert guard.breaker.state == guard.breaker.HALF_OPEN
+                raise error
+        async with guard.slot():  # 下一次调用仍能拿到试探名额
+            pass
+        assert guard.breaker.state == guard.breaker.CLOSED
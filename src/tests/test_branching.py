@@ -0,0 +1,92 @@
+import random
+import pytest
+from src.controllers.game_controller import GameController
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.models.game_state import GamePhase
+from src.models.role import RoleType
+from src.simulation.branching import play_to_end, run_branches
+from src.simulation.headless import play_headless_game
+
+async def game_at_round(seed: int, rounds: int, policy: str = "heuristic", **kwargs) -> GameController:
+    rng = random.Random(seed)
+    game = GameController(api_controller=RuleBasedAgent(policy, rng), discussion_delay=0, headless=True, rng=rng,
+                          **kwargs)
+    await game.initialize_game([f"玩家{i}" for i in range(1, 10)])
+    while game.game_state.round_number < rounds and game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+    return game
+
+@pytest.mark.asyncio
+async def test_fork_replays_parent_and_leaves_it_untouched():
+    """不干预的分支和本局走出完全相同的结果；分支推进时本局的状态和日志不变"""
+    reference = await play_headless_game(seed=11)
+    game = await game_at_round(11, 1)
+    events_before = len(game.game_log)
+    alive_before = [p.id for p in game.game_state.get_alive_players()]
+
+    branch = game.fork()
+    assert branch.game_log._events._segments is game.game_log._events._segments  # 分支共用已有的事件
+    assert await play_to_end(branch) == reference.game_state.get_game_result()
+    assert len(game.game_log) == events_before
+    assert [p.id for p in game.game_state.get_alive_players()] == alive_before
+
+    assert await play_to_end(game) == reference.game_state.get_game_result()
+    assert [e.details for e in branch.game_log.all_events_since(0)[0]] == \
+           [e.details for e in reference.game_log.all_events_since(0)[0]]
+
+@pytest.mark.asyncio
+async def test_intervention_only_changes_the_branch():
+    """在分支里毒死一名玩家（反事实推演），本局的玩家、索引和女巫药水都不受影响"""
+    game = await game_at_round(4, 1)
+    target = next(p for p in game.game_state.get_alive_players() if p.role.role_type != RoleType.WITCH)
+    witch = game.game_state.get_player_by_role(RoleType.WITCH)
+
+    branch = game.fork()
+    branch_target = branch.game_state.get_player_by_id(target.id)
+    branch_target.kill("poison")
+    branch.game_state._witch_potions[witch.id]["poison"] = False
+    branch.game_state.get_player_by_id(witch.id).role.has_poison = False
+
+    assert branch_target is not target and not branch.game_state.is_alive(target.id)
+    assert game.game_state.is_alive(target.id) and target.death_reason is None
+    assert game.game_state.get_witch_potions(witch.id) == game.game_state._witch_potions[witch.id]
+    assert witch.role.has_poison == game.game_state._witch_potions[witch.id]["poison"]
+    assert branch.game_state.get_alive_players() == [p for p in branch.game_state.players if p.is_alive]
+    await play_to_end(branch)
+    assert game.game_state.get_alive_players() == [p for p in game.game_state.players if p.is_alive]
+
+@pytest.mark.asyncio
+async def test_branches_run_in_parallel_and_are_reproducible():
+    game = await game_at_round(8, 1)
+    results = await run_branches(game, 6, seed=100)
+    assert len(results) == 6 and all(r["game_over"] for r in results)
+    assert results == await run_branches(game, 6, seed=100)
+    assert results == await run_branches(game, 6, seed=100, workers=2)
+    assert game.game_state.current_phase != GamePhase.GAME_OVER  # 本局还停在分支点
+
+@pytest.mark.asyncio
+async def test_worker_processes_keep_the_game_settings():
+    """多进程推演沿用本局的狼人决策方式等设置，结果与在当前事件循环上推演相同"""
+    game = await game_at_round(8, 1, "random", werewolf_mode="joint")
+    results = await run_branches(game, 8, seed=100)
+    assert results == await run_branches(game, 8, seed=100, workers=2)
+
+@pytest.mark.asyncio
+async def test_chat_history_is_copied_once_per_branch():
+    """分支后第一次发言才复制发言记录，之后原地追加；本局和分支互不影响"""
+    game = await game_at_round(3, 1)
+    player = game.game_state.get_alive_players()[0]
+    history = list(player.chat_history)
+
+    branch = game.fork()
+    branch_player = branch.game_state.get_player_by_id(player.id)
+    assert branch_player.chat_history is player.chat_history
+    branch_player.add_chat("分支里的发言")
+    copied = branch_player.chat_history
+    branch_player.add_chat("第二句")
+    assert branch_player.chat_history is copied
+    assert branch_player.chat_history == history + ["分支里的发言", "第二句"]
+
+    player.add_chat("本局的发言")
+    assert player.chat_history == history + ["本局的发言"]
+    assert branch_player.chat_history == history + ["分支里的发言", "第二句"]
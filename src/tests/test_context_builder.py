@@ -0,0 +1,129 @@
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.context_builder import ContextBuilder, estimate_tokens
+from src.models.game_log import GameEvent, GameEventType, GameLog
+from src.models.game_state import GameState
+from src.models.player import Player
+from src.models.role import Role, RoleType
+from src.tests.stub_llm_server import StubLLMServer
+
+def make_state() -> GameState:
+    """两个回合的历史：第一回合有发言和投票，第二回合有预言家的私密查验和发言"""
+    state = GameState()
+    state.game_log = GameLog()
+    roles = [RoleType.SEER, RoleType.WEREWOLF, RoleType.VILLAGER, RoleType.VILLAGER]
+    for i, role_type in enumerate(roles):
+        state.add_player(Player(i + 1, f"玩家{i + 1}", Role(role_type)))
+    log = state.game_log
+
+    def speak(player_id: int, message: str):
+        log.add_event(GameEvent(GameEventType.PLAYER_SPEAK, {"player_id": player_id, "player_name": f"玩家{player_id}",
+                                                             "message": message}))
+
+    log.add_event(GameEvent(GameEventType.PHASE_CHANGE, {"phase": "day", "round": 0}))
+    for i in range(1, 5):
+        speak(i, f"第一天的发言，内容比较长，用来占用预算{i}" * 3)
+    log.add_event(GameEvent(GameEventType.PLAYER_VOTE, {"voter_id": 1, "voter_name": "玩家1", "target_id": 2,
+                                                        "target_name": "玩家2"}))
+    log.add_event(GameEvent(GameEventType.PHASE_CHANGE, {"phase": "night", "round": 1}))
+    log.add_event(GameEvent(GameEventType.SEER_CHECK, {"player_id": 1, "message": "你查验了 玩家2，Ta是狼人"},
+                            public=False))
+    log.add_event(GameEvent(GameEventType.PHASE_CHANGE, {"phase": "day", "round": 1}))
+    speak(3, "我是好人")
+    speak(4, "我也是好人")
+    state.round_number = 1
+    return state
+
+def test_history_is_chronological_and_private():
+    """历史按发生顺序排列，私密事件只出现在本人的上下文中"""
+    state = make_state()
+    seer_context = ContextBuilder(max_tokens=10000).build(state, state.players[0])
+    villager_context = ContextBuilder(max_tokens=10000).build(state, state.players[2])
+
+    text = seer_context.text
+    assert text.index("第一天的发言") < text.index("玩家1 投票给了 玩家2") < text.index("你查验了") < text.index("我是好人")
+    assert "你查验了" not in villager_context.text
+    assert seer_context.dropped == 0
+    assert seer_context.tokens == estimate_tokens(seer_context.state) + estimate_tokens(seer_context.history)
+
+def test_budget_keeps_high_priority_events():
+    """预算不够时先舍弃更早的历史，保留私密信息、本回合发言和投票"""
+    state = make_state()
+    full = ContextBuilder(max_tokens=10000).build(state, state.players[0])
+    tight = ContextBuilder(max_tokens=full.tokens - 60).build(state, state.players[0])
+
+    assert tight.tokens <= tight.budget
+    assert tight.dropped > 0
+    for kept in ["你查验了", "我是好人", "我也是好人", "玩家1 投票给了 玩家2"]:
+        assert kept in tight.text
+    assert "占用预算1" not in tight.text  # 最早的发言最先被舍弃
+
+def test_fixed_prompt_sections_count_against_budget():
+    """系统提示词和指令占用的 token 从预算中扣除，历史只能用剩下的部分"""
+    state = make_state()
+    full = ContextBuilder(max_tokens=10000).build(state, state.players[0])
+    reserved = ContextBuilder(max_tokens=full.tokens).build(state, state.players[0], reserved_tokens=60)
+
+    assert full.dropped == 0
+    assert reserved.dropped > 0
+    assert reserved.reserved == 60
+    assert reserved.tokens + reserved.reserved <= reserved.budget
+
+@pytest.mark.asyncio
+async def test_api_controller_reports_prompt_tokens():
+    """每次请求都记录提示词的 token 用量"""
+    async with StubLLMServer(delay=0) as server:
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), context_builder=ContextBuilder(max_tokens=800))
+        state = make_state()
+        await api.generate_vote(state.players[2], state)
+
+        assert len(api.prompt_stats) == 1
+        stats = api.prompt_stats[0]
+        assert stats["player_id"] == 3
+        assert 0 < stats["context_tokens"]
+        assert stats["context_tokens"] < stats["prompt_tokens"] <= 800 + 20  # 系统提示词和指令也计入预算
+        assert api.prompt_totals["calls"] == 1
+        assert "我也是好人" in server.requests[0]["messages"][1]["content"]
+
+def test_past_rounds_replaced_by_cached_summary():
+    """已结束回合用缓存的摘要代替原文，当前回合保留原文"""
+    from src.controllers.round_summary import RoundSummarizer
+    state = make_state()
+    log = state.game_log
+    summary = RoundSummarizer(max_speech_chars=6).summarize(log.round_events(0))
+    assert "投票：玩家2←玩家1" in summary
+    assert "第一天的发言…" in summary
+    log.set_round_summary(0, summary)
+
+    context = ContextBuilder(max_tokens=10000).build(state, state.players[0])
+    raw = ContextBuilder(max_tokens=10000, use_summaries=False).build(state, state.players[0])
+
+    assert f"[第1天摘要] {summary}" in context.text
+    assert "占用预算" not in context.text
+    assert "我也是好人" in context.text and "你查验了" in context.text
+    assert context.tokens < raw.tokens
+
+@pytest.mark.asyncio
+async def test_game_summarizes_each_round_once(monkeypatch):
+    """每回合投票结束后生成一次摘要"""
+    import random
+    from src.controllers.game_controller import GameController
+    from src.controllers.round_summary import RoundSummarizer
+    from src.controllers.rule_based_agent import RuleBasedAgent
+    from src.models.game_state import GamePhase
+
+    calls = []
+    summarizer = RoundSummarizer()
+    summarize = summarizer.summarize
+    monkeypatch.setattr(summarizer, "summarize", lambda events: calls.append(events[0].round) or summarize(events))
+    rng = random.Random(3)
+    game = GameController(api_controller=RuleBasedAgent(rng=rng), discussion_delay=0, headless=True, rng=rng,
+                          round_summarizer=summarizer)
+    await game.initialize_game([f"玩家{i}" for i in range(1, 10)])
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+
+    assert calls and calls == sorted(set(calls))
+    assert all(game.game_log.get_round_summary(r) for r in calls)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import pytest
+from src.models.game_log import GameEvent, GameEventType, GameLog
+from src.server.event_stream import GOD_VIEW, EventHub
+from src.server.game_manager import GameManager
+from src.server.http_server import GameServer
+
+def speak(player_id: int) -> GameEvent:
+    return GameEvent(GameEventType.PLAYER_SPEAK, {"player_id": player_id, "player_name": f"玩家{player_id}",
+                                                  "message": "过。"})
+
+def seer_check(player_id: int) -> GameEvent:
+    return GameEvent(GameEventType.SEER_CHECK, {"player_id": player_id, "target_id": 1, "target_name": "玩家1",
+                                                "is_werewolf": False}, public=False)
+
+def drain(subscription):
+    events = []
+    while True:
+        event = subscription._pop()
+        if event is None:
+            return events
+        events.append(event)
+
+@pytest.mark.asyncio
+async def test_events_fan_out_by_visibility():
+    """公开事件发给所有订阅者，私密事件只发给对应玩家和上帝视角，每人只收到一次"""
+    log = GameLog()
+    hub = EventHub(log)
+    public, seer, other, god = hub.subscribe(), hub.subscribe(7), hub.subscribe(3), hub.subscribe(GOD_VIEW)
+    log.add_event(speak(1))
+    log.add_event(seer_check(7))
+    log.add_event(speak(2))
+
+    assert [e.seq for e in drain(public)] == [0, 2]
+    assert [e.seq for e in drain(seer)] == [0, 1, 2]
+    assert [e.seq for e in drain(other)] == [0, 2]
+    assert [e.seq for e in drain(god)] == [0, 1, 2]
+    assert hub.encode(log.all_events_since(0)[0][0]) is hub.encode(log.all_events_since(0)[0][0])
+
+    hub.close()
+    assert await public.get() is None and public.close_reason == "game_over"
+    assert hub.subscriber_count == 0
+
+@pytest.mark.asyncio
+async def test_backlog_then_live_without_gaps():
+    """从游标订阅时先补发已有事件，再无缝接上实时事件"""
+    log = GameLog()
+    hub = EventHub(log)
+    for player_id in range(1, 4):
+        log.add_event(speak(player_id))
+    subscription = hub.subscribe(cursor=1)
+
+    async def publish_later():
+        await asyncio.sleep(0.01)
+        log.add_event(speak(4))
+        hub.close()
+
+    publisher = asyncio.create_task(publish_later())
+    assert [event.seq async for event in subscription] == [1, 2, 3]
+    await publisher
+    assert subscription.cursor == 4
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_disconnected_and_can_resume():
+    """队列满时断开慢消费者；用它的游标重新订阅可以补上全部事件"""
+    log = GameLog()
+    hub = EventHub(log)
+    slow = hub.subscribe(cursor=0, max_queue=2)
+    log.add_event(speak(1))
+    assert (await slow.get()).seq == 0
+    for player_id in range(2, 7):
+        log.add_event(speak(player_id))
+
+    assert slow.closed and slow.close_reason == "overflow"
+    assert await slow.get() is None
+    resumed = hub.subscribe(cursor=slow.cursor)
+    assert [e.seq for e in drain(resumed)] == [1, 2, 3, 4, 5]
+
+    lossy = hub.subscribe(max_queue=2, policy="drop_oldest")
+    for player_id in range(7, 11):
+        log.add_event(speak(player_id))
+    assert [e.seq for e in drain(lossy)] == [8, 9] and lossy.dropped == 2 and not lossy.closed
+
+async def read_stream(base_url: str, path: str, last_event_id=None):
+    """读取一个 SSE 流直到服务端结束，返回 [(事件名, id, 数据)]"""
+    host, port = base_url.split("//")[1].split(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    extra = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id is not None else ""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n{extra}\r\n".encode())
+    await writer.drain()
+    raw = (await reader.read()).decode()
+    writer.close()
+    head, _, body = raw.partition("\r\n\r\n")
+    assert "text/event-stream" in head
+    frames = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if line and not line.startswith(":"))
+        if fields:
+            frames.append((fields.get("event"), fields.get("id"), json.loads(fields["data"])))
+    return frames
+
+@pytest.mark.asyncio
+async def test_sse_stream_replays_and_resumes_with_last_event_id():
+    manager = GameManager(discussion_delay=0.001)
+    async with GameServer(manager, port=0, admin_token="admin-secret") as server:
+        game = manager.create_game(agent="heuristic", seed=2)
+        frames = await read_stream(server.base_url, f"/games/{game.id}/stream?view=god&token=admin-secret")
+        assert frames[-1][0] == "end" and frames[-1][2]["reason"] == "finished"
+        ids = [int(frame_id) for _, frame_id, _ in frames[:-1]]
+        assert ids == list(range(len(game.controller.game_log)))
+
+        resumed = await read_stream(server.base_url, f"/games/{game.id}/stream?view=god", last_event_id=10)  # 已结束
+        assert [int(frame_id) for _, frame_id, _ in resumed[:-1]] == ids[11:]
+
+        public = await read_stream(server.base_url, f"/games/{game.id}/stream")
+        assert all(data["public"] for event, _, data in public[:-1])
+        assert len(public) < len(frames)
+
+@pytest.mark.asyncio
+async def test_private_streams_need_a_token_while_the_game_runs():
+    manager = GameManager(discussion_delay=0.01)
+    async with GameServer(manager, port=0) as server:
+        game = manager.create_game(agent="heuristic", seed=2)
+        host, port = server.base_url.split("//")[1].split(":")
+
+        async def status(path: str) -> int:
+            reader, writer = await asyncio.open_connection(host, int(port))
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+            line = await reader.readline()
+            writer.close()
+            return int(line.split(b" ")[1])
+
+        token = game.player_tokens[3]
+        assert await status(f"/games/{game.id}/stream?view=god") == 403
+        assert await status(f"/games/{game.id}/stream?player_id=3") == 401
+        assert await status(f"/games/{game.id}/stream?player_id=4&token={token}") == 403
+        frames = await read_stream(server.base_url, f"/games/{game.id}/stream?player_id=3&token={token}")
+        assert frames[-1][0] == "end" and frames[-1][2]["reason"] == "finished"
+        assert (await read_stream(server.base_url, f"/games/{game.id}/stream?view=god"))[-1][0] == "end"
@@ -0,0 +1,90 @@
+from src.models.game_log import GameEvent, GameEventType, GameLog
+
+def speak(player_id: int, message: str) -> GameEvent:
+    return GameEvent(GameEventType.PLAYER_SPEAK, {"player_id": player_id, "player_name": f"玩家{player_id}",
+                                                  "message": message})
+
+def seer_check(seer_id: int) -> GameEvent:
+    return GameEvent(GameEventType.SEER_CHECK, {"player_id": seer_id, "target_name": "玩家1", "role": "狼人",
+                                                "message": "你查验了 玩家1，Ta是狼人"}, public=False)
+
+def test_private_events_only_visible_to_owner():
+    """私密事件只出现在对应玩家的事件流中，并与公开事件保持时间顺序"""
+    log = GameLog()
+    for event in [speak(1, "a"), seer_check(2), speak(3, "b")]:
+        log.add_event(event)
+
+    seer_events, _ = log.events_since(0, player_id=2)
+    other_events, _ = log.events_since(0, player_id=3)
+    public_events, _ = log.events_since(0)
+
+    assert [e.seq for e in seer_events] == [0, 1, 2]
+    assert [e.seq for e in other_events] == [0, 2]
+    assert [e.seq for e in public_events] == [0, 2]
+    assert [e["type"] for e in log.get_player_events(2)] == ["player_speak", "seer_check", "player_speak"]
+
+def test_cursor_reads_only_new_events(capsys):
+    """游标每次只返回上次读取之后新增的可见事件，且不输出调试信息"""
+    log = GameLog()
+    cursor = log.cursor(player_id=2)
+    log.add_event(speak(1, "a"))
+    log.add_event(seer_check(2))
+    first = cursor.read()
+    assert first[0] is log.all_events_since(0)[0][0]
+    assert len(first) == 2
+
+    log.add_event(seer_check(5))
+    log.add_event(speak(3, "b"))
+    assert [e.seq for e in cursor.read()] == [3]
+    assert cursor.read() == []
+    assert capsys.readouterr().out == ""
+
+def test_negative_start_reads_recent_events():
+    log = GameLog()
+    for i in range(5):
+        log.add_event(speak(1, str(i)))
+    assert [e["details"]["message"] for e in log.get_public_events(-2)] == ["3", "4"]
+
+def test_event_text_rendered_once(monkeypatch):
+    """事件文本只渲染一次，之后的读取直接使用缓存"""
+    from src.models import game_log
+    calls = []
+    render = game_log._RENDERERS[GameEventType.PLAYER_SPEAK]
+    monkeypatch.setitem(game_log._RENDERERS, GameEventType.PLAYER_SPEAK,
+                        lambda details: calls.append(details) or render(details))
+
+    log = GameLog()
+    event = speak(1, "我是好人")
+    log.add_event(event)
+    assert log.format_event(event) == "玩家1: 我是好人"
+    assert [log.format_event(e) for e in log.events_since(0)[0]] == ["玩家1: 我是好人"]
+    assert event.text is log.format_event(event)
+    assert len(calls) == 1
+
+def test_format_event_accepts_dicts():
+    """to_dict() 得到的字典与事件本身渲染结果相同"""
+    event = GameEvent(GameEventType.PHASE_CHANGE, {"phase": "night", "round": 0})
+    assert GameLog().format_event(event.to_dict()) == event.text == "进入夜晚阶段。"
+
+def test_fork_shares_history_after_both_sides_write():
+    """分支之后两边各自追加，已有事件一直共用不复制；读取结果与各自单独记录时相同"""
+    log = GameLog()
+    for i in range(100):
+        log.add_event(speak(i % 4 + 1, str(i)))
+        log.add_event(seer_check(2))
+    branch = log.fork()
+    branch.add_event(speak(1, "分支"))
+    log.add_event(speak(1, "本局"))
+    nested = branch.fork()
+    nested.add_event(seer_check(2))
+
+    history = log._events._segments[0]
+    assert branch._events._segments[0] is history and nested._events._segments[0] is history
+    assert len(log._events._tail) == 1 and len(branch._events._segments) == 2  # 只有各自追加的事件
+
+    assert [e["details"]["message"] for e in branch.get_public_events(-3)] == ["99", "分支"]
+    assert [e["details"]["message"] for e in log.get_public_events(-3)] == ["99", "本局"]
+    assert len(nested) == 202 and len(log) == 201
+    assert [e.seq for e in nested.events_since(199, player_id=2)[0]] == [199, 200, 201]
+    assert [e.details["message"] for e in nested.round_events(0)][-2:] == ["99", "分支"]
+    assert [e.seq for e in log.all_events_since(0)[0]] == list(range(201))
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import pytest_asyncio
 from src.models.game_state import GameState
@@ -343,4 +344,95 @@ async def test_night_phase_death_timing(game: GameController):
     assert not villager1.is_alive
     assert villager1.death_reason == "werewolf"
     assert not villager2.is_alive
-    assert villager2.death_reason == "poison" 
\ No newline at end of file
+    assert villager2.death_reason == "poison"
+
+class SlowMockAPIController(MockAPIController):
+    """带延迟的Mock API控制器，用于验证并发决策"""
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.seen_states = set()
+        self.timeline = []  # (事件, 角色)
+        
+    async def generate_night_action(self, player, game_state):
+        self.timeline.append(("start", player.role.role_type))
+        await asyncio.sleep(self.delay)
+        self.timeline.append(("end", player.role.role_type))
+        return await super().generate_night_action(player, game_state)
+        
+    async def generate_vote(self, player, game_state):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.seen_states.add(id(game_state))
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return await super().generate_vote(player, game_state)
+
+@pytest.mark.asyncio
+async def test_vote_phase_fan_out(tmp_path, monkeypatch):
+    """测试并发投票：同一快照、并发上限和确定的写回顺序"""
+    monkeypatch.chdir(tmp_path)
+    api_controller = SlowMockAPIController()
+    game = GameController(GameState(), api_controller, decision_concurrency=4)
+    await game.initialize_game(["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"])
+    alive_ids = [p.id for p in game.game_state.get_alive_players()]
+    
+    await game.run_vote_phase()
+    
+    # 并发数受限于配置的上限
+    assert api_controller.max_in_flight == 4
+    # 所有投票者看到的是同一份快照，而不是正在变化的真实状态
+    assert len(api_controller.seen_states) == 1
+    assert id(game.game_state) not in api_controller.seen_states
+    # 投票按玩家顺序写回
+    assert list(game.game_state.votes.keys()) == alive_ids
+
+@pytest.mark.asyncio
+async def test_night_actions_follow_dependencies(tmp_path, monkeypatch):
+    """测试夜晚行动调度：预言家与狼人同时行动，女巫在狼人决定后才行动"""
+    monkeypatch.chdir(tmp_path)
+    api_controller = SlowMockAPIController()
+    game = GameController(GameState(), api_controller)
+    await game.initialize_game(["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"])
+    
+    await game.run_night_phase()
+    
+    timeline = api_controller.timeline
+    last_wolf_end = max(i for i, e in enumerate(timeline) if e == ("end", RoleType.WEREWOLF))
+    first_wolf_start = timeline.index(("start", RoleType.WEREWOLF))
+    assert timeline.index(("start", RoleType.SEER)) < last_wolf_end
+    assert timeline.index(("start", RoleType.SEER)) >= first_wolf_start
+    assert timeline.index(("start", RoleType.WITCH)) > last_wolf_end
+
+@pytest.mark.asyncio
+async def test_player_indexes_stay_consistent(game: GameController):
+    """投票放逐、猎人开枪和直接修改存活状态后，索引与计数都和玩家列表一致"""
+    state = game.game_state
+
+    def assert_consistent(view: GameState):
+        assert view.get_alive_players() == [p for p in view.players if p.is_alive]
+        for p in view.players:
+            assert view.get_player_by_id(p.id) is p
+            assert view.get_player_by_name(p.name) is p
+            assert view.is_alive(p.id) == p.is_alive
+        alive_wolves = len(view.get_players_by_role(RoleType.WEREWOLF, alive_only=True))
+        assert view._alive_werewolf_count == alive_wolves
+        assert view._alive_villager_count == len(view.get_alive_players()) - alive_wolves
+
+    assert_consistent(state)
+    hunter = state.get_player_by_role(RoleType.HUNTER)
+    target = next(p for p in state.players if p.id != hunter.id)
+    for voter in state.get_alive_players():
+        state.record_vote(voter.id, hunter.id)
+    voted, is_tie = state.process_vote()
+    assert voted is hunter and not is_tie
+    assert_consistent(state)
+
+    assert state.process_hunter_shot(hunter.id, target.id)
+    assert not state.is_alive(target.id)
+    assert_consistent(state)
+
+    target.is_alive = True
+    assert_consistent(state)
+    assert_consistent(state.snapshot())
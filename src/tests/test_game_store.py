@@ -0,0 +1,181 @@
+import asyncio
+import random
+import threading
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.game_controller import GameController
+from src.controllers.game_store import GameStore
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.models.game_state import GamePhase
+from src.server.game_manager import GameManager, GameSession
+from src.simulation.headless import MAX_ROUNDS, play_headless_game
+from src.tests.stub_llm_server import StubLLMServer
+
+class Crash(Exception):
+    """模拟进程中途退出"""
+
+
+class CrashingAgent(RuleBasedAgent):
+    """第 crash_at 次决策时抛出异常"""
+
+    def __init__(self, crash_at: int, rng: random.Random):
+        super().__init__("heuristic", rng)
+        self.crash_at = crash_at
+        self.calls = 0
+
+    def _tick(self):
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise Crash()
+
+    async def generate_night_action(self, player, game_state):
+        self._tick()
+        return await super().generate_night_action(player, game_state)
+
+    async def generate_discussion(self, player, game_state):
+        self._tick()
+        return await super().generate_discussion(player, game_state)
+
+    async def generate_vote(self, player, game_state):
+        self._tick()
+        return await super().generate_vote(player, game_state)
+
+
+async def play(game: GameController):
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        assert game.game_state.round_number < MAX_ROUNDS
+        await game.next_phase()
+
+def event_records(game: GameController):
+    events, _ = game.game_log.all_events_since(0)
+    return [(e.event_type, e.details, e.public, e.round) for e in events]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("crash_at", [3, 20, 47])
+async def test_crashed_game_resumes_to_same_result(tmp_path, crash_at):
+    """对局在某个阶段中途退出后，新进程从快照恢复，结果和事件与不中断的对局完全一致"""
+    reference = await play_headless_game(seed=7)
+    path = str(tmp_path / "games.db")
+
+    rng = random.Random(7)
+    crashed = GameController(api_controller=CrashingAgent(crash_at, rng), discussion_delay=0, headless=True,
+                             rng=rng, store=GameStore(path, batch_size=4), game_id="g1")
+    await crashed.initialize_game([p.name for p in reference.game_state.players])
+    with pytest.raises(Crash):
+        await play(crashed)
+    # 不关闭旧的存储：攒着没提交的事件随进程一起丢失
+
+    store = GameStore(path)
+    assert store.unfinished_games() == ["g1"]
+    rng = random.Random()
+    resumed = GameController(api_controller=RuleBasedAgent("heuristic", rng), discussion_delay=0, headless=True,
+                             rng=rng, store=store, game_id="g1")
+    assert await resumed.resume()
+    assert len(resumed.game_log) <= len(crashed.game_log)
+    await play(resumed)
+
+    assert resumed.game_state.get_game_result() == reference.game_state.get_game_result()
+    assert event_records(resumed) == event_records(reference)
+    assert [e.seq for e in store.load_events("g1")] == list(range(len(reference.game_log)))
+    assert store.unfinished_games() == []
+    assert store.game_metadata("g1")["result"] == reference.game_state.get_game_result()
+    store.close()
+
+@pytest.mark.asyncio
+async def test_snapshots_are_compact_and_commits_batched(tmp_path):
+    store = GameStore(str(tmp_path / "games.db"), batch_size=1000, keep_snapshots=2)
+    rng = random.Random(3)
+    game = GameController(api_controller=RuleBasedAgent("heuristic", rng), discussion_delay=0, headless=True,
+                          rng=rng, store=store, game_id="g1")
+    await game.initialize_game([f"玩家{i}" for i in range(1, 10)])
+    await play(game)
+
+    store.sync()
+    phases = game.game_state.round_number * 3 + 3  # 进行过的阶段数的上限
+    assert store.commits <= phases + 3  # 每个阶段一次提交，而不是每条事件一次
+    rows = store._db.execute("SELECT COUNT(*), MAX(LENGTH(state)) FROM snapshots").fetchone()
+    assert rows[0] == 2 and rows[1] < 32 * 1024
+    assert not await GameController(store=store, game_id="missing", headless=True).resume()
+    store.close()
+
+@pytest.mark.asyncio
+async def test_resumed_llm_game_does_not_repeat_paid_calls(tmp_path):
+    """LLM 对局中途被取消后恢复：中断阶段里已经拿到的响应从缓存读取，不再请求服务"""
+    fast = RateLimit(requests_per_second=1000, burst=1000, max_concurrency=64)
+    limits = RateLimiterRegistry({"deepseek-chat": fast})
+    pool = ClientPool(max_connections=64)
+
+    def backend(agent, model, rng):
+        return APIController(model_name=model, base_url=llm.base_url, api_key="test", client_pool=pool,
+                             rate_limiter=limits, show_progress=False)
+
+    async with StubLLMServer(delay=0) as llm:
+        reference = GameManager(backend_factory=backend).create_game(seed=5)
+        await reference.task
+        paid = len(llm.requests)
+        llm.requests.clear()
+
+        path = str(tmp_path / "games.db")
+        manager = GameManager(backend_factory=backend, store=GameStore(path))
+        session = manager.create_game(seed=5)
+        while session.response_cache.writes < 8:  # 第一晚之后、白天讨论进行到一半
+            await asyncio.sleep(0)
+        await manager.shutdown()
+        assert session.status == GameSession.CANCELLED
+
+        restarted = GameManager(backend_factory=backend, store=GameStore(path))
+        [resumed] = restarted.resume_games()
+        assert resumed.id == session.id
+        await restarted.wait(resumed.id)
+
+    assert resumed.status == GameSession.FINISHED
+    assert resumed.to_dict()["result"] == reference.to_dict()["result"]
+    assert resumed.response_cache.disk_hits > 0
+    assert paid <= len(llm.requests) <= paid + 1  # 只有被取消时还在途的那一次请求可能重发
+
+@pytest.mark.asyncio
+async def test_bad_games_never_block_resume(tmp_path):
+    """参数不合法的建局请求不会登记到存储；存储里无法重建的对局标记为失败，不影响其他对局恢复"""
+    store = GameStore(str(tmp_path / "games.db"))
+    manager = GameManager(store=store)
+    with pytest.raises(ValueError):
+        manager.create_game(agent="random", seed=[1, 2])
+    assert store.unfinished_games() == []
+
+    store.create_game("broken", {"players": ["甲", "乙"], "agent": "random", "model": None, "seed": [1, 2]})
+    session = manager.create_game(agent="heuristic", seed=1)
+    await manager.shutdown()
+
+    restarted = GameManager(store=store)
+    [resumed] = restarted.resume_games()
+    assert resumed.id == session.id
+    assert store.unfinished_games() == [session.id]
+    await restarted.wait(resumed.id)
+    assert resumed.status == GameSession.FINISHED
+    store.close()
+
+@pytest.mark.asyncio
+async def test_commits_run_on_the_writer_thread(tmp_path):
+    """事件、快照和结束状态都在写线程中提交，事件循环上只排队"""
+    store = GameStore(str(tmp_path / "games.db"), batch_size=8)
+    threads = []
+    commit = store._commit
+
+    def record():
+        threads.append(threading.current_thread())
+        commit()
+
+    store._commit = record
+    rng = random.Random(3)
+    game = GameController(api_controller=RuleBasedAgent("heuristic", rng), discussion_delay=0, headless=True,
+                          rng=rng, store=store, game_id="g1")
+    await game.initialize_game([f"玩家{i}" for i in range(1, 10)])
+    await play(game)
+    await store.sync_async()
+
+    assert threads and threading.current_thread() not in threads
+    assert len(store.load_events("g1")) == len(game.game_log)
+    assert store.unfinished_games() == []
+    store.close()
@@ -0,0 +1,80 @@
+import os
+import pytest
+from src.controllers.agent_backend import AgentBackend
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.models.game_state import GameState
+from src.models.player import Player
+from src.models.role import Role, RoleType
+from src.simulation.batch import iter_results, run_batch
+from src.simulation.headless import play_headless_game, run_headless_game
+
+def make_state() -> GameState:
+    state = GameState()
+    roles = [RoleType.WEREWOLF, RoleType.SEER, RoleType.VILLAGER, RoleType.VILLAGER]
+    for i, role_type in enumerate(roles):
+        state.add_player(Player(i + 1, f"玩家{i + 1}", Role(role_type)))
+    return state
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", RuleBasedAgent.POLICIES)
+async def test_headless_game_is_silent(policy, tmp_path, monkeypatch, capsys):
+    """无界面模式跑完整局：不写日志文件，不输出到控制台"""
+    monkeypatch.chdir(tmp_path)
+    result = await run_headless_game(policy=policy, seed=3)
+
+    assert result["game_over"]
+    assert result["winning_team"] in ("villagers", "werewolves")
+    assert os.listdir(tmp_path) == []
+    assert capsys.readouterr().out == ""
+
+@pytest.mark.asyncio
+async def test_villagers_follow_seer_accusation():
+    """预言家查到狼人后公开指认，其他好人跟着投狼人"""
+    state = make_state()
+    agent = RuleBasedAgent("heuristic")
+    seer, villager = state.players[1], state.players[2]
+
+    action = await agent.generate_night_action(seer, state)
+    while state.get_player_by_id(action["seer_check"]["target_id"]).role.role_type != RoleType.WEREWOLF:
+        action = await agent.generate_night_action(seer, state)
+
+    speech = await agent.generate_discussion(seer, state)
+    assert "玩家1" in speech
+    assert await agent.generate_vote(villager, state) == 1
+    wolf_kill = await agent.generate_night_action(state.players[0], state)
+    assert wolf_kill["werewolf_kill"]["target_id"] == seer.id
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        RuleBasedAgent("smart")
+
+def test_backend_must_implement_every_decision():
+    """只实现了部分决策的后端在创建时就报错，而不是在游戏进行到一半时"""
+    class NightOnly(AgentBackend):
+        async def generate_night_action(self, player, game_state):
+            return {}
+
+    with pytest.raises(TypeError):
+        NightOnly()
+
+@pytest.mark.asyncio
+async def test_same_seed_replays_same_game():
+    """相同种子的两局从角色分配到每一次决策都完全一致"""
+    first = await play_headless_game(seed=42)
+    second = await play_headless_game(seed=42)
+    assert [p.role.role_type for p in first.game_state.players] == [p.role.role_type for p in second.game_state.players]
+    assert [(e.event_type, e.details) for e in first.game_log.all_events_since(0)[0]] == \
+           [(e.event_type, e.details) for e in second.game_log.all_events_since(0)[0]]
+
+def test_batch_results_independent_of_workers():
+    """多进程与单进程跑同一组种子，每局结果与汇总统计都相同"""
+    single = sorted((s for chunk in iter_results(30, seed=5, workers=1) for s in chunk), key=lambda s: s["seed"])
+    multi = sorted((s for chunk in iter_results(30, seed=5, workers=2, chunk_size=7) for s in chunk), key=lambda s: s["seed"])
+    assert single == multi
+    assert [s["seed"] for s in single] == list(range(5, 35))
+
+    report = run_batch(30, seed=5, workers=2)
+    assert report["games"] == 30
+    assert sum(report["team_win_rate"].values()) == pytest.approx(1.0)
+    assert 0.0 <= report["vote_accuracy"] <= 1.0
+    assert report["games_per_second"] > 0
@@ -0,0 +1,77 @@
+import json
+import random
+import threading
+import time
+import pytest
+from src.controllers.game_controller import GameController
+from src.controllers.log_writer import BufferedLogWriter
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.models.game_state import GamePhase
+
+def test_close_flushes_and_is_idempotent(tmp_path):
+    """关闭时写完剩余缓冲，重复关闭没有副作用，关闭后不能再写"""
+    path = tmp_path / "game.txt"
+    writer = BufferedLogWriter(str(path))
+    writer.write("第一行\n")
+    writer.write("第二行\n")
+    writer.close()
+    writer.close()
+
+    assert path.read_text(encoding="utf-8") == "第一行\n第二行\n"
+    with pytest.raises(ValueError):
+        writer.write("太晚了\n")
+
+def test_size_threshold_wakes_background_flush(tmp_path):
+    """缓冲超过上限时后台线程提前写盘，调用方不做 I/O"""
+    path = tmp_path / "game.txt"
+    writer = BufferedLogWriter(str(path), max_buffer_bytes=10)
+    writer.write("x" * 20 + "\n")
+    deadline = time.monotonic() + 2
+    while path.stat().st_size == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert path.read_text(encoding="utf-8") == "x" * 20 + "\n"
+    writer.close()
+
+@pytest.mark.asyncio
+async def test_structured_log_records_every_event(tmp_path, monkeypatch):
+    """开启结构化日志后，每条游戏事件都按顺序写入 JSONL，阶段结束时文本日志已落盘"""
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(1)
+    game = GameController(api_controller=RuleBasedAgent(rng=rng), discussion_delay=0, structured_log=True, rng=rng)
+    await game.initialize_game(["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"])
+    writer = game.game_output_file
+    await game.run_night_phase()
+    assert "夜晚" in open(writer.name, encoding="utf-8").read()
+
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+    assert writer.closed
+
+    with open(writer.jsonl_name, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["seq"] for r in records] == list(range(len(game.game_log)))
+    assert records[0]["type"] == "game_start"
+
+@pytest.mark.asyncio
+async def test_game_over_writes_files_off_the_event_loop(tmp_path, monkeypatch):
+    """游戏结束时关闭日志、写指标快照都在线程池中完成，不在事件循环线程上做文件 I/O"""
+    monkeypatch.chdir(tmp_path)
+    loop_thread = threading.current_thread()
+    writes = []
+    close = BufferedLogWriter.close
+
+    def record_close(writer):
+        writes.append(threading.current_thread())
+        close(writer)
+
+    monkeypatch.setattr(BufferedLogWriter, "close", record_close)
+    rng = random.Random(1)
+    game = GameController(api_controller=RuleBasedAgent(rng=rng), discussion_delay=0, structured_log=True, rng=rng)
+    await game.initialize_game(["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"])
+    base = game.game_output_file.name.rsplit(".", 1)[0]
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+
+    assert writes and loop_thread not in writes
+    with open(base + ".metrics.json", encoding="utf-8") as f:
+        assert json.load(f)
@@ -0,0 +1,144 @@
+import glob
+import json
+import random
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.game_controller import GameController
+from src.controllers.metrics import MetricsRegistry
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.controllers.response_cache import ResponseCache
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.models.game_state import GamePhase, GameState
+from src.models.player import Player
+from src.models.role import Role, RoleType
+from src.tests.stub_llm_server import StubLLMServer
+
+PLAYER_NAMES = ["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"]
+
+def test_histogram_exports_cumulative_buckets():
+    """直方图按 Prometheus 文本格式导出累计分桶、总和与计数"""
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "演示耗时", ("model",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.labels("m\"1").observe(value)
+    registry.counter("demo_total", "演示计数").labels().inc(2)
+
+    text = registry.to_prometheus()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{model="m\\"1",le="0.1"} 2' in text
+    assert 'demo_seconds_bucket{model="m\\"1",le="1"} 3' in text
+    assert 'demo_seconds_bucket{model="m\\"1",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{model="m\\"1"} 4' in text
+    assert "demo_total 2" in text
+
+    series = registry.to_dict()["demo_seconds"]["series"][0]
+    assert series["labels"] == {"model": "m\"1"}
+    assert series["count"] == 4
+    assert series["sum"] == pytest.approx(3.65)
+
+def test_registry_rejects_conflicting_definitions():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "调用次数", ("model",))
+    assert registry.counter("calls_total", "调用次数", ("model",)) is registry.get("calls_total")
+    with pytest.raises(ValueError):
+        registry.histogram("calls_total", "调用次数", ("model",))
+
+@pytest.mark.asyncio
+async def test_api_calls_and_phases_are_instrumented(tmp_path, monkeypatch):
+    """一局实时请求的游戏：每次调用都记录耗时、排队和 token，每个阶段都记录耗时"""
+    monkeypatch.chdir(tmp_path)
+    registry = MetricsRegistry()
+    limits = RateLimiterRegistry({"deepseek-chat": RateLimit(requests_per_second=1000, burst=1000, max_concurrency=16)})
+    async with StubLLMServer(delay=0) as server:
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), rate_limiter=limits, metrics=registry,
+                            prices={"deepseek-chat": (1.0, 2.0)})
+        random.seed(7)
+        game = GameController(api_controller=api, discussion_delay=0, metrics=registry)
+        await game.initialize_game(PLAYER_NAMES)
+        while game.game_state.current_phase != GamePhase.GAME_OVER:
+            await game.next_phase()
+        requests = len(server.requests)
+
+    metrics = registry.to_dict()
+    calls = sum(s["value"] for s in metrics["werewolf_llm_calls_total"]["series"])
+    retries = sum(s["value"] for s in metrics.get("werewolf_llm_retries_total", {"series": []})["series"])
+    assert calls + retries == requests
+    assert sum(s["count"] for s in metrics["werewolf_llm_queue_seconds"]["series"]) == calls
+
+    tokens = {s["labels"]["kind"]: s for s in metrics["werewolf_llm_tokens"]["series"]}
+    assert tokens["prompt"]["count"] == requests
+    assert tokens["prompt"]["sum"] == 10 * requests
+    assert tokens["completion"]["sum"] == 5 * requests
+    cost = metrics["werewolf_llm_cost_total"]["series"][0]["value"]
+    assert cost == pytest.approx(requests * (10 * 1.0 + 5 * 2.0) / 1_000_000)
+
+    phases = {s["labels"]["phase"] for s in metrics["werewolf_game_phase_seconds"]["series"]}
+    assert phases <= {"night", "day", "vote"} and "night" in phases
+    assert sum(s["value"] for s in metrics["werewolf_games_total"]["series"]) == 1
+
+@pytest.mark.asyncio
+async def test_structured_log_dumps_metrics_at_game_end(tmp_path, monkeypatch):
+    """开启结构化日志时，游戏结束把指标快照写到日志旁的 JSON 文件"""
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(3)
+    game = GameController(api_controller=RuleBasedAgent(rng=rng), discussion_delay=0, structured_log=True,
+                          rng=rng, metrics=MetricsRegistry())
+    await game.initialize_game(PLAYER_NAMES)
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+
+    [path] = glob.glob("game_log_*.metrics.json")
+    with open(path, encoding="utf-8") as f:
+        dumped = json.load(f)
+    [finished] = dumped["werewolf_games_total"]["series"]
+    assert finished["labels"]["winning_team"] == game.game_state.get_game_result()["winning_team"]
+    assert finished["value"] == 1
+
+@pytest.mark.asyncio
+async def test_each_game_dumps_only_its_own_metrics(tmp_path, monkeypatch):
+    """同一进程里的多局共用上级注册表，但每局的指标文件只含本局的数据"""
+    monkeypatch.chdir(tmp_path)
+    registry = MetricsRegistry()
+    games = []
+    for seed in (3, 4):
+        rng = random.Random(seed)
+        game = GameController(api_controller=RuleBasedAgent(rng=rng), discussion_delay=0, structured_log=True,
+                              rng=rng, metrics=registry, game_id=f"game{seed}")
+        await game.initialize_game(PLAYER_NAMES)
+        while game.game_state.current_phase != GamePhase.GAME_OVER:
+            await game.next_phase()
+        games.append(game)
+
+    for path in glob.glob("game_log_*.metrics.json"):
+        with open(path, encoding="utf-8") as f:
+            dumped = json.load(f)
+        assert sum(s["value"] for s in dumped["werewolf_games_total"]["series"]) == 1
+    assert len(glob.glob("game_log_*.metrics.json")) == 2
+    assert sum(s["value"] for s in registry.to_dict()["werewolf_games_total"]["series"]) == 2
+    phases = sum(s["count"] for s in registry.to_dict()["werewolf_game_phase_seconds"]["series"])
+    assert phases == sum(s["count"] for game in games
+                         for s in game.metrics.to_dict()["werewolf_game_phase_seconds"]["series"])
+
+@pytest.mark.asyncio
+async def test_cached_responses_are_not_billed():
+    """缓存命中的响应不计入 token 用量和费用，只记在 cached_tokens 里"""
+    registry = MetricsRegistry()
+    async with StubLLMServer(delay=0) as server:
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), response_cache=ResponseCache(), metrics=registry,
+                            prices={"deepseek-chat": (1.0, 2.0)})
+        state = GameState()
+        for i, name in enumerate(["张三", "李四", "王五"]):
+            state.add_player(Player(i + 1, name, Role(RoleType.VILLAGER)))
+        await api.generate_vote(state.players[0], state)
+        await api.generate_vote(state.players[0], state)
+        assert len(server.requests) == 1
+
+    metrics = registry.to_dict()
+    tokens = {s["labels"]["kind"]: s for s in metrics["werewolf_llm_tokens"]["series"]}
+    assert tokens["prompt"]["count"] == 1
+    assert metrics["werewolf_llm_cost_total"]["series"][0]["value"] == pytest.approx((10 * 1.0 + 5 * 2.0) / 1_000_000)
+    cached = {s["labels"]["kind"]: s["value"] for s in metrics["werewolf_llm_cached_tokens_total"]["series"]}
+    assert cached == {"prompt": 10, "completion": 5}
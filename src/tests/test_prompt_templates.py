@@ -0,0 +1,39 @@
+from src.controllers.prompt_templates import ROLE_TEMPLATES, PrefixCacheTracker, clean_prompt
+from src.models.role import RoleType
+
+def test_clean_prompt_strips_source_indentation():
+    """去掉源码缩进，保留列表的相对缩进"""
+    text = """现在是第1天晚上。
+                  你需要选择一名玩家查验身份。
+
+                  可选择的目标：
+                  - 张三
+                     - 备注"""
+    assert clean_prompt(text) == "现在是第1天晚上。\n你需要选择一名玩家查验身份。\n\n可选择的目标：\n- 张三\n   - 备注"
+
+def test_role_templates_compiled_once():
+    """每个角色的系统提示词在加载时编译，规则在前、角色指南在后，没有源码缩进"""
+    assert set(ROLE_TEMPLATES) == set(RoleType)
+    rules_end = ROLE_TEMPLATES[RoleType.SEER].system.index("你的角色是")
+    for template in ROLE_TEMPLATES.values():
+        assert template.system[:rules_end] == ROLE_TEMPLATES[RoleType.SEER].system[:rules_end]
+        assert all(not line.startswith("    ") for line in template.system.split("\n"))
+
+def test_render_puts_volatile_parts_last():
+    """消息顺序：规则与角色指南、游戏进程、当前状态与决策指令"""
+    messages = ROLE_TEMPLATES[RoleType.VILLAGER].render("[第1天] 张三: 过。", "当前游戏状态: 第1天",
+                                                        "请投票\n        {\"type\": \"vote\"}")
+    assert [m["role"] for m in messages] == ["system", "user", "user"]
+    assert messages[1]["content"].endswith("[第1天] 张三: 过。")
+    assert messages[2]["content"] == "当前游戏状态: 第1天\n\n请投票\n{\"type\": \"vote\"}"
+
+def test_prefix_tracker_counts_shared_prefix():
+    """同一玩家连续两次请求共享的前缀计为命中"""
+    tracker = PrefixCacheTracker()
+    first = ROLE_TEMPLATES[RoleType.VILLAGER].render("历史一", "状态一", "指令")
+    second = ROLE_TEMPLATES[RoleType.VILLAGER].render("历史一\n历史二", "状态二", "指令")
+    assert tracker.observe(1, first) == 0
+    assert tracker.observe(1, second) > 0
+    assert tracker.observe(2, second) == 0  # 其他玩家单独计算
+    assert 0 < tracker.hit_ratio < 1
+    assert tracker.stats()["requests"] == 3
@@ -1,14 +1,40 @@
 import pytest
 import asyncio
 import os
+import random
 from dotenv import load_dotenv
+from ..controllers.api_controller import APIController
 from ..controllers.game_controller import GameController
+from ..controllers.transport import LiveTransport, RecordingTransport, ReplayTransport
 from ..models.game_state import GamePhase
 from ..models.role import RoleType
 
 # 加载环境变量
 load_dotenv()
 
+# 设置 R1_TRANSCRIPT 可以录制或重放整局游戏：
+#   R1_TRANSCRIPT_MODE=record  实时请求并把每次调用录制到 R1_TRANSCRIPT
+#   R1_TRANSCRIPT_MODE=replay  从 R1_TRANSCRIPT 重放，不访问网络；
+#                              同时设置 R1_LIVE_FROM_PHASE=N 时，从第 N 个阶段起改为实时请求
+# 录制和重放需要使用相同的 R1_SEED，保证角色分配一致
+TRANSCRIPT = os.getenv("R1_TRANSCRIPT")
+TRANSCRIPT_MODE = os.getenv("R1_TRANSCRIPT_MODE", "record")
+LIVE_FROM_PHASE = os.getenv("R1_LIVE_FROM_PHASE")
+SEED = int(os.getenv("R1_SEED", "0"))
+
+def make_api_controller() -> APIController:
+    """根据环境变量创建实时、录制或重放的 API 控制器"""
+    api_controller = APIController()
+    if not TRANSCRIPT:
+        return api_controller
+    if TRANSCRIPT_MODE == "replay":
+        live_from_phase = int(LIVE_FROM_PHASE) if LIVE_FROM_PHASE else None
+        live = api_controller.transport if live_from_phase is not None else None
+        api_controller.transport = ReplayTransport(TRANSCRIPT, live=live, live_from_phase=live_from_phase)
+    else:
+        api_controller.transport = RecordingTransport(api_controller.transport, TRANSCRIPT)
+    return api_controller
+
 @pytest.fixture
 def game():
     return GameController()
@@ -16,7 +42,11 @@ def game():
 @pytest.mark.asyncio
 async def test_r1_game():
     """测试使用 R1 模型的完整游戏流程"""
-    game = GameController()
+    if TRANSCRIPT:
+        random.seed(SEED)
+    api_controller = make_api_controller()
+    replaying = TRANSCRIPT and TRANSCRIPT_MODE == "replay"
+    game = GameController(api_controller=api_controller, discussion_delay=0 if replaying else 1.0)
     
     # 初始化游戏
     player_names = ["张三", "李四", "王五", "赵六", "钱七", "孙八", "周九", "吴十", "郑十一"]
@@ -29,9 +59,13 @@ async def test_r1_game():
         # 检查游戏是否结束
         game_over, _ = game.game_state.check_game_over()
     
+    stats = api_controller.prefix_cache_stats()
+    print(f"\n本局 {stats['requests']} 次请求，稳定前缀命中率约 {stats['prefix_hit_ratio']:.1%}")
+    
     # 关闭日志文件
     if game.game_output_file:
         game.game_output_file.close()
+    api_controller.transport.close()
 
 if __name__ == "__main__":
-    asyncio.run(test_r1_game()) 
\ No newline at end of file
+    asyncio.run(test_r1_game())
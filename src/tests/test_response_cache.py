@@ -0,0 +1,152 @@
+import threading
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.response_cache import CacheMode, ResponseCache
+from src.models.game_state import GameState
+from src.models.player import Player
+from src.models.role import Role, RoleType
+from src.tests.stub_llm_server import StubLLMServer
+
+def make_request(prompt: str) -> dict:
+    return {
+        "model": "deepseek-chat",
+        "messages": [{"role": "system", "content": "规则"}, {"role": "user", "content": prompt}],
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+
+def test_key_depends_on_every_field():
+    """模型、提示词和采样参数任一不同，缓存键都不同"""
+    base = make_request("投票")
+    assert ResponseCache.make_key(base) == ResponseCache.make_key(make_request("投票"))
+    assert ResponseCache.make_key(base) != ResponseCache.make_key(make_request("发言"))
+    assert ResponseCache.make_key(base) != ResponseCache.make_key(dict(base, temperature=0.0))
+    assert ResponseCache.make_key(base) != ResponseCache.make_key(dict(base, model="deepseek-r1"))
+
+def test_memory_lru_evicts_by_size():
+    """内存层按字节数淘汰最久未使用的条目"""
+    response = {"content": "x" * 100, "usage": {}}
+    cache = ResponseCache(max_memory_bytes=400)  # 每条约 130 字节，最多容纳 3 条
+    for i in range(3):
+        cache.put(make_request(str(i)), response)
+    cache.get(make_request("0"))  # 0 变为最近使用
+    cache.put(make_request("3"), response)
+
+    assert cache.get(make_request("1")) is None
+    assert cache.get(make_request("0")) == response
+    assert cache.stats()["evictions"] >= 1
+
+def test_disk_tier_survives_restart(tmp_path):
+    """SQLite 持久层在新的缓存实例中依然可以命中"""
+    db_path = str(tmp_path / "cache.db")
+    cache = ResponseCache(db_path=db_path)
+    cache.put(make_request("投票"), {"content": "{}", "usage": {}})
+    cache.close()
+
+    cache = ResponseCache(db_path=db_path)
+    assert cache.get(make_request("投票")) == {"content": "{}", "usage": {}}
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+def test_modes():
+    """record_only 只写不读，off 不读不写"""
+    recorder = ResponseCache(mode=CacheMode.RECORD_ONLY)
+    recorder.put(make_request("投票"), {"content": "{}"})
+    assert recorder.get(make_request("投票")) is None
+    assert recorder.stats()["writes"] == 1
+
+    off = ResponseCache(mode=CacheMode.OFF)
+    off.put(make_request("投票"), {"content": "{}"})
+    assert off.stats()["writes"] == 0
+
+@pytest.mark.asyncio
+async def test_api_controller_reads_through_cache():
+    """相同的请求第二次直接由缓存返回，不再请求服务端"""
+    async with StubLLMServer(delay=0) as server:
+        cache = ResponseCache()
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), response_cache=cache)
+        state = GameState()
+        for i, name in enumerate(["张三", "李四", "王五"]):
+            state.add_player(Player(i + 1, name, Role(RoleType.VILLAGER)))
+
+        first = await api.generate_vote(state.players[0], state)
+        second = await api.generate_vote(state.players[0], state)
+
+        assert first == second == 1
+        assert len(server.requests) == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+def test_disk_writes_are_batched(tmp_path):
+    """写入持久层的响应攒批提交；还没提交的响应被内存淘汰后仍能命中"""
+    db_path = str(tmp_path / "cache.db")
+    cache = ResponseCache(db_path=db_path, batch_size=3, max_memory_bytes=0)
+    reader = ResponseCache(db_path=db_path)
+    cache.put(make_request("0"), {"content": "0"})
+    cache.put(make_request("1"), {"content": "1"})
+    assert reader.get(make_request("0")) is None  # 还没提交
+    assert cache.get(make_request("0")) == {"content": "0"}
+    cache.put(make_request("2"), {"content": "2"})  # 满一批，在写线程中提交
+    cache._writing.result()
+    assert reader.get(make_request("0")) == {"content": "0"}
+    cache.put(make_request("3"), {"content": "3"})
+    cache.close()
+    assert reader.get(make_request("3")) == {"content": "3"}
+    reader.close()
+
+@pytest.mark.asyncio
+async def test_disk_writes_run_on_the_writer_thread(tmp_path):
+    """提交在写线程中进行，事件循环上的 put 和 flush_async 不做磁盘 I/O"""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"), batch_size=1)
+    threads = []
+    commit = cache._write_pending
+
+    def record():
+        threads.append(threading.current_thread())
+        commit()
+
+    cache._write_pending = record
+    cache.put(make_request("0"), {"content": "0"})
+    cache.put(make_request("1"), {"content": "1"})
+    await cache.flush_async()
+    assert threads and threading.main_thread() not in threads
+    cache.close()
+    reader = ResponseCache(db_path=str(tmp_path / "cache.db"))
+    assert reader.get(make_request("1")) == {"content": "1"}
+    reader.close()
+
+def test_disk_reads_do_not_wait_for_commits(tmp_path):
+    """写线程提交期间，get() 用自己的连接读取已提交的响应，不等待提交完成"""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"), batch_size=1, max_memory_bytes=0)
+    cache.put(make_request("0"), {"content": "0"})
+    cache.flush()
+    committing = threading.Event()
+    release = threading.Event()
+
+    class SlowCommit:
+        def __init__(self, db):
+            self.db = db
+
+        def __getattr__(self, name):
+            return getattr(self.db, name)
+
+        def commit(self):
+            committing.set()
+            release.wait(5)
+            self.db.commit()
+
+    cache._db = SlowCommit(cache._db)
+    cache.put(make_request("1"), {"content": "1"})
+    assert committing.wait(5)
+    results = []
+    reader = threading.Thread(target=lambda: results.append(cache.get(make_request("0"))))
+    reader.start()
+    reader.join(1)
+    finished = not reader.is_alive()
+    release.set()
+    reader.join()
+    assert finished and results == [{"content": "0"}]
+    cache._db = cache._db.db
+    cache.close()
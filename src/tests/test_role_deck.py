@@ -0,0 +1,151 @@
+import random
+import pytest
+from src.controllers.agent_backend import AgentBackend
+from src.controllers.api_controller import APIController
+from src.controllers.context_builder import estimate_tokens, format_id_ranges
+from src.controllers.game_controller import GameController
+from src.models.role import RoleType, build_roles, default_role_counts, parse_role_counts, validate_role_counts
+from src.simulation.headless import play_headless_game
+
+class ScriptedAgent(AgentBackend):
+    """按角色返回预先设定的夜晚行动，白天不发言、弃票"""
+
+    def __init__(self):
+        self.night: dict = {}
+
+    async def generate_night_action(self, player, game_state):
+        action = self.night.get(player.role.role_type, {})
+        return action(player) if callable(action) else action
+
+    async def generate_discussion(self, player, game_state):
+        return "过。"
+
+    async def generate_vote(self, player, game_state):
+        return -1
+
+async def scripted_game(role_counts) -> GameController:
+    game = GameController(api_controller=ScriptedAgent(), discussion_delay=0, headless=True,
+                          rng=random.Random(0), role_counts=role_counts)
+    await game.initialize_game([f"玩家{i}" for i in range(1, sum(role_counts.values()) + 1)])
+    return game
+
+def test_default_role_counts():
+    assert default_role_counts(9) == {RoleType.WEREWOLF: 3, RoleType.VILLAGER: 3, RoleType.SEER: 1,
+                                      RoleType.WITCH: 1, RoleType.HUNTER: 1}
+    assert [r.role_type for r in build_roles(default_role_counts(9))] == \
+           [RoleType.WEREWOLF] * 3 + [RoleType.VILLAGER] * 3 + [RoleType.SEER, RoleType.WITCH, RoleType.HUNTER]
+    for players in range(6, 120):
+        validate_role_counts(default_role_counts(players), players)
+    assert default_role_counts(50)[RoleType.SEER] == 4 and default_role_counts(50)[RoleType.GUARD] == 1
+    with pytest.raises(ValueError):
+        default_role_counts(5)
+
+def test_parse_and_validate_role_counts():
+    counts = parse_role_counts({"werewolf": 2, "狼人": 1, "seer": 2, "村民": 3})
+    assert counts == {RoleType.WEREWOLF: 3, RoleType.VILLAGER: 3, RoleType.SEER: 2}
+    validate_role_counts(counts, 8)
+    with pytest.raises(ValueError):
+        parse_role_counts({"vampire": 1})
+    with pytest.raises(ValueError):
+        validate_role_counts(counts, 9)
+    with pytest.raises(ValueError):
+        validate_role_counts({RoleType.WEREWOLF: 3, RoleType.VILLAGER: 3}, 6)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["heuristic", "random"])
+async def test_large_lobby_games_finish(policy):
+    game = await play_headless_game([f"玩家{i}" for i in range(1, 51)], policy=policy, seed=7)
+    result = game.game_state.get_game_result()
+    assert result["game_over"] and result["winning_team"] in ("villagers", "werewolves")
+    assert len(game.game_state.get_players_by_role(RoleType.SEER)) == 4
+
+@pytest.mark.asyncio
+async def test_guard_blocks_kill_but_not_twice_in_a_row():
+    game = await scripted_game({RoleType.WEREWOLF: 2, RoleType.VILLAGER: 4, RoleType.GUARD: 1})
+    target = game.game_state.get_players_by_role(RoleType.VILLAGER)[0]
+    agent = game.api_controller
+    agent.night[RoleType.WEREWOLF] = {"werewolf_kill": {"target_id": target.id}}
+    agent.night[RoleType.GUARD] = {"guard_protect": {"target_id": target.id}}
+
+    await game.next_phase()  # 第一夜
+    assert target.is_alive
+    assert game.game_state.get_last_night_dead_players() == []
+
+    await game.next_phase()  # 白天
+    await game.next_phase()  # 投票（全部弃票）
+    await game.next_phase()  # 第二夜
+    assert game.game_state.round_number == 1
+    assert not target.is_alive  # 不能连续两晚守护同一人
+
+@pytest.mark.asyncio
+async def test_multiple_witches_use_one_potion_of_each_kind_per_night():
+    game = await scripted_game({RoleType.WEREWOLF: 2, RoleType.VILLAGER: 4, RoleType.WITCH: 2})
+    villagers = game.game_state.get_players_by_role(RoleType.VILLAGER)
+    first, second = game.game_state.get_players_by_role(RoleType.WITCH)
+    agent = game.api_controller
+    agent.night[RoleType.WEREWOLF] = {"werewolf_kill": {"target_id": villagers[0].id}}
+    agent.night[RoleType.WITCH] = lambda witch: {
+        "witch_save": {"used": True},
+        "witch_poison": {"target_id": villagers[1].id if witch is first else villagers[2].id}
+    }
+
+    await game.run_night_phase()
+    assert villagers[0].is_alive
+    assert not villagers[1].is_alive and villagers[2].is_alive
+    assert game.game_state.get_witch_potions(first.id) == {"save": False, "poison": False}
+    assert game.game_state.get_witch_potions(second.id) == {"save": True, "poison": True}
+
+@pytest.mark.asyncio
+async def test_every_seer_checks_each_night():
+    game = await scripted_game({RoleType.WEREWOLF: 2, RoleType.VILLAGER: 3, RoleType.SEER: 2})
+    wolf = game.game_state.get_players_by_role(RoleType.WEREWOLF)[0]
+    game.api_controller.night[RoleType.SEER] = {"seer_check": {"target_id": wolf.id}}
+
+    await game.run_night_phase()
+    for seer in game.game_state.get_players_by_role(RoleType.SEER):
+        assert game.game_state.get_checked_players(seer.id) == [wolf.name]
+        assert game.game_state.get_last_check_result(seer.id)["player"] is wolf
+
+@pytest.mark.asyncio
+async def test_prompt_size_is_bounded_by_budget():
+    """候选名单在预算内时格式不变，人数很多时压缩成 ID 区间，提示词大小不再随人数增长"""
+    api = APIController(show_progress=False)
+    sizes = {}
+    for players in (9, 400, 800):
+        game = await scripted_game(default_role_counts(players))
+        state = game.game_state
+        wolf = state.get_players_by_role(RoleType.WEREWOLF)[0]
+        prompt = api._build_vote_prompt(state)
+        context = api._build_game_context(state, wolf, prompt)
+        sizes[players] = estimate_tokens(context.text) + estimate_tokens(prompt)
+        if players == 9:
+            assert "- 玩家1 (ID: 1)\n" in prompt
+        else:
+            assert f"玩家ID: 1-{players}" in prompt
+    assert sizes[800] <= sizes[400] + 20
+    assert sizes[800] <= 6 * api.context_builder.max_list_tokens
+
+@pytest.mark.asyncio
+async def test_action_targets_are_never_truncated():
+    """人数很多时每名候选玩家都留在行动提示词里（包括 ID 最大的玩家）"""
+    api = APIController(show_progress=False)
+    game = await scripted_game(default_role_counts(400))
+    state = game.game_state
+    wolf = state.get_players_by_role(RoleType.WEREWOLF)[0]
+    prompt = api._build_werewolf_prompt(state, wolf)
+    line = next(line.strip() for line in prompt.splitlines() if line.strip().startswith("玩家ID:"))
+    listed = set()
+    for part in line[len("玩家ID:"):].split(","):
+        first, _, last = part.strip().partition("-")
+        listed.update(range(int(first), int(last or first) + 1))
+    assert listed == {p.id for p in state.get_alive_players() if p.id not in state._werewolves}
+    assert format_id_ranges([1, 2, 3, 5, 7, 8]) == "1-3, 5, 7-8"
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["heuristic", "random"])
+async def test_vectorized_engine_matches_game_controller_on_custom_deck(policy):
+    pytest.importorskip("numpy")
+    from src.simulation.vectorized import cross_check, deck_from_counts
+    deck = deck_from_counts({RoleType.WEREWOLF: 4, RoleType.VILLAGER: 4, RoleType.SEER: 2, RoleType.WITCH: 2,
+                             RoleType.HUNTER: 1, RoleType.GUARD: 1})
+    assert await cross_check(150, policy, seed=2, deck=deck) == []
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.server.game_manager import GameManager, GameQueueFullError, GameSession
+from src.server.http_server import GameServer
+from src.simulation.headless import run_headless_game
+from src.tests.stub_llm_server import StubLLMServer
+
+async def request(base_url: str, method: str, path: str, body=None):
+    """发送一个 HTTP 请求，返回 (状态码, 响应头, 解析后的响应体)"""
+    host, port = base_url.split("//")[1].split(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(data)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {k.lower(): v.strip() for k, v in (line.split(":", 1) for line in lines[1:])}
+    if headers["content-type"].startswith("application/json"):
+        return status, headers, json.loads(payload)
+    return status, headers, payload.decode()
+
+def llm_manager(server: StubLLMServer, **kwargs) -> GameManager:
+    fast = RateLimit(requests_per_second=1000, burst=1000, max_concurrency=256)
+    limits = RateLimiterRegistry({"deepseek-chat": fast, "deepseek-r1": fast})
+    pool = ClientPool(max_connections=256)
+
+    def backend(agent, model, rng):
+        if agent != "llm":
+            return RuleBasedAgent(agent, rng)
+        return APIController(model_name=model or "deepseek-chat", base_url=server.base_url, api_key="test",
+                             client_pool=pool, rate_limiter=limits, show_progress=False)
+    return GameManager(backend_factory=backend, **kwargs)
+
+@pytest.mark.asyncio
+async def test_many_games_run_concurrently_and_match_headless_results():
+    """50 局同时托管在一个事件循环上，每局的结果与单独运行相同种子的对局一致"""
+    manager = GameManager(max_active_games=8)
+    async with GameServer(manager, port=0) as server:
+        ids = []
+        for seed in range(50):
+            status, headers, game = await request(server.base_url, "POST", "/games",
+                                                  {"agent": "heuristic", "seed": seed})
+            assert status == 201 and headers["location"] == f"/games/{game['id']}"
+            ids.append(game["id"])
+        await asyncio.gather(*(manager.wait(game_id) for game_id in ids))
+
+        status, _, listing = await request(server.base_url, "GET", "/games")
+        assert status == 200 and listing["by_status"] == {"finished": 50}
+        assert listing["active"] == 0 and listing["queued"] == 0
+        for seed, game_id in enumerate(ids):
+            _, _, game = await request(server.base_url, "GET", f"/games/{game_id}")
+            assert game["result"] == await run_headless_game(seed=seed)
+
+@pytest.mark.asyncio
+async def test_queue_limit_returns_503():
+    """同时进行和排队的对局都满了之后，新建对局返回 503 和 Retry-After"""
+    async with StubLLMServer(delay=0.05) as llm:
+        manager = llm_manager(llm, max_active_games=1, max_queued_games=1)
+        async with GameServer(manager, port=0) as server:
+            first = (await request(server.base_url, "POST", "/games", {"seed": 1}))[2]
+            second = (await request(server.base_url, "POST", "/games", {"seed": 2}))[2]
+            await asyncio.sleep(0.01)
+            status, headers, body = await request(server.base_url, "POST", "/games", {"seed": 3})
+            assert status == 503 and headers["retry-after"] == "5"
+            assert manager.get(first["id"]).status == GameSession.RUNNING
+            assert manager.get(second["id"]).status == GameSession.QUEUED
+
+            status, _, cancelled = await request(server.base_url, "DELETE", f"/games/{second['id']}")
+            assert status == 200 and cancelled["cancelled"] and cancelled["status"] == "cancelled"
+            assert manager.queued_games == 0
+            status, _, _ = await request(server.base_url, "POST", "/games", {"seed": 3})
+            assert status == 201
+
+@pytest.mark.asyncio
+async def test_llm_games_are_isolated(tmp_path):
+    """每局有自己的 APIController（模型选择、玩家 session）和日志文件"""
+    async with StubLLMServer(delay=0) as llm:
+        manager = llm_manager(llm, max_active_games=4, log_dir=str(tmp_path))
+        chat = manager.create_game(seed=1)
+        other = manager.create_game(seed=1, model="deepseek-r1")
+        assert chat.controller.api_controller is not other.controller.api_controller
+        await asyncio.gather(manager.wait(chat.id), manager.wait(other.id))
+
+    assert chat.status == other.status == GameSession.FINISHED
+    assert chat.controller.api_controller.model_name == "deepseek-chat"
+    assert other.controller.api_controller.model_name == "deepseek-r1"
+    assert {request["model"] for request in llm.requests} == {"deepseek-chat", "deepseek-r1"}
+    logs = sorted(path.name for path in tmp_path.glob("game_log_*.txt"))
+    assert len(logs) == 2 and logs[0].endswith(f"_{chat.id}.txt") != logs[1].endswith(f"_{chat.id}.txt")
+
+@pytest.mark.asyncio
+async def test_events_endpoint_reads_from_cursor():
+    manager = GameManager()
+    async with GameServer(manager, port=0) as server:
+        game = (await request(server.base_url, "POST", "/games", {"agent": "random", "seed": 4}))[2]
+        await manager.wait(game["id"])
+
+        _, _, public = await request(server.base_url, "GET", f"/games/{game['id']}/events")
+        assert public["events"] and all(event["public"] for event in public["events"])
+        assert [event["seq"] for event in public["events"]] == sorted(event["seq"] for event in public["events"])
+        _, _, rest = await request(server.base_url, "GET", f"/games/{game['id']}/events?cursor={public['cursor']}")
+        assert rest == {"events": [], "cursor": public["cursor"]}
+
+        seer = next(p for p in manager.get(game["id"]).controller.game_state.players
+                    if p.role.role_type.value == "预言家")
+        _, _, private = await request(server.base_url, "GET",
+                                      f"/games/{game['id']}/events?player_id={seer.id}")
+        assert len(private["events"]) > len(public["events"])
+
+        assert (await request(server.base_url, "GET", "/games/missing"))[0] == 404
+        assert (await request(server.base_url, "GET", f"/games/{game['id']}/events?cursor=x"))[0] == 400
+        assert (await request(server.base_url, "POST", "/games", {"agent": "nobody"}))[0] == 400
+        status, _, metrics = await request(server.base_url, "GET", "/metrics")
+        assert status == 200 and "werewolf_game_phase_seconds_bucket" in metrics
+
+def test_create_game_rejects_when_queue_is_full():
+    async def scenario():
+        manager = GameManager(max_active_games=1, max_queued_games=2)
+        manager.create_game(agent="heuristic")
+        manager.create_game(agent="heuristic")
+        with pytest.raises(GameQueueFullError):
+            manager.create_game(agent="heuristic")
+        await manager.shutdown()
+        assert manager.queued_games == 0
+        assert {s.status for s in manager.list()} == {GameSession.CANCELLED}
+    asyncio.run(scenario())
+
+@pytest.mark.asyncio
+async def test_bad_content_length_is_rejected():
+    """Content-Length 不是非负整数时返回 400，超过上限时返回 413，服务继续处理其他连接"""
+    async with GameServer(GameManager(), port=0) as server:
+        host, port = server.base_url.split("//")[1].split(":")
+        for length, expected in (("abc", 400), ("-5", 400), ("1e3", 400), (str(10 ** 9), 413)):
+            reader, writer = await asyncio.open_connection(host, int(port))
+            writer.write(f"POST /games HTTP/1.1\r\nHost: {host}\r\nContent-Length: {length}\r\n\r\n".encode())
+            await writer.drain()
+            raw = await reader.read()
+            writer.close()
+            assert int(raw.split(b" ")[1]) == expected
+        assert (await request(server.base_url, "GET", "/healthz"))[0] == 200
+
+@pytest.mark.asyncio
+async def test_private_events_need_the_player_token_until_game_over():
+    manager = GameManager(discussion_delay=0.01)
+    async with GameServer(manager, port=0, admin_token="admin-secret") as server:
+        status, _, game = await request(server.base_url, "POST", "/games", {"agent": "random", "seed": 4})
+        assert status == 201 and [p["id"] for p in game["player_tokens"]] == list(range(1, 10))
+        assert "player_tokens" not in (await request(server.base_url, "GET", f"/games/{game['id']}"))[2]
+        first, second = game["player_tokens"][:2]
+
+        path = f"/games/{game['id']}/events?player_id={first['id']}"
+        assert (await request(server.base_url, "GET", path))[0] == 401
+        assert (await request(server.base_url, "GET", f"{path}&token={second['token']}"))[0] == 403
+        assert (await request(server.base_url, "GET", f"{path}&token={first['token']}"))[0] == 200
+        assert (await request(server.base_url, "GET", f"{path}&token=admin-secret"))[0] == 200
+        assert (await request(server.base_url, "GET", f"/games/{game['id']}/events"))[0] == 200
+
+        await manager.wait(game["id"])
+        assert (await request(server.base_url, "GET", path))[0] == 200  # 结束后公开
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import random
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.game_controller import GameController
+from src.controllers.metrics import MetricsRegistry
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.controllers.tracing import Tracer, span
+from src.models.game_state import GamePhase
+from src.tests.stub_llm_server import StubLLMServer
+
+PLAYER_NAMES = ["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"]
+
+async def play(game: GameController) -> GameController:
+    await game.initialize_game(PLAYER_NAMES)
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+    return game
+
+def by_name(tracer: Tracer, name: str):
+    return [s for s in tracer.spans if s.name == name]
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks():
+    """子任务里的 span 挂在创建任务时的当前 span 下；没有追踪时 span() 什么也不做"""
+    tracer = Tracer()
+
+    async def child(i: int):
+        with span("child", index=i):
+            await asyncio.sleep(0)
+
+    with tracer.span("root") as root:
+        await asyncio.gather(child(1), child(2))
+    with span("untraced") as nothing:
+        assert nothing is None
+
+    children = by_name(tracer, "child")
+    assert len(children) == 2 and len(tracer.spans) == 3
+    assert all(c.parent is root and c.trace_id == root.trace_id for c in children)
+    assert children[0].lane != children[1].lane != root.lane
+
+    otlp = tracer.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root_record = next(s for s in otlp if s["name"] == "root")
+    assert "parentSpanId" not in root_record
+    assert {s["parentSpanId"] for s in otlp if s["name"] == "child"} == {root_record["spanId"]}
+    assert {"key": "index", "value": {"intValue": "1"}} in otlp[0]["attributes"] + otlp[1]["attributes"]
+
+def test_exception_marks_span_as_error():
+    tracer = Tracer()
+    with pytest.raises(KeyError):
+        with tracer.span("failing"):
+            raise KeyError("x")
+    [failed] = tracer.spans
+    assert failed.error.startswith("KeyError")
+    assert tracer.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["status"]["code"] == 2
+
+@pytest.mark.asyncio
+async def test_game_trace_covers_phases_actions_and_delays(tmp_path, monkeypatch):
+    """一局游戏的追踪：game -> 阶段 -> 角色行动 / 讨论 -> 每次决策，讨论停顿单独成 span"""
+    monkeypatch.chdir(tmp_path)
+    tracer = Tracer()
+    rng = random.Random(5)
+    game = await play(GameController(api_controller=RuleBasedAgent(rng=rng), discussion_delay=0.001, rng=rng,
+                                     structured_log=True, metrics=MetricsRegistry(), tracer=tracer,
+                                     decision_concurrency=3))
+
+    [root] = by_name(tracer, "game")
+    assert root.attributes["winning_team"] == game.game_state.get_game_result()["winning_team"]
+    phases = [s for s in tracer.spans if s.name.startswith("run_") and s.name.endswith("_phase")]
+    assert phases and all(s.parent is root for s in phases)
+    assert {s.parent.name for s in by_name(tracer, "_run_werewolf_action")} == {"run_night_phase"}
+    assert {s.parent.name for s in by_name(tracer, "run_discussion")} == {"run_day_phase"}
+    assert {s.parent.name for s in by_name(tracer, "generate_vote")} == {"run_vote_phase"}
+    assert {s.parent.name for s in by_name(tracer, "discussion_delay")} == {"run_discussion"}
+    speeches = [s for s in by_name(tracer, "generate_discussion") if s.parent.name == "run_discussion"]
+    assert len(by_name(tracer, "discussion_delay")) == len(speeches)
+
+    with open(next(tmp_path.glob("game_log_*.trace.json")), encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(tracer.spans)
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+@pytest.mark.asyncio
+async def test_llm_requests_are_children_of_calls(tmp_path, monkeypatch):
+    """每次 LLM 调用一个 llm_call span，其下每次请求（含重试）一个 llm_request span"""
+    monkeypatch.chdir(tmp_path)
+    tracer = Tracer()
+    limits = RateLimiterRegistry({"deepseek-chat": RateLimit(requests_per_second=1000, burst=1000, max_concurrency=16)})
+    async with StubLLMServer(delay=0) as server:
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), rate_limiter=limits, metrics=MetricsRegistry())
+        random.seed(7)
+        await play(GameController(api_controller=api, discussion_delay=0, metrics=MetricsRegistry(), tracer=tracer))
+        requests = len(server.requests)
+
+    calls = by_name(tracer, "llm_call")
+    request_spans = by_name(tracer, "llm_request")
+    assert len(request_spans) == requests
+    assert all(s.parent.name == "llm_call" for s in request_spans)
+    assert all(s.attributes["usage.prompt_tokens"] == 10 for s in request_spans)
+    assert all(c.attributes["outcome"] in ("ok", "fallback") for c in calls)
+    assert {c.parent.name for c in calls} <= {"generate_night_action", "generate_discussion", "generate_vote"}
+
+def test_tracer_keeps_only_the_latest_spans():
+    tracer = Tracer(max_spans=3)
+    for i in range(5):
+        with tracer.span(f"s{i}"):
+            pass
+    assert [s.name for s in tracer.spans] == ["s2", "s3", "s4"] and tracer.dropped == 2
+    assert len(tracer.to_chrome_trace()["traceEvents"]) == 3
+
+@pytest.mark.asyncio
+async def test_failed_phase_ends_the_game_span():
+    class BrokenAgent(RuleBasedAgent):
+        async def generate_vote(self, player, game_state):
+            raise RuntimeError("后端故障")
+
+    tracer = Tracer()
+    rng = random.Random(1)
+    game = GameController(api_controller=BrokenAgent(rng=rng), discussion_delay=0, headless=True, rng=rng,
+                          metrics=MetricsRegistry(), tracer=tracer)
+    with pytest.raises(RuntimeError):
+        await play(game)
+    [root] = by_name(tracer, "game")
+    assert root.end_ns is not None and root.error.startswith("RuntimeError")
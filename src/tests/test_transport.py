@@ -0,0 +1,94 @@
+import random
+import time
+import pytest
+from src.controllers.api_controller import APIController
+from src.controllers.client_pool import ClientPool
+from src.controllers.game_controller import GameController
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.controllers.transport import LiveTransport, RecordingTransport, ReplayTransport, TranscriptMismatchError
+from src.models.game_state import GamePhase, GameState
+from src.tests.stub_llm_server import StubLLMServer
+
+PLAYER_NAMES = ["村民1", "村民2", "村民3", "狼人1", "狼人2", "狼人3", "预言家", "女巫", "猎人"]
+FAST_LIMITS = RateLimiterRegistry({"deepseek-chat": RateLimit(requests_per_second=1000, burst=1000, max_concurrency=16)})
+
+async def play(api: APIController, names=PLAYER_NAMES, seed: int = 7) -> GameController:
+    """用固定种子跑完一整局游戏"""
+    random.seed(seed)
+    game = GameController(api_controller=api, discussion_delay=0)
+    await game.initialize_game(names)
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        await game.next_phase()
+    return game
+
+def live_api(server: StubLLMServer, transport=None) -> APIController:
+    return APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                         client_pool=ClientPool(), rate_limiter=FAST_LIMITS, transport=transport)
+
+@pytest.mark.asyncio
+async def test_record_then_replay_full_game(tmp_path, monkeypatch):
+    """录制一局完整游戏，再不经网络地重放出完全相同的结果"""
+    monkeypatch.chdir(tmp_path)
+    transcript = str(tmp_path / "game.jsonl")
+    async with StubLLMServer(delay=0) as server:
+        recorder = RecordingTransport(LiveTransport(FAST_LIMITS), transcript)
+        recorded = await play(live_api(server, recorder))
+        recorder.close()
+        recorded_calls = len(server.requests)
+
+    replay = ReplayTransport(transcript)
+    api = APIController(model_name="deepseek-chat", api_key="test", transport=replay)
+    start = time.perf_counter()
+    replayed = await play(api)
+    elapsed = time.perf_counter() - start
+
+    assert replayed.game_state.get_game_result() == recorded.game_state.get_game_result()
+    assert replay.replayed == recorded_calls
+    assert replay.remaining() == []
+    assert elapsed < 2
+
+@pytest.mark.asyncio
+async def test_replay_fails_loudly_on_mismatch(tmp_path, monkeypatch):
+    """提示词与录制不一致时重放直接报错，而不是悄悄返回空决策"""
+    monkeypatch.chdir(tmp_path)
+    transcript = str(tmp_path / "game.jsonl")
+    async with StubLLMServer(delay=0) as server:
+        recorder = RecordingTransport(LiveTransport(FAST_LIMITS), transcript)
+        await play(live_api(server, recorder))
+        recorder.close()
+
+    api = APIController(model_name="deepseek-chat", api_key="test", transport=ReplayTransport(transcript))
+    with pytest.raises(TranscriptMismatchError):
+        await play(api, names=[name + "X" for name in PLAYER_NAMES])
+
+@pytest.mark.asyncio
+async def test_replay_then_go_live(tmp_path, monkeypatch):
+    """重放前两个阶段，之后改为实时请求"""
+    monkeypatch.chdir(tmp_path)
+    transcript = str(tmp_path / "game.jsonl")
+    async with StubLLMServer(delay=0) as server:
+        recorder = RecordingTransport(LiveTransport(FAST_LIMITS), transcript)
+        recorded = await play(live_api(server, recorder))
+        recorder.close()
+        recorded_calls = len(server.requests)
+
+    async with StubLLMServer(delay=0) as server:
+        replay = ReplayTransport(transcript, live=LiveTransport(FAST_LIMITS), live_from_phase=2)
+        resumed = await play(live_api(server, replay))
+
+        assert replay.replayed > 0
+        assert replay.replayed + len(server.requests) == recorded_calls
+        assert resumed.game_state.get_game_result() == recorded.game_state.get_game_result()
+
+def test_game_over_has_its_own_phase_index():
+    """游戏结束的阶段序号大于本局所有阶段，也不会与下一回合的夜晚重合"""
+    state = GameState()
+    state.round_number = 2
+    indexes = {}
+    for phase in GamePhase:
+        state.current_phase = phase
+        indexes[phase] = state.phase_index
+    assert indexes[GamePhase.GAME_OVER] > max(indexes[GamePhase.NIGHT], indexes[GamePhase.DAY], indexes[GamePhase.VOTE])
+    state.round_number = 3
+    state.current_phase = GamePhase.NIGHT
+    assert state.phase_index > indexes[GamePhase.GAME_OVER]
@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.simulation.headless import run_headless_games
+from src.simulation.vectorized import DEFAULT_DECK, HeuristicPolicy, VectorizedEngine, choose, cross_check, simulate
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["heuristic", "random"])
+async def test_engine_matches_game_controller_on_replayed_games(policy):
+    """向量化引擎记录下的每一局，交给 GameController / GameState 重放后逐阶段完全一致"""
+    assert await cross_check(300, policy, seed=5) == []
+
+def test_finished_games_obey_win_conditions():
+    engine = VectorizedEngine(HeuristicPolicy(), seed=1)
+    games = engine.run(20000)
+    wolves = (games.alive & games.wolf).sum(1)
+    good = (games.alive & ~games.wolf).sum(1)
+    assert (games.winner != 0).all()
+    assert ((games.winner == 2) == (wolves >= good)).all()
+    assert ((games.winner == 1) == (wolves == 0)).all()
+    assert (np.sort(games.roles, 1) == np.sort(DEFAULT_DECK)).all()
+
+@pytest.mark.asyncio
+async def test_win_rates_match_headless_simulation():
+    """同一策略下，向量化引擎与逐局模拟的胜率一致（在统计误差范围内）"""
+    results = await run_headless_games(600, seed=0)
+    headless = sum(r["winning_team"] == "villagers" for r in results) / len(results)
+    totals = simulate(100_000, seed=0)
+    vectorized = totals["wins"]["villagers"] / totals["games"]
+    assert abs(vectorized - headless) < 0.04
+    assert simulate(1000, seed=3) == simulate(1000, seed=3)
+
+def test_choose_is_uniform_over_candidates():
+    rng = np.random.default_rng(0)
+    mask = np.zeros((60000, 9), dtype=bool)
+    mask[:, [1, 4, 8]] = True
+    mask[:10] = False
+    picked = choose(mask, rng)
+    assert (picked[:10] == -1).all()
+    counts = np.bincount(picked[10:], minlength=9)
+    assert counts[[0, 2, 3, 5, 6, 7]].sum() == 0
+    assert abs(counts[[1, 4, 8]] / 59990 - 1 / 3).max() < 0.01
@@ -0,0 +1,120 @@
+import random
+import pytest
+from src.controllers.api_controller import APIController, extract_json
+from src.controllers.client_pool import ClientPool
+from src.controllers.game_controller import GameController
+from src.controllers.rate_limit import RateLimit, RateLimiterRegistry
+from src.controllers.rule_based_agent import RuleBasedAgent
+from src.models.game_state import GamePhase
+from src.models.role import RoleType
+from src.benchmarks.werewolf_mode import CallCounter
+from src.simulation.headless import DEFAULT_PLAYER_NAMES
+from src.tests.mock_api_controller import MockAPIController
+from src.tests.stub_llm_server import StubLLMServer
+
+FAST_LIMITS = RateLimiterRegistry({"deepseek-chat": RateLimit(requests_per_second=1000, burst=1000, max_concurrency=16)})
+
+async def play(backend, mode: str, seed: int = 3) -> GameController:
+    rng = random.Random(seed)
+    game = GameController(api_controller=backend, discussion_delay=0, headless=True, rng=rng, werewolf_mode=mode)
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    while game.game_state.current_phase != GamePhase.GAME_OVER and game.game_state.round_number < 20:
+        await game.next_phase()
+    return game
+
+def test_extract_json_handles_nested_objects():
+    text = '思考完毕 {"a": 1} 结论：{"type": "team_kill", "discussion": [{"wolf_id": 2, "argument": "刀5"}], "target_id": 5}'
+    assert extract_json(text).startswith('{"type": "team_kill"')
+    assert extract_json('{"type": "vote", "target_id": 2}') == '{"type": "vote", "target_id": 2}'
+    assert extract_json("没有JSON") is None
+
+@pytest.mark.asyncio
+async def test_joint_mode_makes_one_wolf_decision_per_night():
+    rng = random.Random(3)
+    counter = CallCounter(RuleBasedAgent("heuristic", rng))
+    game = GameController(api_controller=counter, discussion_delay=0, headless=True, rng=rng, werewolf_mode="joint")
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    nights = 0
+    while game.game_state.current_phase != GamePhase.GAME_OVER:
+        nights += game.game_state.current_phase == GamePhase.NIGHT
+        await game.next_phase()
+    assert counter.wolf_calls == 0
+    assert counter.team_calls == nights
+
+@pytest.mark.asyncio
+async def test_joint_mode_falls_back_when_backend_has_no_team_decision():
+    """后端不支持联合决策时退回每匹狼各自决策（Mock 总是刀 1 号）"""
+    counter = CallCounter(MockAPIController())
+    game = GameController(api_controller=counter, discussion_delay=0, headless=True, rng=random.Random(0),
+                          werewolf_mode="joint")
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    await game.next_phase()
+    assert counter.team_calls == 1 and counter.team_fallbacks == 1
+    assert counter.wolf_calls == 3
+    if game.game_state.get_player_by_id(1).role.role_type != RoleType.WEREWOLF:
+        assert game.game_state._last_night_killed == 1
+
+def test_unknown_werewolf_mode_is_rejected():
+    with pytest.raises(ValueError):
+        GameController(api_controller=MockAPIController(), headless=True, werewolf_mode="council")
+
+@pytest.mark.asyncio
+async def test_team_action_is_parsed_and_validated():
+    game = GameController(api_controller=MockAPIController(), headless=True, rng=random.Random(0))
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    state = game.game_state
+    api = APIController(show_progress=False)
+    wolves = state.get_players_by_role(RoleType.WEREWOLF)
+    good = next(p for p in state.players if p.role.role_type != RoleType.WEREWOLF)
+    response = ('{"type": "team_kill", "discussion": [{"wolf_id": %d, "argument": " 刀他 "}, '
+                '{"wolf_id": 999, "argument": "冒充的狼"}], "target_id": %d}' % (wolves[0].id, good.id))
+    action = api._parse_werewolf_team_action(response, wolves, state)
+    assert action == {"discussion": [{"wolf_id": wolves[0].id, "argument": "刀他"}],
+                      "werewolf_kill": {"target_id": good.id}}
+    teammate = '{"type": "team_kill", "discussion": [], "target_id": %d}' % wolves[1].id
+    assert api._parse_werewolf_team_action(teammate, wolves, state) == {}
+    assert api._parse_werewolf_team_action("{}", wolves, state) == {}
+
+@pytest.mark.asyncio
+async def test_malformed_team_action_does_not_break_the_night():
+    """discussion 为 null 或不是列表时只采用目标；布尔值不能当作玩家 ID；格式不对的发言被跳过"""
+    game = GameController(api_controller=MockAPIController(), headless=True, rng=random.Random(0))
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    state = game.game_state
+    api = APIController(show_progress=False)
+    wolves = state.get_players_by_role(RoleType.WEREWOLF)
+    good = next(p for p in state.players if p.role.role_type != RoleType.WEREWOLF)
+    for discussion in ("null", '"刀他"', '{"wolf_id": 1}'):
+        response = '{"type": "team_kill", "discussion": %s, "target_id": %d}' % (discussion, good.id)
+        assert api._parse_werewolf_team_action(response, wolves, state) == \
+               {"discussion": [], "werewolf_kill": {"target_id": good.id}}
+    assert api._parse_werewolf_team_action('{"type": "team_kill", "target_id": true}', wolves, state) == {}
+
+    class SloppyBackend(MockAPIController):
+        async def generate_werewolf_team_action(self, werewolves, game_state):
+            return {"discussion": [None, {"argument": "没有ID"}, {"wolf_id": good.id, "argument": "冒充"},
+                                   {"wolf_id": werewolves[0].id}, {"wolf_id": werewolves[0].id, "argument": "刀他"}],
+                    "werewolf_kill": {"target_id": good.id}}
+
+    game = GameController(api_controller=SloppyBackend(), discussion_delay=0, headless=True, rng=random.Random(0),
+                          werewolf_mode="joint")
+    await game.initialize_game(DEFAULT_PLAYER_NAMES)
+    good = next(p for p in game.game_state.players if p.role.role_type != RoleType.WEREWOLF)
+    await game.run_night_phase()
+    assert game.game_state._last_night_killed == good.id
+
+@pytest.mark.asyncio
+async def test_joint_mode_sends_one_request_per_night(tmp_path, monkeypatch):
+    """LLM 后端的联合决策：每晚只有一次狼人请求，不再有逐匹狼的击杀请求"""
+    monkeypatch.chdir(tmp_path)
+    async with StubLLMServer(delay=0) as server:
+        api = APIController(model_name="deepseek-chat", base_url=server.base_url, api_key="test",
+                            client_pool=ClientPool(), rate_limiter=FAST_LIMITS, show_progress=False)
+        game = await play(api, "joint")
+        prompts = [request["messages"][-1]["content"] for request in server.requests]
+
+    nights = game.game_state.round_number + 1
+    team_requests = sum('"type": "team_kill"' in prompt for prompt in prompts)
+    assert not any('"type": "kill"' in prompt for prompt in prompts)
+    assert nights - 1 <= team_requests <= nights
+    assert game.game_state.current_phase == GamePhase.GAME_OVER